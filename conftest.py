@@ -0,0 +1,41 @@
+# conftest.py
+"""
+Shared fixtures: the sample register as the app loads it, and a copy with gaps.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Tests never read or write the on-disk plan cache
+os.environ.setdefault("ROBO_PLAN_CACHE", "0")
+
+from src.indexes import build_index
+from src.register import apply_schema, load_register, source_dtypes
+
+SAMPLE_REGISTER = "data/Risk_Register__100_Rows.csv"
+# Columns blanked on every seventh row of `register_with_gaps`, one per column type
+GAP_COLUMNS = [
+    "Contract:Region", "Status", "Risk Owner", "Risk Type - Reputational", "Probability - Post Mitigation - Likelihood",
+    "Date Raised", "By When", "Impact (£) - Expected", "Description of Risk/Opportunity", "Control Measure / Mitigation",
+]
+
+
+@pytest.fixture(scope="session")
+def register() -> pd.DataFrame:
+    return load_register(SAMPLE_REGISTER, use_cache=False)
+
+
+@pytest.fixture(scope="session")
+def register_with_gaps() -> pd.DataFrame:
+    raw = pd.read_csv(SAMPLE_REGISTER, dtype=source_dtypes())
+    gaps = np.arange(len(raw)) % 7 == 3
+    for column in GAP_COLUMNS:
+        raw[column] = raw[column].astype(object)
+        raw.loc[gaps, column] = None
+    df = apply_schema(raw)
+    df.index = pd.RangeIndex(1, len(df) + 1)
+    build_index(df)
+    return df
@@ -0,0 +1,365 @@
+# analytics.py
+"""
+Deterministic answers to aggregate questions, computed locally instead of by the model:
+
+    "total expected impact by region for FY 24-25"     grouped statistic
+    "top 5 risks by post-mitigation score"             top-N rows
+    "how many open SHE risks per contract"             grouped count (after the filter step)
+
+`parse_question` reads the statistic, metric, grouping and top-N from the question with
+keyword rules; `answer` computes the (small) result table. For the full register the
+groups come from precomputed rollups (row count and count/sum/min/max of every metric
+per dimension, built once per frame and carried over register deltas); a filtered subset
+is aggregated directly. The summariser then only sends that table to the model for wording.
+"""
+
+import re
+import threading
+import weakref
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from src.indexes import get_index
+from src.payload import FY_RE, frame_csv, select_columns
+from src.result import RowSet
+from src.schema import FLAG_COLUMNS, NUMERIC_COLUMNS
+
+# Grouping columns with precomputed rollups; the risk-type flags are grouped together as one dimension
+DIMENSIONS = ["Contract:Region", "Risk Area", "Status", "Contract", "Risk Owner"]
+RISK_TYPE = "Risk Type"
+METRICS = NUMERIC_COLUMNS
+# Largest result table handed to the summariser
+_MAX_GROUPS = 50
+_STATS = ["count", "sum", "min", "max"]
+
+# Question vocabulary, most specific first
+_STAT_PATTERNS = [
+    ("count", r"\bhow many\b|\bnumber of\b|\bcount(?:s)?\b"),
+    ("mean", r"\baverage\b|\bmean\b|\bavg\b"),
+    ("max", r"\bmax(?:imum)?\b"),
+    ("min", r"\bmin(?:imum)?\b"),
+    ("sum", r"\btotal\b|\bsum\b|\boverall\b|\bcombined\b"),
+]
+_METRIC_PATTERNS = [
+    (r"\bworst[- ]case\b(?:\s+impacts?)?|\bunmitigated\b", "Impact (£) - Worst Case (Unmitigated)"),
+    (r"\bbest[- ]case\b(?:\s+impacts?)?", "Impact (£) - Best Case"),
+    (r"\b(?:sum of )?financial year impacts?\b", "Sum of Financial Year Impacts"),
+    (r"\bpre[- ]?mitigation\s+(?:%|percent(?:age)?)(?:\s+risk)?(?:\s+score)?", "Probability - Pre Mitigation - % Risk Score"),
+    (r"(?:\bpost[- ]?mitigation\s+)?(?:%|\bpercent(?:age)?\b)(?:\s+risk)?(?:\s+score)?",
+     "Probability - Post Mitigation - % Risk Score"),
+    (r"\b(?:pre[- ]?mitigation|inherent)(?:\s+risk)?(?:\s+score)?", "Probability - Pre Mitigation - Score (out of 25)"),
+    (r"\b(?:post[- ]?mitigation|residual)(?:\s+risk)?(?:\s+score)?|\b(?:risk\s+)?scores?\b",
+     "Probability - Post Mitigation - Score (out of 25)"),
+    (r"(?:\bexpected\s+)?(?:\bfinancial\s+)?\b(?:impacts?|exposure)\b|£|\bcosts?\b", "Impact (£) - Expected"),
+]
+_DIMENSION_PATTERNS = [
+    ("Risk Owner", r"(?:risk\s+)?owners?"),
+    ("Contract:Region", r"regions?"),
+    ("Risk Area", r"(?:risk\s+)?areas?|categor(?:y|ies)"),
+    ("Status", r"status(?:es)?"),
+    ("Contract", r"contracts?"),
+    (RISK_TYPE, r"(?:risk\s+)?types?(?:\s+of\s+risk)?"),
+]
+_DIMENSION_WORDS = "|".join(f"(?P<d{i}>{pattern})" for i, (_, pattern) in enumerate(_DIMENSION_PATTERNS))
+_GROUP_RE = re.compile(
+    rf"\b(?:by|per|for each|for every|each|across(?: all)?(?: the)?|grouped by|broken down by|split by)\s+(?:the\s+)?"
+    rf"(?:{_DIMENSION_WORDS})\b")
+_WHICH_RE = re.compile(
+    rf"\b(?:which|what)\s+(?:{_DIMENSION_WORDS})\s+(?:has|have|had|is|are|carries|carry)\s+the\s+"
+    rf"(?P<dir>highest|most|largest|biggest|greatest|lowest|least|smallest|fewest)\b")
+_TOP_GROUP_RE = re.compile(
+    rf"\b(?P<dir>top|bottom|highest|largest|biggest|lowest|smallest)\s+(?P<n>\d{{1,3}})\s+(?:{_DIMENSION_WORDS})\b")
+_TOP_RE = re.compile(
+    r"\b(?P<dir>top|bottom|highest|largest|biggest|lowest|smallest)\s+(?P<n>\d{1,3})\b"
+    r"|\b(?P<n2>\d{1,3})\s+(?P<dir2>highest|largest|biggest|lowest|smallest|most|least)\b")
+_ASCENDING = {"bottom", "lowest", "smallest", "least", "fewest"}
+# Words that carry no condition on the rows
+_NEUTRAL = set("""
+what whats is are was were the a an of in on at for to by per me my our we us you show give list tell please
+which has have with all there do does did i can could would get find display return report value values amount
+amounts risk risks register item items row rows entry entries and or each every across grouped broken down split
+fy financial year years sorted ordered order rank ranked ranking highest lowest top bottom largest smallest biggest
+most least fewest greatest summary summarise summarize breakdown how much many number
+""".split())
+_TOKEN_RE = re.compile(r"£|%|[a-z0-9]+")
+
+
+def _stat_label(stat: str) -> str:
+    return {"sum": "Total", "mean": "Average", "max": "Highest", "min": "Lowest"}[stat]
+
+
+def parse_question(question: str, columns) -> Optional[dict]:
+    """
+    {"kind": "group" | "top" | "total", "stat", "metric", "dimension", "n", "ascending",
+     "conditions"} for an aggregate question, else None. `conditions` is True when words
+    remain that look like row conditions ("open", "SHE", "North"), which only a filter can apply.
+    """
+    text = " ".join((question or "").lower().split())
+    spans = []
+
+    def take(match):
+        spans.append(match.span())
+        return match
+
+    def first(patterns):
+        for name, pattern in patterns:
+            matches = [take(match) for match in re.finditer(pattern, text)]
+            if matches:
+                return name
+        return None
+
+    stat = first(_STAT_PATTERNS)
+    metric = first((column, pattern) for pattern, column in _METRIC_PATTERNS)
+    years = [f"{a}-{b}" for a, b in FY_RE.findall(question or "")]
+    for match in FY_RE.finditer(text):
+        take(match)
+    if years and metric in (None, "Impact (£) - Expected"):
+        metric = f"Expected Impact FY {years[0]}"
+    if metric is not None and metric not in columns:
+        return None
+
+    dimension, n, ascending = None, None, False
+    grouped = _GROUP_RE.search(text) or _WHICH_RE.search(text) or _TOP_GROUP_RE.search(text)
+    if grouped is not None:
+        take(grouped)
+        index = next(int(name[1:]) for name, value in grouped.groupdict().items()
+                     if value and re.fullmatch(r"d\d+", name))
+        dimension = _DIMENSION_PATTERNS[index][0]
+        if "dir" in grouped.groupdict():
+            n, ascending = int(grouped.groupdict().get("n") or 1), grouped.group("dir") in _ASCENDING
+    top = _TOP_RE.search(text)
+    if top is not None:
+        take(top)
+        n = int(top.group("n") or top.group("n2"))
+        ascending = (top.group("dir") or top.group("dir2")) in _ASCENDING
+
+    if stat is None and metric is None and n is None:
+        # "summarise the risks by region" asks for prose, not numbers
+        return None
+    if dimension is not None:
+        kind = "group"
+    elif n is not None:
+        kind = "top"
+    elif stat is not None:
+        kind = "total"
+    else:
+        return None
+    if dimension is not None and dimension != RISK_TYPE and dimension not in columns:
+        return None
+    if stat is None:
+        # "by region" with a £ metric means totals, with a score an average; no metric means counts
+        stat = "count" if metric is None else ("sum" if "£" in metric or "Impact" in metric else "mean")
+    if kind == "top" and metric is None:
+        metric = "Probability - Post Mitigation - Score (out of 25)"
+    if kind != "top" and stat != "count" and metric is None:
+        return None
+
+    rest = list(text)
+    for start, end in spans:
+        rest[start:end] = " " * (end - start)
+    leftover = [t for t in _TOKEN_RE.findall("".join(rest)) if t not in _NEUTRAL and not t.isdigit()]
+    return {"kind": kind, "stat": stat, "metric": metric, "dimension": dimension, "n": n,
+            "ascending": ascending, "conditions": bool(leftover)}
+
+
+# ---- rollups ------------------------------------------------------------------------------------
+
+def _rollup(df: pd.DataFrame, dimension: str, metrics: list) -> pd.DataFrame:
+    grouped = df.groupby(dimension, observed=True, dropna=False, sort=False)
+    table = grouped[metrics].agg(_STATS) if metrics else pd.DataFrame(index=grouped.size().index)
+    table[("rows", "")] = grouped.size()
+    return table
+
+
+class Rollups:
+    """
+    Row counts and count/sum/min/max of every metric per dimension value of one frame.
+    With `base` (the rollups of a frame with the same rows), only the dimensions and
+    metrics among `changed` columns are recomputed.
+    """
+
+    def __init__(self, df: pd.DataFrame, base: Optional["Rollups"] = None, changed=()):
+        self.metrics = [c for c in METRICS if c in df.columns and pd.api.types.is_numeric_dtype(df[c])]
+        self.tables = {}
+        changed = set(changed)
+        for dimension in [d for d in DIMENSIONS + FLAG_COLUMNS if d in df.columns]:
+            previous = base.tables.get(dimension) if base is not None else None
+            if previous is None or dimension in changed or set(base.metrics) != set(self.metrics):
+                self.tables[dimension] = _rollup(df, dimension, self.metrics)
+                continue
+            stale = [m for m in self.metrics if m in changed]
+            if not stale:
+                self.tables[dimension] = previous
+                continue
+            fresh = _rollup(df, dimension, stale)
+            table = previous.copy()
+            for metric in stale:
+                for stat in _STATS:
+                    table[(metric, stat)] = fresh[(metric, stat)]
+            self.tables[dimension] = table
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _remember(df: pd.DataFrame, rollups: Rollups) -> Rollups:
+    key = id(df)
+    with _registry_lock:
+        _registry[key] = (weakref.ref(df), rollups)
+    weakref.finalize(df, _forget, key)
+    return rollups
+
+
+def _forget(key: int):
+    with _registry_lock:
+        _registry.pop(key, None)
+
+
+def _lookup(df: pd.DataFrame) -> Optional[Rollups]:
+    with _registry_lock:
+        entry = _registry.get(id(df))
+    if entry is None or entry[0]() is not df:
+        return None
+    return entry[1]
+
+
+def get_rollups(df: pd.DataFrame) -> Rollups:
+    """
+    The rollups of `df`, built on first use and kept until the frame is garbage collected.
+    """
+    rollups = _lookup(df)
+    if rollups is None:
+        rollups = _remember(df, Rollups(df))
+    return rollups
+
+
+def derive_rollups(old: pd.DataFrame, new: pd.DataFrame, changed, moved: bool):
+    """
+    Carries rollups already built for `old` over to `new` (a register delta), recomputing
+    only what `changed` touches. Does nothing if `old` has none; `new` then builds on first use.
+    """
+    base = _lookup(old)
+    if base is not None:
+        _remember(new, Rollups(new, None if moved else base, changed))
+
+
+# ---- answers ------------------------------------------------------------------------------------
+
+def _value(table: pd.DataFrame, query: dict) -> pd.Series:
+    if query["stat"] == "count":
+        return table[("rows", "")]
+    metric = query["metric"]
+    if query["stat"] == "mean":
+        return (table[(metric, "sum")] / table[(metric, "count")].replace(0, np.nan)).round(2)
+    return table[(metric, query["stat"])]
+
+
+def _grouped(df: pd.DataFrame, query: dict) -> tuple:
+    # Full register frames (the ones with filter indexes) use the shared rollups
+    rollups = get_rollups(df) if get_index(df) is not None else None
+    metrics = [query["metric"]] if query["metric"] else []
+
+    def table_for(dimension):
+        if rollups is not None:
+            return rollups.tables[dimension]
+        return _rollup(df, dimension, metrics)
+
+    if query["dimension"] == RISK_TYPE:
+        label = RISK_TYPE
+        parts = {}
+        for flag in (c for c in FLAG_COLUMNS if c in df.columns):
+            table = table_for(flag)
+            flagged = pd.Series(table.index, dtype="boolean").fillna(False).to_numpy(dtype=bool)
+            if flagged.any():
+                parts[flag[len("Risk Type - "):]] = table[flagged]
+        table = pd.concat(parts.values(), keys=list(parts)).droplevel(1) if parts else None
+    else:
+        label = query["dimension"]
+        table = table_for(label)
+    if table is None or table.empty:
+        return pd.DataFrame(columns=[label, "Risks"]), 0
+
+    name = "Risks" if query["stat"] == "count" else f"{_stat_label(query['stat'])} {query['metric']}"
+    result = pd.DataFrame({label: table.index.to_numpy(), "Risks": table[("rows", "")].to_numpy()})
+    if name != "Risks":
+        result[name] = _value(table, query).to_numpy()
+    result[label] = result[label].astype(object).where(result[label].notna(), "(blank)")
+    result = result.sort_values([name, label], ascending=[query["ascending"], True], kind="stable")
+    groups = len(result)
+    return result.head(query["n"] or _MAX_GROUPS).reset_index(drop=True), groups
+
+
+def _top_rows(df: pd.DataFrame, query: dict, question: str) -> pd.DataFrame:
+    metric, n = query["metric"], query["n"]
+    index = get_index(df)
+    ordered = index.sorted.get(metric) if index is not None else None
+    if ordered is not None and not query["ascending"] and n < len(ordered.sorted):
+        # Every row tied with or above the n-th largest value, then an exact nlargest over those few
+        cut = np.searchsorted(ordered.sorted, ordered.sorted[-n], side="left")
+        df = df.iloc[np.sort(ordered.positions[cut:])]
+    rows = df.nsmallest(n, metric) if query["ascending"] else df.nlargest(n, metric)
+    # The columns a row payload for this question would carry, so the summary can still describe the risks
+    columns = select_columns(rows, question)
+    return rows[columns + ([metric] if metric not in columns else [])]
+
+
+def _needed(query: dict, df: RowSet, question: str) -> Optional[list]:
+    """
+    The columns of a filter result that answering `query` reads (None: the whole register).
+    """
+    if df.is_full:
+        return None
+    columns = select_columns(df, question) + [query["metric"]]
+    columns += FLAG_COLUMNS if query["dimension"] == RISK_TYPE else [query["dimension"]]
+    return list(dict.fromkeys(c for c in columns if c in df.columns))
+
+
+def answer(question: str, df: Union[pd.DataFrame, RowSet], filtered: bool = False) -> Optional[dict]:
+    """
+    The computed answer to an aggregate `question` over `df`, or None if the question is
+    not one (or names row conditions that no filter has applied to `df`).
+    Returns: {"kind", "description", "table" (DataFrame), "row_count"}
+    """
+    query = parse_question(question, df.columns)
+    if query is None or (query["conditions"] and not filtered):
+        return None
+    if isinstance(df, RowSet):
+        df = df.take(_needed(query, df, question))
+
+    if query["kind"] == "group":
+        table, groups = _grouped(df, query)
+        what = "risks" if query["stat"] == "count" else f"{_stat_label(query['stat']).lower()} {query['metric']}"
+        description = f"{what} per {query['dimension']}, {'lowest' if query['ascending'] else 'highest'} first"
+        if groups > len(table):
+            description += f" ({len(table)} of {groups} groups shown)"
+    elif query["kind"] == "top":
+        table = _top_rows(df, query, question)
+        description = f"{'bottom' if query['ascending'] else 'top'} {query['n']} risks by {query['metric']}"
+    else:
+        if query["stat"] == "count":
+            table = pd.DataFrame({"Risks": [len(df)]})
+            description = "number of risks"
+        else:
+            series = df[query["metric"]]
+            value = {"sum": series.sum, "mean": series.mean, "max": series.max, "min": series.min}[query["stat"]]()
+            name = f"{_stat_label(query['stat'])} {query['metric']}"
+            table = pd.DataFrame({"Risks": [len(df)], name: [round(float(value), 2) if pd.notna(value) else None]})
+            description = name.lower()
+    return {"kind": query["kind"], "description": description, "table": table, "row_count": int(len(df))}
+
+
+def computed_payload(question: str, df: Union[pd.DataFrame, RowSet], filtered: bool = False) -> Optional[dict]:
+    """
+    Summary prompt data with the computed answer instead of rows, or None (see `answer`).
+    """
+    result = answer(question, df, filtered)
+    if result is None:
+        return None
+    return {
+        "format": "computed",
+        "row_count": result["row_count"],
+        "computed": {"description": result["description"], "csv": frame_csv(result["table"])},
+    }
@@ -0,0 +1,229 @@
+# batch.py
+"""
+Headless batch runner: answers a file of standing questions against the register.
+
+    python -m src.batch nightly_queries.txt --out results.jsonl
+    python -m src.batch queries.jsonl --out results.jsonl --concurrency 16 --limit gpt-4.1=500:30000
+
+Input is plain text (one query per line) or JSONL with {"id": ..., "query": ...}.
+Each query runs `detect_intent` + `process_query`; one JSON line per query is appended
+to --out as soon as it finishes (row IDs, explanation, summaries, timings or the error).
+Re-running with the same --out skips queries that already succeeded, so an interrupted
+run resumes where it stopped. Model calls share per-model requests/tokens-per-minute
+budgets (src/rate_limit.py); queries that still hit a rate limit are retried later.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Optional
+
+from src.clients import set_rate_limiter
+from src.intent_detector import detect_intent
+from src.main import process_query
+from src.rate_limit import RateLimiter, parse_limit
+from src.register import DEFAULT_REGISTER_PATH, load_register
+
+_MAX_ATTEMPTS = 5
+_BACKOFF_SECONDS = 2.0
+
+
+def query_id(query: str) -> str:
+    return hashlib.sha256(query.strip().encode("utf-8")).hexdigest()[:12]
+
+
+def load_queries(path: str) -> list:
+    items, seen = [], set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            item = json.loads(line) if line.startswith("{") else {"query": line}
+            item["id"] = str(item.get("id") or query_id(item["query"]))
+            if item["id"] not in seen:
+                seen.add(item["id"])
+                items.append(item)
+    return items
+
+
+def completed_ids(path: str) -> set:
+    """
+    IDs already answered successfully in an earlier (possibly interrupted) run.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # line cut short by an interruption
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+def _is_rate_limit(error: Exception) -> bool:
+    return type(error).__name__ == "RateLimitError" or getattr(error, "status_code", None) == 429
+
+
+def run_query(item: dict, df) -> dict:
+    """
+    One query through the pipeline, as a JSON-serialisable record.
+    """
+    record = {"id": item["id"], "query": item["query"]}
+    start = time.perf_counter()
+    intent = detect_intent(item["query"])
+    record["intent"] = intent
+    record["intent_seconds"] = round(time.perf_counter() - start, 3)
+
+    filtered_df, filter_explanation, summary, final_summary = process_query(item["query"], df, intent)
+    if filtered_df is not None:
+        ids = filtered_df["RiskIDNumber"] if "RiskIDNumber" in filtered_df.columns else filtered_df.index.to_series()
+        record["row_count"] = int(len(filtered_df))
+        record["row_ids"] = [str(v) for v in ids.tolist()]
+    record.update({
+        "filter_explanation": filter_explanation,
+        "summary": summary,
+        "final_summary": final_summary,
+        "status": "ok",
+        "seconds": round(time.perf_counter() - start, 3),
+    })
+    return record
+
+
+class _Writer:
+    """
+    Appends JSON lines and flushes each one, so a crash loses at most the line being written.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        needs_newline = os.path.exists(path) and os.path.getsize(path) > 0 and not _ends_with_newline(path)
+        self._file = open(path, "a", encoding="utf-8")
+        if needs_newline:
+            self._file.write("\n")
+        self._lock = threading.Lock()
+
+    def write(self, record: dict):
+        with self._lock:
+            self._file.write(json.dumps(record, default=str) + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def run_batch(
+    items: list,
+    df,
+    out: str,
+    concurrency: int = 8,
+    limiter: Optional[RateLimiter] = None,
+    progress=None,
+) -> dict:
+    """
+    Runs `items` concurrently, appending one record per query to `out`.
+    Queries already answered in `out` are skipped; rate-limited ones are retried with backoff.
+    Returns run counters.
+    """
+    done = completed_ids(out)
+    pending = [item for item in items if item["id"] not in done]
+    counters = {"queries": len(items), "skipped": len(items) - len(pending), "ok": 0, "errors": 0, "retries": 0}
+    if limiter is not None:
+        set_rate_limiter(limiter)
+
+    writer = _Writer(out)
+    start = time.perf_counter()
+    queue = [(item, 1, 0.0) for item in pending]  # (item, attempt, not before)
+    running = {}
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        while queue or running:
+            now = time.monotonic()
+            ready = [entry for entry in queue if entry[2] <= now]
+            for entry in ready[:max(0, concurrency - len(running))]:
+                queue.remove(entry)
+                running[pool.submit(run_query, entry[0], df)] = entry
+            if not running:
+                time.sleep(max(0.0, min(entry[2] for entry in queue) - now))
+                continue
+
+            finished, _ = wait(running, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in finished:
+                item, attempt, _ = running.pop(future)
+                try:
+                    writer.write(future.result())
+                    counters["ok"] += 1
+                except Exception as e:
+                    if _is_rate_limit(e) and attempt < _MAX_ATTEMPTS:
+                        # Jittered exponential backoff; the limiter has already slowed the model down
+                        delay = _BACKOFF_SECONDS * 2 ** (attempt - 1) * (0.5 + random.random())
+                        queue.append((item, attempt + 1, time.monotonic() + delay))
+                        counters["retries"] += 1
+                        continue
+                    writer.write({"id": item["id"], "query": item["query"], "status": "error",
+                                  "error": f"{type(e).__name__}: {e}", "attempts": attempt})
+                    counters["errors"] += 1
+                if progress is not None:
+                    progress(counters)
+    finally:
+        # On interruption, queued queries are dropped; the next run picks them up
+        pool.shutdown(wait=True, cancel_futures=True)
+        writer.close()
+        if limiter is not None:
+            set_rate_limiter(None)
+
+    counters["seconds"] = round(time.perf_counter() - start, 3)
+    counters["throughput_qps"] = round(counters["ok"] / counters["seconds"], 3) if counters["seconds"] else 0.0
+    if limiter is not None:
+        counters["rate_limits"] = limiter.stats()
+    return counters
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("queries", help="text file (one query per line) or JSONL with id/query")
+    parser.add_argument("--out", required=True, help="JSONL results file (appended to; resumes from it)")
+    parser.add_argument("--register", default=DEFAULT_REGISTER_PATH)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--limit", action="append", default=[], metavar="MODEL=RPM:TPM",
+                        help="per-model budget, e.g. gpt-4.1=500:30000 (repeatable)")
+    parser.add_argument("--no-limits", action="store_true", help="do not throttle model calls client-side")
+    args = parser.parse_args(argv)
+
+    items = load_queries(args.queries)
+    df = load_register(args.register)
+    limiter = None if args.no_limits else RateLimiter(dict(parse_limit(text) for text in args.limit))
+
+    def progress(counters):
+        finished = counters["skipped"] + counters["ok"] + counters["errors"]
+        sys.stderr.write(f"\r{finished}/{counters['queries']} done, {counters['errors']} errors, {counters['retries']} retries")
+        sys.stderr.flush()
+
+    try:
+        counters = run_batch(items, df, args.out, args.concurrency, limiter, progress)
+    except KeyboardInterrupt:
+        sys.stderr.write(f"\nInterrupted; run again with --out {args.out} to resume.\n")
+        sys.exit(130)
+    sys.stderr.write("\n")
+    json.dump(counters, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+# bench/__init__.py
+"""
+Benchmark suite: synthetic registers (generate.py), a local OpenAI stand-in
+(mock_openai.py) and the end-to-end runner (run.py).
+
+    python -m src.bench.run --rows 100 10000 1000000 --out bench.json
+"""
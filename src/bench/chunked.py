@@ -0,0 +1,97 @@
+# chunked.py
+"""
+Peak-memory benchmark of chunked register processing (src/chunked.py) against loading.
+
+    python -m src.bench.chunked --rows 10000 100000 1000000 --chunk-rows 50000
+    python -m src.bench.chunked --rows 1000000 --workers 4 --code 'filtered_df = df.loc[...]'
+
+For every register size, each mode runs in a fresh process (peak RSS only grows) on the
+same generated file:
+
+- load:      load_register + filter_rows + payload.aggregate, everything in one frame
+- chunked:   chunked.filter_file + chunked.aggregate_file with --chunk-rows and --workers
+
+The report has, per size and mode, wall seconds, peak RSS of the process and of its
+largest pool worker (MB) and the number of matching rows, which must agree between
+modes. With chunking and a selective filter the peak should stay flat as the file grows;
+with loading it grows with the file.
+"""
+
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+from src.bench.generate import register_path
+from src.bench.run import peak_rss_mb
+
+MODES = ("load", "chunked")
+_DEFAULT_CODE = 'filtered_df = df.loc[(df["Status"] == "Open") & (df["Impact (£) - Expected"] > 2000000)]'
+
+
+def _measure(mode: str, path: str, code: str, chunk_rows: int, workers: int) -> dict:
+    start = time.perf_counter()
+    if mode == "load":
+        from src.filter_engine import filter_rows
+        from src.payload import aggregate
+        from src.register import load_register
+
+        df = load_register(path, use_cache=False, index=False)
+        rows = filter_rows(code, df)
+        aggregate(rows)
+        matches = len(rows)
+    else:
+        from src.chunked import aggregate_file, filter_file
+
+        matches = len(filter_file(code, path, chunk_rows=chunk_rows, workers=workers))
+        aggregate_file(path, code, chunk_rows=chunk_rows, workers=workers)
+    # Pool workers are children: the largest of them is reported separately
+    workers_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return {"mode": mode, "seconds": time.perf_counter() - start, "peak_rss_mb": peak_rss_mb(),
+            "worker_peak_rss_mb": workers_peak, "rows": matches}
+
+
+def _run_child(mode: str, path: str, args) -> dict:
+    command = [sys.executable, "-m", "src.bench.chunked", "--child", mode, path, "--code", args.code,
+               "--chunk-rows", str(args.chunk_rows), "--workers", str(args.workers)]
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 400_000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--code", default=_DEFAULT_CODE)
+    parser.add_argument("--chunk-rows", type=int, default=50_000)
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    if args.child:
+        mode, path = args.child
+        sys.stdout.write(json.dumps(_measure(mode, path, args.code, args.chunk_rows, args.workers)) + "\n")
+        return
+
+    report = {"meta": {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "args": vars(args)}, "results": []}
+    for rows in args.rows:
+        path = register_path(rows, args.seed)
+        for mode in args.modes:
+            result = _run_child(mode, path, args)
+            result["register_rows"] = rows
+            report["results"].append(result)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# faults.py
+"""
+Tail-latency benchmark of the call layer (src/calls.py) against a fault-injecting mock.
+
+    python -m src.bench.faults --error-rate 0.1 --stall-rate 0.05 --stall-seconds 20
+    python -m src.bench.faults --fail-model gpt-4.1 --modes none retry
+    python -m src.bench.faults --stall-rate 0.1 --stall-seconds 5 --deadline 8 --repeat 5
+
+The corpus is run through `detect_intent` and `process_query` once per mode, with the mock
+answering a share of requests with 503, stalling another share and failing whole models:
+
+- none:  one attempt per call, no fallback (the behaviour before the call layer)
+- retry: retries with backoff and model fallback
+- hedge: retry, plus hedged duplicates of requests slower than their model's p95
+
+The report has, per mode, the share of queries answered, their latency percentiles, the
+call-layer counters (retries, fallbacks, hedges, timeouts) and the requests the mock saw
+by kind, model and fault.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from src.bench.generate import register_path
+from src.bench.mock_openai import DEFAULT_CORPUS, MockOpenAI, load_corpus
+from src.bench.run import percentiles, reset_caches
+
+MODES = ("none", "retry", "hedge")
+
+
+def _configure(mode: str, policies: dict, retries: int, deadline):
+    from src import calls
+
+    calls.RETRIES = 0 if mode == "none" else retries
+    calls.HEDGE = mode == "hedge"
+    for stage, policy in policies.items():
+        calls.STAGE_POLICIES[stage] = {
+            "deadline": deadline if deadline is not None else policy["deadline"],
+            "fallback": None if mode == "none" else policy["fallback"],
+        }
+
+
+def bench_mode(mode: str, df, queries: list, args, mock) -> dict:
+    import src.main as main
+    from src import calls
+    from src.intent_detector import detect_intent
+
+    calls.reset_call_stats()
+    mock.reset()
+
+    def one(query: str):
+        # Every query pays for its model calls
+        reset_caches()
+        start = time.perf_counter()
+        main.process_query(query, df, detect_intent(query))
+        return time.perf_counter() - start
+
+    latencies, errors = [], Counter()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(one, item["query"]) for _ in range(args.repeat) for item in queries]
+        for future in futures:
+            try:
+                latencies.append(future.result())
+            except Exception as e:
+                errors[type(e).__name__] += 1
+    wall = time.perf_counter() - start
+
+    total = len(queries) * args.repeat
+    with mock._lock:
+        requests = list(mock.requests)
+    return {
+        "mode": mode,
+        "queries": total,
+        "answered": len(latencies),
+        "success_rate": len(latencies) / total if total else 0.0,
+        "errors": dict(errors),
+        "wall_seconds": wall,
+        "latency": percentiles(latencies),
+        "calls": calls.call_stats(),
+        # "<kind>/<model>/<fault>": requests
+        "mock_requests": dict(sorted(Counter(
+            f"{r['kind']}/{r.get('model')}/{r.get('fault') or 'ok'}" for r in requests
+        ).items())),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--latency", type=float, default=0.2, help="mock seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="mock generation speed (0 = instant)")
+    parser.add_argument("--error-rate", type=float, default=0.1, help="share of requests answered with 503")
+    parser.add_argument("--stall-rate", type=float, default=0.05, help="share of requests that stall")
+    parser.add_argument("--stall-seconds", type=float, default=20.0)
+    parser.add_argument("--fail-model", action="append", default=[], help="model that always fails (repeatable)")
+    parser.add_argument("--retries", type=int, help="retries per call in the retry/hedge modes (default ROBO_CALL_RETRIES)")
+    parser.add_argument("--deadline", type=float, help="one deadline (seconds) for every stage instead of the policies'")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    queries = load_corpus(args.corpus)
+    mock = MockOpenAI(latency=args.latency, tokens_per_second=args.tokens_per_second, corpus=queries,
+                      error_rate=args.error_rate, stall_rate=args.stall_rate, stall_seconds=args.stall_seconds,
+                      fail_models=tuple(args.fail_model), seed=args.seed).start()
+    os.environ["OPENAI_BASE_URL"] = mock.url
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ["ROBO_PLAN_CACHE"] = "0"
+
+    # Clients are created on import, after the endpoint is set
+    from src import calls
+    from src.register import load_register
+
+    df = load_register(register_path(args.rows, args.seed))
+    policies = {stage: dict(policy) for stage, policy in calls.STAGE_POLICIES.items()}
+    retries = args.retries if args.retries is not None else calls.RETRIES
+    hedge = calls.HEDGE
+
+    report = {"meta": {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "args": vars(args)}, "results": []}
+    try:
+        for mode in args.modes:
+            _configure(mode, policies, retries, args.deadline)
+            report["results"].append(bench_mode(mode, df, queries, args, mock))
+    finally:
+        calls.STAGE_POLICIES.update(policies)
+        calls.RETRIES, calls.HEDGE = retries, hedge
+        mock.stop()
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
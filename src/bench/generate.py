@@ -0,0 +1,89 @@
+# generate.py
+"""
+Synthetic risk registers with the exact column layout of data/Risk_Register__100_Rows.csv.
+
+    python -m src.bench.generate 100000 .cache/bench/register-100000.csv
+
+Rows are resampled from the sample register (so value combinations stay realistic)
+with fresh IDs, spread-out dates, rescaled £ amounts and varied description texts.
+"""
+
+import os
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from src.schema import REGISTER_COLUMNS
+
+SAMPLE_REGISTER = "data/Risk_Register__100_Rows.csv"
+_MONEY_COLUMNS = [
+    c for c in REGISTER_COLUMNS
+    if c.startswith(("Impact (£)", "Sum of Financial Year Impacts", "Expected Impact FY"))
+]
+_CHUNK_ROWS = 100_000
+
+
+def _chunk(seed_df: pd.DataFrame, start: int, n: int, rng: np.random.Generator, text_variants: int) -> pd.DataFrame:
+    df = seed_df.iloc[rng.integers(0, len(seed_df), n)].reset_index(drop=True)
+    df["RiskIDNumber"] = [f"R{i:07d}" for i in range(start + 1, start + n + 1)]
+
+    raised = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 730, n), unit="D")
+    df["Date Raised"] = raised.strftime("%Y-%m-%d")
+    df["Date Updated"] = (raised + pd.to_timedelta(rng.integers(0, 60, n), unit="D")).strftime("%Y-%m-%d")
+    df["By When"] = (raised + pd.to_timedelta(rng.integers(14, 180, n), unit="D")).strftime("%Y-%m-%d")
+
+    # Same factor for every £ column of a row keeps best <= expected <= worst
+    scale = rng.lognormal(0.0, 0.5, n)
+    for column in _MONEY_COLUMNS:
+        df[column] = (df[column].astype("float64") * scale).round().astype("int64")
+
+    if text_variants:
+        site = rng.integers(1, text_variants + 1, n)
+        df["Description of Risk/Opportunity"] = (
+            df["Description of Risk/Opportunity"] + " (" + df["Contract"] + ", site " + pd.Series(site).astype(str) + ")"
+        )
+    return df[REGISTER_COLUMNS]
+
+
+def generate_register(rows: int, path: str, seed: int = 0, text_variants: int = 1000, sample: str = SAMPLE_REGISTER) -> str:
+    """
+    Writes a synthetic register of `rows` rows to `path` (CSV), in chunks to bound memory.
+    """
+    seed_df = pd.read_csv(sample, dtype=str, keep_default_na=False)
+    if list(seed_df.columns) != REGISTER_COLUMNS:
+        raise ValueError(f"{sample} does not have the register columns")
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        for start in range(0, rows, _CHUNK_ROWS):
+            chunk = _chunk(seed_df, start, min(_CHUNK_ROWS, rows - start), rng, text_variants)
+            chunk.to_csv(f, index=False, header=start == 0, lineterminator="\n")
+    os.replace(tmp, path)
+    return path
+
+
+def register_path(rows: int, seed: int = 0, directory: str = None) -> str:
+    """
+    Generated register for `rows` rows, created on first use.
+    """
+    directory = directory or os.path.join(os.getenv("ROBO_CACHE_DIR", ".cache"), "bench")
+    path = os.path.join(directory, f"register-{rows}-{seed}.csv")
+    if not os.path.exists(path):
+        generate_register(rows, path, seed)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("rows", type=int)
+    parser.add_argument("path")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--text-variants", type=int, default=1000, help="distinct site numbers appended to descriptions (0 = keep)")
+    args = parser.parse_args(argv)
+    generate_register(args.rows, args.path, args.seed, args.text_variants)
+
+
+if __name__ == "__main__":
+    main()
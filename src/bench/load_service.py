@@ -0,0 +1,155 @@
+# load_service.py
+"""
+Load test of the HTTP service (src/service.py) against the local OpenAI stand-in.
+
+    python -m src.bench.load_service --clients 32 --requests 400 --latency 0.5
+    python -m src.bench.load_service --service-url http://127.0.0.1:8000 --clients 64
+
+Unless --service-url is given, the mock model endpoint and the service are started in
+this process. Each client thread sends queries drawn from the corpus back to back.
+The report has latency percentiles of answered requests, the 503 (backpressure) and
+error counts, throughput, the service's coalescing counters and the number of model
+calls the mock actually received.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from src.bench.generate import register_path
+from src.bench.mock_openai import DEFAULT_CORPUS, MockOpenAI, load_corpus
+from src.bench.run import percentiles
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class _LocalService:
+    """
+    The service on a background uvicorn server.
+    """
+
+    def __init__(self, register: str, max_concurrency: int, max_queue: int):
+        import uvicorn
+        from src.service import create_app
+
+        self.port = _free_port()
+        config = uvicorn.Config(create_app(register, max_concurrency, max_queue), host="127.0.0.1",
+                                port=self.port, log_level="warning")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, name="robo-service", daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> "_LocalService":
+        self._thread.start()
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError("The service failed to start")
+            time.sleep(0.05)
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join()
+
+
+def load_test(url: str, queries: list, clients: int, requests: int, seed: int = 0) -> dict:
+    from src.service_client import ServiceClient, ServiceError
+
+    client = ServiceClient(url)
+    rng = random.Random(seed)
+    plan = [rng.choice(queries)["query"] for _ in range(requests)]
+    latencies, outcomes = [], Counter()
+    lock = threading.Lock()
+
+    def one(query: str):
+        start = time.perf_counter()
+        try:
+            client.query(query, max_rows=100)
+            outcome = "ok"
+        except ServiceError as e:
+            outcome = "rejected" if e.status == 503 else f"http_{e.status}"
+        except OSError as e:
+            outcome = type(e).__name__
+        seconds = time.perf_counter() - start
+        with lock:
+            outcomes[outcome] += 1
+            if outcome == "ok":
+                latencies.append(seconds)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(one, plan))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "clients": clients,
+        "outcomes": dict(outcomes),
+        "latency_seconds": percentiles(latencies),
+        "seconds": round(elapsed, 3),
+        "throughput_qps": round(outcomes["ok"] / elapsed, 3) if elapsed else 0.0,
+        "service": client.stats(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--service-url", help="load an already running service instead of starting one")
+    parser.add_argument("--rows", type=int, default=10_000, help="synthetic register size of the local service")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--max-queue", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.5, help="mock seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="mock generation speed (0 = instant)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    queries = load_corpus(args.corpus)
+    mock = service = None
+    if args.service_url:
+        url = args.service_url
+    else:
+        mock = MockOpenAI(latency=args.latency, tokens_per_second=args.tokens_per_second, corpus=queries).start()
+        os.environ["OPENAI_BASE_URL"] = mock.url
+        os.environ.setdefault("OPENAI_API_KEY", "bench")
+        os.environ["ROBO_PLAN_CACHE"] = "0"
+        service = _LocalService(register_path(args.rows, args.seed), args.max_concurrency, args.max_queue).start()
+        url = service.url
+
+    try:
+        report = load_test(url, queries, args.clients, args.requests, args.seed)
+    finally:
+        if service is not None:
+            service.stop()
+        if mock is not None:
+            mock.stop()
+    if mock is not None:
+        report["model_calls"] = dict(Counter(r["kind"] for r in mock.requests))
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
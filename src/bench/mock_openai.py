@@ -0,0 +1,330 @@
+# mock_openai.py
+"""
+Local stand-in for the OpenAI chat-completions endpoint, for benchmarks.
+
+    python -m src.bench.mock_openai --port 8765 --latency 0.3 --tokens-per-second 80
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=bench streamlit run ui_app.py
+
+The assistant is recognised from its system prompt and answered with a canned response:
+intent, filter and planner answers come from the query corpus (data/bench_queries.jsonl)
+when the query is in it, summaries are filler text of a fixed length. Responses take
+`latency` seconds to the first token plus one token per 1/`tokens_per_second`, streamed
+as server-sent events when the client asks for `stream=True`.
+
+Faults can be injected to exercise the call layer (src/calls.py): a share of requests
+answered with 503 (`error_rate`), a share that stalls for `stall_seconds` before
+answering (`stall_rate`, a tail-latency outlier or hung connection) and models that
+always fail (`fail_models`, e.g. an outage of the primary model).
+"""
+
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from src.payload import count_tokens
+
+DEFAULT_CORPUS = "data/bench_queries.jsonl"
+
+# System prompt marker → assistant kind
+_KINDS = [
+    ("plans how to answer", "plan"),
+    ("detects what a user wants", "intent"),
+    ("filter a pandas DataFrame", "filter"),
+    ("summarise a large risk register in parts", "map"),
+    ("risk summarisation assistant", "summary"),
+]
+_FILLER = (
+    "The register shows **several high-impact risks** concentrated in a few areas, most of them still open. "
+    "Exposure is driven by a small number of large items, and mitigations are in place for most of them. "
+)
+
+
+def load_corpus(path: str = DEFAULT_CORPUS) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _kind(messages: list) -> str:
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    return next((kind for marker, kind in _KINDS if marker in system), "other")
+
+
+def _query(messages: list) -> str:
+    content = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+    try:
+        return json.loads(content).get("user_prompt", content)
+    except (ValueError, AttributeError):
+        return content
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return  # the client gave up on the request (e.g. a stalled one)
+        super().handle_error(request, client_address)
+
+
+class MockOpenAI:
+    """
+    The mock server; `start()` runs it on a background thread, `url` is the base URL to use.
+    Every request is recorded in `requests` (kind, bytes, prompt/completion tokens, seconds).
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        tokens_per_second: float = 0.0,
+        summary_tokens: int = 120,
+        corpus: Optional[list] = None,
+        rpm: Optional[int] = None,
+        error_rate: float = 0.0,
+        stall_rate: float = 0.0,
+        stall_seconds: float = 30.0,
+        fail_models: tuple = (),
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.summary_tokens = summary_tokens
+        # Requests per minute before answering 429 (None = unlimited)
+        self.rpm = rpm
+        self._recent = []
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.fail_models = set(fail_models)
+        self._random = random.Random(seed)
+        self.corpus = {item["query"].strip().lower(): item for item in (corpus if corpus is not None else load_corpus())}
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockOpenAI":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.requests = []
+
+    # ---- responses ------------------------------------------------------------------------------
+
+    def answer(self, messages: list) -> tuple:
+        """
+        (kind, text) the mock replies with for `messages`.
+        """
+        kind = _kind(messages)
+        item = self.corpus.get(_query(messages).strip().lower())
+        if kind == "intent":
+            return kind, json.dumps(item["intent"] if item else ["filter_data", "summarise_risks"])
+        if kind == "plan":
+            plan = {"intent": item["intent"] if item else ["filter_data", "summarise_risks"],
+                    "code": item["code"] if item else 'filtered_df = df.loc[df["Status"] == "Open"]',
+                    "explanation": item["explanation"] if item else "Open risks.",
+                    "columns": (item or {}).get("columns", []), "aggregates": (item or {}).get("aggregates", [])}
+            return kind, json.dumps(plan)
+        if kind == "filter":
+            if item:
+                plan = {"code": item["code"], "explanation": item["explanation"]}
+                if item.get("refine"):
+                    plan["refine"] = True
+                return kind, json.dumps(plan)
+            return kind, json.dumps({"code": 'filtered_df = df.loc[df["Status"] == "Open"]', "explanation": "Open risks."})
+        filler, words = _FILLER.split(), []
+        while count_tokens(" ".join(words)) < self.summary_tokens:
+            words.append(filler[len(words) % len(filler)])
+        return kind, " ".join(words)
+
+    def _admit(self) -> Optional[float]:
+        """
+        None if the request is within the rpm budget, else the Retry-After seconds.
+        """
+        if self.rpm is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._recent = [t for t in self._recent if now - t < 60]
+            if len(self._recent) >= self.rpm:
+                return 60 - (now - self._recent[0])
+            self._recent.append(now)
+        return None
+
+    def _fault(self, model: str) -> Optional[str]:
+        """
+        The fault injected into this request ("error" or "stall"), or None.
+        """
+        if model in self.fail_models:
+            return "error"
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.error_rate:
+            return "error"
+        if roll < self.error_rate + self.stall_rate:
+            return "stall"
+        return None
+
+    def _delay(self, tokens: int) -> float:
+        return tokens / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _record(self, kind: str, body: bytes, messages: list, text: str, seconds: float, model: Optional[str] = None,
+                fault: Optional[str] = None):
+        prompt_tokens = sum(count_tokens(m.get("content") or "") for m in messages)
+        with self._lock:
+            self.requests.append({
+                "kind": kind, "model": model, "fault": fault, "bytes": len(body), "prompt_tokens": prompt_tokens,
+                "completion_tokens": count_tokens(text), "seconds": seconds,
+            })
+        return prompt_tokens
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+                    return
+                start = time.perf_counter()
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                retry_after = mock._admit()
+                if retry_after is not None:
+                    with mock._lock:
+                        mock.requests.append({"kind": "rate_limited", "bytes": len(body), "prompt_tokens": 0,
+                                              "completion_tokens": 0, "seconds": 0.0})
+                    self._json(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                               {"retry-after-ms": str(int(retry_after * 1000))})
+                    return
+                request = json.loads(body)
+                messages = request.get("messages", [])
+                kind, text = mock.answer(messages)
+                fault = mock._fault(request.get("model", ""))
+                if fault == "error":
+                    with mock._lock:
+                        mock.requests.append({"kind": kind, "fault": fault, "model": request.get("model"),
+                                              "bytes": len(body), "prompt_tokens": 0, "completion_tokens": 0,
+                                              "seconds": 0.0})
+                    self._json(503, {"error": {"message": "The server is overloaded", "type": "server_error"}})
+                    return
+                if fault == "stall":
+                    time.sleep(mock.stall_seconds)
+                pieces = re.findall(r"\S+\s*", text) or [text]
+                time.sleep(mock.latency)
+
+                if request.get("stream"):
+                    prompt_tokens = sum(count_tokens(m.get("content") or "") for m in messages)
+                    self._stream(request, pieces, prompt_tokens, count_tokens(text))
+                    mock._record(kind, body, messages, text, time.perf_counter() - start, request.get("model"), fault)
+                    return
+
+                time.sleep(mock._delay(count_tokens(text)))
+                prompt_tokens = mock._record(kind, body, messages, text, time.perf_counter() - start, request.get("model"),
+                                             fault)
+                completion_tokens = count_tokens(text)
+                self._json(200, {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion", "created": int(time.time()),
+                    "model": request.get("model", "mock"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens},
+                })
+
+            def _json(self, status: int, payload: dict, headers: Optional[dict] = None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, request: dict, pieces: list, prompt_tokens: int, completion_tokens: int):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                ident, created = f"chatcmpl-{uuid.uuid4().hex}", int(time.time())
+
+                def event(delta: dict, finish: Optional[str] = None) -> bytes:
+                    chunk = {"id": ident, "object": "chat.completion.chunk", "created": created,
+                             "model": request.get("model", "mock"),
+                             "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+                    return f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+
+                self._chunk(event({"role": "assistant", "content": ""}))
+                for piece in pieces:
+                    time.sleep(mock._delay(count_tokens(piece)))
+                    self._chunk(event({"content": piece}))
+                self._chunk(event({}, "stop"))
+                if (request.get("stream_options") or {}).get("include_usage"):
+                    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                             "total_tokens": prompt_tokens + completion_tokens}
+                    chunk = {"id": ident, "object": "chat.completion.chunk", "created": created,
+                             "model": request.get("model", "mock"), "choices": [], "usage": usage}
+                    self._chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self._chunk(b"data: [DONE]\n\n")
+                self._chunk(b"")
+
+            def _chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds to the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="0 = instant")
+    parser.add_argument("--summary-tokens", type=int, default=120, help="length of summary answers")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--rpm", type=int, help="answer 429 above this many requests per minute")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="share of requests that stall")
+    parser.add_argument("--stall-seconds", type=float, default=30.0)
+    parser.add_argument("--fail-model", action="append", default=[], help="model that always fails (repeatable)")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    mock = MockOpenAI(args.host, args.port, args.latency, args.tokens_per_second, args.summary_tokens,
+                      load_corpus(args.corpus), args.rpm, args.error_rate, args.stall_rate, args.stall_seconds,
+                      tuple(args.fail_model), args.seed)
+    print(f"Mock OpenAI listening on {mock.url}")
+    try:
+        mock._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# planner.py
+"""
+Benchmark of the multi-call pipeline against the fused planner (ROBO_PLANNER, src/main.py).
+
+    python -m src.bench.planner --rows 10000 --repeat 3 --latency 0.5 --tokens-per-second 80
+    python -m src.bench.planner --base-url https://api.openai.com/v1 --repeat 1
+
+Every query of the corpus is run through `main.run_query` on both paths, one query at a
+time, against the same register. The JSON report has, per path, latency percentiles,
+model calls per query and prompt/completion tokens by assistant (as the endpoint
+reported them), and how far the fused path agrees with the multi-call one: same intent,
+same filtered rows, and the word overlap (Jaccard) of the final answers. Against the
+mock the answers are filler, so only a real endpoint (--base-url) tells answer quality.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from collections import defaultdict
+
+import numpy as np
+
+from src.bench.generate import register_path
+from src.bench.mock_openai import DEFAULT_CORPUS, MockOpenAI, load_corpus
+from src.bench.run import percentiles, reset_caches
+
+PATHS = ("multi", "fused")
+_WORD_RE = re.compile(r"[a-z0-9£]+")
+
+
+def _jaccard(a: str, b: str) -> float:
+    a, b = set(_WORD_RE.findall(a.lower())), set(_WORD_RE.findall(b.lower()))
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def _usage_by_kind(spans: list) -> dict:
+    usage = defaultdict(lambda: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+    for item in spans:
+        if item.get("prompt_tokens") is not None:
+            entry = usage[item["name"]]
+            entry["calls"] += 1
+            entry["prompt_tokens"] += item["prompt_tokens"]
+            entry["completion_tokens"] += item.get("completion_tokens") or 0
+    return dict(usage)
+
+
+def bench_path(path: str, df, queries: list, args) -> tuple:
+    """
+    Runs the corpus on `path`. Returns: (report, {query: (intent, rows, answer)})
+    """
+    import src.main as main
+    from src import tracing
+
+    main.PLANNER = path
+    latencies, calls, errors, answers, spans = [], [], [], {}, []
+    for _ in range(args.repeat):
+        for item in queries:
+            reset_caches()
+            start = time.perf_counter()
+            try:
+                with tracing.span("request") as request:
+                    intent, rows, _, summary, final_summary = main.run_query(item["query"], df)
+            except Exception as e:
+                errors.append(f"{item['query']}: {type(e).__name__}: {e}")
+                continue
+            latencies.append(time.perf_counter() - start)
+            trace = tracing.recent_spans(request.trace_id)
+            spans.extend(trace)
+            calls.append(sum(1 for s in trace if s.get("prompt_tokens") is not None))
+            answers[item["query"]] = (intent, None if rows is None else rows.rows, final_summary or summary)
+
+    usage = _usage_by_kind(spans)
+    report = {
+        "path": path,
+        "queries": len(latencies),
+        "errors": errors[:20],
+        "latency": percentiles(latencies),
+        "model_calls_per_query": float(np.mean(calls)) if calls else 0.0,
+        "usage": usage,
+        "prompt_tokens_total": sum(u["prompt_tokens"] for u in usage.values()),
+        "completion_tokens_total": sum(u["completion_tokens"] for u in usage.values()),
+    }
+    return report, answers
+
+
+def agreement(reference: dict, other: dict) -> dict:
+    """
+    How often `other`'s answers match `reference`'s, over the queries both answered.
+    """
+    common = [q for q in reference if q in other]
+    same_intent = [reference[q][0] == other[q][0] for q in common]
+    same_rows = [
+        (reference[q][1] is None and other[q][1] is None)
+        or (reference[q][1] is not None and other[q][1] is not None and np.array_equal(reference[q][1], other[q][1]))
+        for q in common
+    ]
+    overlap = [_jaccard(reference[q][2], other[q][2]) for q in common]
+    return {
+        "queries": len(common),
+        "same_intent": float(np.mean(same_intent)) if common else 0.0,
+        "same_rows": float(np.mean(same_rows)) if common else 0.0,
+        "answer_overlap": percentiles(overlap),
+        "differing": [q for q, a, b in zip(common, same_intent, same_rows) if not (a and b)][:20],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="mock seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="mock generation speed (0 = instant)")
+    parser.add_argument("--summary-tokens", type=int, default=120)
+    parser.add_argument("--base-url", help="use this endpoint instead of starting the mock")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    queries = load_corpus(args.corpus)
+    mock = None
+    if args.base_url:
+        os.environ["OPENAI_BASE_URL"] = args.base_url
+    else:
+        mock = MockOpenAI(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                          summary_tokens=args.summary_tokens, corpus=queries).start()
+        os.environ["OPENAI_BASE_URL"] = mock.url
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ["ROBO_PLAN_CACHE"] = "0"
+
+    # Clients are created on import, after the endpoint is set
+    import src.main  # noqa: F401
+    from src import tracing
+    from src.register import load_register
+
+    # Calls and tokens are read from the trace spans, kept in memory only
+    tracing.ENABLED, tracing.TRACE_FILE = True, None
+
+    df = load_register(register_path(args.rows, args.seed))
+    report = {"meta": {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "args": vars(args)}, "results": []}
+    answers = {}
+    try:
+        for path in PATHS:
+            result, answers[path] = bench_path(path, df, queries, args)
+            report["results"].append(result)
+    finally:
+        if mock is not None:
+            mock.stop()
+    report["agreement"] = agreement(answers["multi"], answers["fused"])
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
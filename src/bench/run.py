@@ -0,0 +1,236 @@
+# run.py
+"""
+End-to-end benchmark of the query pipeline against the local OpenAI stand-in.
+
+    python -m src.bench.run --rows 100 10000 100000 --repeat 3 --out bench.json
+    python -m src.bench.run --rows 1000 --latency 0 --tokens-per-second 0 --concurrency 8
+
+For each register size a synthetic register is generated (cached under .cache/bench),
+loaded, and every query of the corpus is run through `detect_intent` and `process_query`.
+The JSON report has p50/p95/p99 latency per stage, payload bytes and tokens per assistant,
+peak memory and throughput; diff two reports to compare commits.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import subprocess
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.bench.generate import register_path
+from src.bench.mock_openai import DEFAULT_CORPUS, MockOpenAI, load_corpus
+
+# Names in src.main that make up the stages of `process_query`
+_STAGES = {"filter": "filter_assistant", "apply": "filter_rows", "summary": "summary_assistant", "other": "other_assistant"}
+
+
+def percentiles(values) -> dict:
+    if not values:
+        return {"count": 0}
+    values = np.asarray(values, dtype=float)
+    return {
+        "count": int(len(values)),
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+    }
+
+
+class _Timings:
+    """
+    Per-stage wall times, collected by wrapping the pipeline functions in src.main.
+    """
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def wrap(self, stage: str, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.samples[stage].append(time.perf_counter() - start)
+        return timed
+
+    def add(self, stage: str, seconds: float):
+        self.samples[stage].append(seconds)
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def reset_caches():
+    """
+    Drops in-process caches so every query pays for its model calls.
+    """
+    from src import intent_detector, summariser
+    with intent_detector._memo_lock:
+        intent_detector._memo.clear()
+    with summariser._chunk_lock:
+        summariser._chunk_cache.clear()
+
+
+def bench_size(rows: int, queries: list, args, mock) -> dict:
+    import src.main as main
+    from src.intent_detector import detect_intent
+    from src.register import load_register, memory_usage
+
+    path = register_path(rows, args.seed)
+    result = {"rows": rows}
+
+    start = time.perf_counter()
+    load_register(path, use_cache=False, index=False)
+    result["parse_seconds"] = time.perf_counter() - start
+    start = time.perf_counter()
+    df = load_register(path)
+    result["load_seconds"] = time.perf_counter() - start
+    result["frame_bytes"] = memory_usage(df)
+
+    timings = _Timings()
+    originals = {name: getattr(main, name) for name in _STAGES.values()}
+    for stage, name in _STAGES.items():
+        setattr(main, name, timings.wrap(stage, originals[name]))
+
+    def one(query: str):
+        if args.cold:
+            reset_caches()
+        start = time.perf_counter()
+        intent = detect_intent(query)
+        timings.add("intent", time.perf_counter() - start)
+        main.process_query(query, df, intent)
+        timings.add("total", time.perf_counter() - start)
+
+    if mock is not None:
+        mock.reset()
+    if args.trace_memory:
+        tracemalloc.start()
+    errors = []
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [pool.submit(one, item["query"]) for _ in range(args.repeat) for item in queries]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(f"{type(e).__name__}: {e}")
+    finally:
+        wall = time.perf_counter() - start
+        for name, fn in originals.items():
+            setattr(main, name, fn)
+        if args.trace_memory:
+            result["tracemalloc_peak_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+
+    completed = len(queries) * args.repeat - len(errors)
+    result.update({
+        "queries": completed,
+        "errors": errors[:20],
+        "wall_seconds": wall,
+        "throughput_qps": completed / wall if wall else 0.0,
+        "stages": {stage: percentiles(samples) for stage, samples in timings.samples.items()},
+        "peak_rss_mb": peak_rss_mb(),
+    })
+
+    if mock is not None:
+        by_kind = defaultdict(list)
+        for request in mock.requests:
+            by_kind[request["kind"]].append(request)
+        result["payload"] = {
+            kind: {
+                "requests": len(requests),
+                "bytes": percentiles([r["bytes"] for r in requests]),
+                "prompt_tokens": percentiles([r["prompt_tokens"] for r in requests]),
+                "prompt_tokens_total": int(sum(r["prompt_tokens"] for r in requests)),
+                "completion_tokens_total": int(sum(r["completion_tokens"] for r in requests)),
+            }
+            for kind, requests in sorted(by_kind.items())
+        }
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 10_000, 100_000])
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="mock seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="mock generation speed (0 = instant)")
+    parser.add_argument("--summary-tokens", type=int, default=120)
+    parser.add_argument("--base-url", help="use this endpoint instead of starting the mock")
+    parser.add_argument("--plan-cache", action="store_true", help="keep the filter plan cache on (off by default)")
+    parser.add_argument("--cold", action="store_true", help="clear in-process caches before every query")
+    parser.add_argument("--trace-memory", action="store_true", help="also report the tracemalloc peak (slower)")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    queries = load_corpus(args.corpus)
+    mock = None
+    if args.base_url:
+        os.environ["OPENAI_BASE_URL"] = args.base_url
+    else:
+        mock = MockOpenAI(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                          summary_tokens=args.summary_tokens, corpus=queries).start()
+        os.environ["OPENAI_BASE_URL"] = mock.url
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    if not args.plan_cache:
+        os.environ["ROBO_PLAN_CACHE"] = "0"
+
+    # Clients are created on import, after the endpoint is set
+    start = time.perf_counter()
+    import src.main  # noqa: F401
+    import_seconds = time.perf_counter() - start
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "args": vars(args),
+            "import_seconds": import_seconds,
+        },
+        "results": [],
+    }
+    try:
+        for rows in args.rows:
+            report["results"].append(bench_size(rows, queries, args, mock))
+    finally:
+        if mock is not None:
+            mock.stop()
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
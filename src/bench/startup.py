@@ -0,0 +1,75 @@
+# startup.py
+"""
+Cold-import benchmark of the backend.
+
+    python -m src.bench.startup --runs 10
+    python -m src.bench.startup --module src.main --module ui_app --out startup.json
+
+Each run imports the module in a fresh interpreter (no API key set) and reports the
+wall time, whether the import succeeded, and the slowest imports from -X importtime.
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+
+def _import_once(module: str, env: dict) -> dict:
+    code = (
+        "import time; start = time.perf_counter(); import " + module +
+        "; print(time.perf_counter() - start)"
+    )
+    run = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, env=env)
+    if run.returncode != 0:
+        return {"ok": False, "error": (run.stderr.strip().splitlines() or [""])[-1]}
+
+    cumulative = {}
+    for line in run.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if cumulative_us.isdigit() and not name.startswith(" "):
+            cumulative[name] = int(cumulative_us)
+    top = sorted(((n, us) for n, us in cumulative.items() if "." not in n), key=lambda item: -item[1])[:10]
+    return {"ok": True, "seconds": float(run.stdout.strip().splitlines()[-1]), "top_level_imports_ms": {n: us / 1000 for n, us in top}}
+
+
+def measure(module: str, runs: int) -> dict:
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    results = [_import_once(module, env) for _ in range(runs)]
+    ok = [r for r in results if r["ok"]]
+    report = {"module": module, "runs": runs, "failures": runs - len(ok)}
+    if not ok:
+        report["error"] = results[0]["error"]
+        return report
+    seconds = sorted(r["seconds"] for r in ok)
+    report.update({
+        "median_seconds": statistics.median(seconds),
+        "min_seconds": seconds[0],
+        "max_seconds": seconds[-1],
+        "top_level_imports_ms": ok[len(ok) // 2]["top_level_imports_ms"],
+    })
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", action="append", help="module to import (default: src.main)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    report = [measure(module, args.runs) for module in (args.module or ["src.main"])]
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
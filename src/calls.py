@@ -0,0 +1,366 @@
+# calls.py
+"""
+One execution layer for every chat-completion call: deadlines, retries, hedging and fallback.
+
+    response = complete("filter", model="gpt-4.1", messages=messages, temperature=0)
+    response = await acomplete("summary", model="gpt-4o-mini", messages=messages)
+    for chunk in stream("other", model="gpt-4o-mini", messages=messages): ...
+
+Every stage has a policy (STAGE_POLICIES, overridable from the environment):
+
+- deadline: seconds for the whole call, retries included (ROBO_DEADLINE_<STAGE>, e.g.
+  ROBO_DEADLINE_SUMMARY_MAP); past it the call raises TimeoutError
+- retries: further attempts after a retryable error (timeout, connection error, 408/409/429,
+  5xx), spaced by full-jitter exponential backoff or the server's Retry-After (ROBO_CALL_RETRIES)
+- fallback: a cheaper, faster model (ROBO_FALLBACK_<STAGE>, "" for none), used for a retry
+  once the time left is below the primary model's p95 latency, and always for the last one
+- hedging (ROBO_HEDGE=1): a request not answered within its model's p95 latency gets a
+  duplicate, and the first answer wins
+
+Latency percentiles are learnt from the calls themselves. Streams are retried (and fall
+back) only until their first chunk arrives, and are not hedged. The SDK's own retries are
+switched off for these calls so attempts are not multiplied.
+"""
+
+import os
+import re
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterator, Optional
+
+from src.clients import get_async_client, get_client
+from src.rate_limit import parse_retry_after
+from src.tracing import bind, current
+
+# Per-stage deadline (seconds) and fallback model; the summary stages share their model
+STAGE_POLICIES = {
+    "intent": {"deadline": 10.0, "fallback": None},
+    "plan": {"deadline": 40.0, "fallback": "gpt-4.1-mini"},
+    "filter": {"deadline": 40.0, "fallback": "gpt-4.1-mini"},
+    "summary": {"deadline": 80.0, "fallback": "gpt-4.1-nano"},
+    "summary.map": {"deadline": 60.0, "fallback": "gpt-4.1-nano"},
+    "other": {"deadline": 80.0, "fallback": "gpt-4.1-nano"},
+}
+RETRIES = int(os.getenv("ROBO_CALL_RETRIES", "2"))
+HEDGE = os.getenv("ROBO_HEDGE", "0") == "1"
+_BACKOFF_BASE = 0.5
+_BACKOFF_CAP = 8.0
+# An attempt is abandoned (and retried) after this multiple of its model's p95 latency
+_ATTEMPT_P95_FACTOR = 4.0
+_MIN_ATTEMPT_SECONDS = 5.0
+# Latency samples kept per model, and needed before percentiles are trusted
+_WINDOW = 200
+_MIN_SAMPLES = 20
+_HEDGE_WORKERS = int(os.getenv("ROBO_HEDGE_WORKERS", "16"))
+
+
+def _policy(stage: str) -> dict:
+    policy = dict(STAGE_POLICIES.get(stage, {"deadline": 60.0, "fallback": None}))
+    key = stage.upper().replace(".", "_")
+    if os.getenv(f"ROBO_DEADLINE_{key}"):
+        policy["deadline"] = float(os.environ[f"ROBO_DEADLINE_{key}"])
+    if f"ROBO_FALLBACK_{key}" in os.environ:
+        policy["fallback"] = os.environ[f"ROBO_FALLBACK_{key}"] or None
+    return policy
+
+
+# ---- latency statistics -----------------------------------------------------------------------
+
+_latencies = {}
+_stats = {"calls": 0, "retries": 0, "fallbacks": 0, "hedges": 0, "hedge_wins": 0, "timeouts": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+
+def _record(key: str, seconds: float):
+    with _stats_lock:
+        _latencies.setdefault(key, deque(maxlen=_WINDOW)).append(seconds)
+
+
+def p95(key: str) -> Optional[float]:
+    """
+    95th percentile latency (seconds) of recent successful requests to `key` (a model,
+    or "<model>:stream" for time to first chunk), or None until enough are seen.
+    """
+    with _stats_lock:
+        samples = sorted(_latencies.get(key, ()))
+    if len(samples) < _MIN_SAMPLES:
+        return None
+    return samples[min(len(samples) - 1, int(0.95 * len(samples)))]
+
+
+def _count(name: str, amount: int = 1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def call_stats() -> dict:
+    """
+    Counters of the call layer and the p95 latency per model (for the debug view / benchmarks).
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+        keys = list(_latencies)
+    stats["p95_seconds"] = {key: p95(key) for key in keys}
+    return stats
+
+
+def reset_call_stats():
+    with _stats_lock:
+        _latencies.clear()
+        for name in _stats:
+            _stats[name] = 0
+
+
+def answered_by(response, model: str) -> bool:
+    """
+    Whether `response` came from `model` itself rather than a fallback. The API reports
+    the dated snapshot (e.g. "gpt-4.1-2025-04-14"), which is matched too.
+    """
+    name = getattr(response, "model", None) or ""
+    return name == model or re.fullmatch(re.escape(model) + r"-\d{4}-\d{2}-\d{2}", name) is not None
+
+
+# ---- attempt planning -------------------------------------------------------------------------
+
+def _retryable(error: BaseException) -> bool:
+    import openai
+
+    if isinstance(error, (openai.APIConnectionError, TimeoutError)):  # includes APITimeoutError
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def _backoff(attempt: int, error: BaseException) -> float:
+    response = getattr(error, "response", None)
+    retry_after = parse_retry_after(response.headers) if response is not None else None
+    jitter = random.uniform(0, min(_BACKOFF_CAP, _BACKOFF_BASE * 2 ** attempt))
+    return retry_after + jitter / 4 if retry_after is not None else jitter
+
+
+def _model_for(policy: dict, model: str, attempt: int, remaining: float, latency_key: str) -> str:
+    """
+    The primary model, or the fallback when this is the last retry or the deadline is at risk.
+    """
+    fallback = policy["fallback"]
+    if attempt == 0 or not fallback or fallback == model:
+        return model
+    expected = p95(latency_key)
+    if attempt >= RETRIES or (expected is not None and remaining < expected):
+        return fallback
+    return model
+
+
+def _attempt_timeout(key: str, remaining: float) -> float:
+    expected = p95(key)
+    if expected is None:
+        return remaining
+    return min(remaining, max(_MIN_ATTEMPT_SECONDS, expected * _ATTEMPT_P95_FACTOR))
+
+
+class _Call:
+    """
+    Bookkeeping of one logical call: deadline, attempts, and what goes on the current span.
+    """
+
+    def __init__(self, stage: str, model: str, stream: bool = False):
+        self.stage = stage
+        self.model = model
+        self.policy = _policy(stage)
+        self.deadline = time.monotonic() + self.policy["deadline"]
+        self.attempt = 0
+        self.stream = stream
+        self.error = None
+        _count("calls")
+
+    def key(self, model: str) -> str:
+        return f"{model}:stream" if self.stream else model
+
+    def next_model(self) -> str:
+        model = _model_for(self.policy, self.model, self.attempt, self.remaining(), self.key(self.model))
+        if model != self.model:
+            _count("fallbacks")
+            current().set(model=model, fallback_from=self.model)
+        return model
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def timed_out(self) -> TimeoutError:
+        _count("timeouts")
+        return TimeoutError(f"The {self.stage} call did not finish within {self.policy['deadline']:g}s")
+
+    def failed(self, error: BaseException) -> float:
+        """
+        Seconds to wait before the next attempt; raises if there is none to make.
+        """
+        if not _retryable(error) or self.attempt >= RETRIES:
+            _count("errors")
+            raise error
+        wait_seconds = _backoff(self.attempt, error)
+        if wait_seconds >= self.remaining():
+            raise self.timed_out() from error
+        self.attempt += 1
+        _count("retries")
+        current().add("retries")
+        return wait_seconds
+
+
+# ---- sync -------------------------------------------------------------------------------------
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _hedge_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=_HEDGE_WORKERS, thread_name_prefix="robo-hedge")
+    return _pool
+
+
+def _send(model: str, timeout: float, params: dict):
+    start = time.perf_counter()
+    client = get_client().with_options(max_retries=0, timeout=timeout)
+    response = client.chat.completions.create(model=model, **params)
+    _record(model, time.perf_counter() - start)
+    return response
+
+
+def _send_hedged(model: str, timeout: float, params: dict):
+    delay = p95(model) if HEDGE else None
+    if delay is None or delay >= timeout:
+        return _send(model, timeout, params)
+    pool = _hedge_pool()
+    start = time.monotonic()
+    first = pool.submit(bind(_send), model, timeout, params)
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+    _count("hedges")
+    current().add("hedged")
+    deadline = start + timeout
+    second = pool.submit(bind(_send), model, deadline - time.monotonic(), params)
+    pending, error = {first, second}, None
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                if future is second:
+                    _count("hedge_wins")
+                return future.result()
+            error = future.exception()
+    # The loser (or both, on timeout) finishes in the background and is discarded
+    raise error if error is not None else TimeoutError("Hedged request timed out")
+
+
+def complete(stage: str, *, model: str, **params):
+    """
+    `chat.completions.create(model=model, **params)` under the policy of `stage`.
+    """
+    call = _Call(stage, model)
+    while True:
+        remaining = call.remaining()
+        if remaining <= 0:
+            raise call.timed_out() from call.error
+        used = call.next_model()
+        try:
+            return _send_hedged(used, _attempt_timeout(used, remaining), params)
+        except Exception as e:
+            call.error = e
+            time.sleep(call.failed(e))
+
+
+def stream(stage: str, *, model: str, **params) -> Iterator:
+    """
+    Streaming `chat.completions.create`: retried until the first chunk, then passed through.
+    """
+    call = _Call(stage, model, stream=True)
+    while True:
+        remaining = call.remaining()
+        if remaining <= 0:
+            raise call.timed_out() from call.error
+        used = call.next_model()
+        start = time.perf_counter()
+        try:
+            client = get_client().with_options(max_retries=0, timeout=_attempt_timeout(call.key(used), remaining))
+            response = client.chat.completions.create(model=used, stream=True, **params)
+            chunks = iter(response)
+            first = next(chunks, None)
+        except Exception as e:
+            call.error = e
+            time.sleep(call.failed(e))
+            continue
+        _record(call.key(used), time.perf_counter() - start)
+        break
+    if first is not None:
+        yield first
+    yield from chunks
+
+
+# ---- async ------------------------------------------------------------------------------------
+
+async def _asend(model: str, timeout: float, params: dict):
+    start = time.perf_counter()
+    client = get_async_client().with_options(max_retries=0, timeout=timeout)
+    response = await client.chat.completions.create(model=model, **params)
+    _record(model, time.perf_counter() - start)
+    return response
+
+
+async def _asend_hedged(model: str, timeout: float, params: dict):
+    delay = p95(model) if HEDGE else None
+    if delay is None or delay >= timeout:
+        return await asyncio.wait_for(_asend(model, timeout, params), timeout)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    first = asyncio.ensure_future(_asend(model, timeout, params))
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result()
+    _count("hedges")
+    current().add("hedged")
+    second = asyncio.ensure_future(_asend(model, deadline - loop.time(), params))
+    pending, error = {first, second}, None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - loop.time()),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        _count("hedge_wins")
+                    return task.result()
+                error = task.exception()
+    finally:
+        for task in (first, second):
+            task.cancel()
+    raise error if error is not None else TimeoutError("Hedged request timed out")
+
+
+async def acomplete(stage: str, *, model: str, **params):
+    """
+    Async version of `complete`.
+    """
+    call = _Call(stage, model)
+    while True:
+        remaining = call.remaining()
+        if remaining <= 0:
+            raise call.timed_out() from call.error
+        used = call.next_model()
+        try:
+            return await _asend_hedged(used, _attempt_timeout(used, remaining), params)
+        except Exception as e:
+            call.error = e
+            await asyncio.sleep(call.failed(e))
@@ -0,0 +1,258 @@
+# chunked.py
+"""
+Out-of-core execution over register files too large to load in one frame.
+
+    rows = filter_file('filtered_df = df.loc[df["Status"] == "Open"]', "exports/all_contracts.csv")
+    rollups = aggregate_file("exports/all_contracts.csv", code=code, groups=["Risk Area"])
+
+    python -m src.chunked exports/all_contracts.csv --code 'filtered_df = df.loc[...]' --out open.csv
+    python -m src.chunked exports/all_contracts.csv --code 'filtered_df = df.loc[...]' --aggregate --workers 4
+
+The CSV is parsed ROBO_CHUNK_ROWS rows at a time, only the columns that are needed, and
+typed like the loaded register (register.apply_schema). Filter code goes through the same
+compiler and validation as in memory (filter_engine) and its predicate is evaluated on
+each chunk by a scan; the secondary indexes are built per frame, not per chunk. Only the
+matching rows are kept, or for aggregates only the running per-group counts and £ sums,
+so peak memory is a few chunks plus the result, whatever the size of the file. A result
+limited by `.head(n)` stops reading once it has n rows; one limited by `.nlargest(n, ...)`
+keeps only the n best rows so far. With `workers` > 0 chunks are evaluated in a process
+pool, with at most two chunks per worker in flight.
+
+Rows keep their position in the file (from 1) as their label, as `load_register` numbers them.
+"""
+
+import os
+import sys
+import json
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import chain
+from typing import Iterator, Optional
+
+import pandas as pd
+
+from src.filter_engine import apply_post, columns_of, compile_filter, mask, rejecting, validate
+from src.payload import GROUP_COLUMNS, MAX_GROUPS, SUM_COLUMNS, aggregate, frame_csv
+from src.register import DEFAULT_REGISTER_PATH, apply_schema, source_dtypes
+from src.result import RowSet
+from src.schema import CATEGORY_COLUMNS
+
+CHUNK_ROWS = int(os.getenv("ROBO_CHUNK_ROWS", "50000"))
+WORKERS = int(os.getenv("ROBO_CHUNK_WORKERS", "0"))
+_IN_FLIGHT_PER_WORKER = 2
+
+
+def iter_chunks(
+    path: str = DEFAULT_REGISTER_PATH,
+    chunk_rows: int = CHUNK_ROWS,
+    columns: Optional[list] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    The register file `chunk_rows` rows at a time, typed, labelled by row number from 1.
+    `columns` limits the columns parsed (default all); names not in the file are skipped.
+    At least one (possibly empty) chunk is yielded.
+    """
+    if chunk_rows < 1:
+        raise ValueError(f"chunk_rows must be at least 1, got {chunk_rows}")
+    header = list(pd.read_csv(path, nrows=0).columns)
+    usecols = header if columns is None else [c for c in header if c in set(columns)]
+    start = 1
+    with pd.read_csv(path, usecols=usecols, dtype=source_dtypes(usecols), chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            chunk = apply_schema(chunk)
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            start += len(chunk)
+            yield chunk
+
+
+def _concat(frames: list) -> pd.DataFrame:
+    """
+    Chunks (or parts of them) as one frame; categoricals whose categories differed
+    between chunks are re-encoded over all of them.
+    """
+    if len(frames) == 1:
+        return frames[0]
+    df = pd.concat(frames)
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype("category")
+    return df
+
+
+def _map(fn, chunks: Iterator[pd.DataFrame], workers: int) -> Iterator:
+    """
+    `fn` of every chunk, in order; in a process pool when `workers` > 0, reading ahead
+    at most `_IN_FLIGHT_PER_WORKER` chunks per worker.
+    """
+    if workers <= 0:
+        for chunk in chunks:
+            yield fn(chunk)
+        return
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        try:
+            for chunk in chunks:
+                pending.append(pool.submit(fn, chunk))
+                if len(pending) >= workers * _IN_FLIGHT_PER_WORKER:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # A consumer that stops early (a `.head(n)` filled up) does not wait for the rest
+            for future in pending:
+                future.cancel()
+
+
+def _plan(code: Optional[str]) -> tuple:
+    if code is None:
+        return ("all",), ()
+    return compile_filter(code)
+
+
+def _needed_columns(plan: tuple, columns: Optional[list]) -> Optional[list]:
+    """
+    The columns to parse: those wanted in the result plus those the filter reads.
+    """
+    if columns is None:
+        return None
+    predicate, post = plan
+    return list(dict.fromkeys(list(columns) + columns_of(predicate) + [c for op in post for c in columns_of(op)]))
+
+
+def _first_validated(plan: tuple, chunks: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    """
+    `chunks`, after validating `plan` against the schema of the first one.
+    """
+    first = next(chunks)
+    validate(plan, first)
+    return chain([first], chunks)
+
+
+# ---- per-chunk work (module level, so it can run in pool processes) ------------------------------
+
+def _match_chunk(predicate: tuple, chunk: pd.DataFrame) -> pd.DataFrame:
+    if predicate == ("all",):
+        return chunk
+    with rejecting():
+        return chunk[mask(predicate, chunk)]
+
+
+def _rollup_chunk(predicate: tuple, groups: list, chunk: pd.DataFrame) -> tuple:
+    """
+    Returns: (number of matching rows, £ totals, {group column: counts and £ sums per value})
+    """
+    chunk = _match_chunk(predicate, chunk)
+    sums = [c for c in SUM_COLUMNS if c in chunk.columns and pd.api.types.is_numeric_dtype(chunk[c])]
+    tables = {}
+    for group in (c for c in groups if c in chunk.columns):
+        # Grouped by plain values: categories differ from chunk to chunk
+        grouped = chunk.groupby(chunk[group].astype(object), dropna=False)
+        table = grouped[sums].sum() if sums else pd.DataFrame(index=grouped.size().index)
+        table.insert(0, "count", grouped.size())
+        tables[group] = table
+    return len(chunk), chunk[sums].sum(), tables
+
+
+# ---- entry points -------------------------------------------------------------------------------
+
+def filter_file(
+    code: str,
+    path: str = DEFAULT_REGISTER_PATH,
+    columns: Optional[list] = None,
+    chunk_rows: int = CHUNK_ROWS,
+    workers: int = WORKERS,
+) -> pd.DataFrame:
+    """
+    The rows of the register file `path` that `code` selects, sorting and limits applied,
+    with only `columns` (default all). Same result as `apply_filter(code, load_register(path))`
+    without loading the file: memory is the matching rows plus a few chunks.
+    """
+    plan = _plan(code)
+    predicate, post = plan
+    chunks = _first_validated(plan, iter_chunks(path, chunk_rows, _needed_columns(plan, columns)))
+    bound = post[0] if post and post[0][0] in ("head", "nlargest", "nsmallest") else None
+
+    kept, kept_rows = [], 0
+    for matches in _map(partial(_match_chunk, predicate), chunks, workers):
+        if matches.empty and kept:
+            continue
+        kept.append(matches)
+        kept_rows += len(matches)
+        if bound is not None and bound[0] == "head":
+            if kept_rows >= bound[1]:
+                break
+        elif bound is not None and len(kept) > 1:
+            # The n best rows so far are all a later chunk can compete with
+            kept = [apply_post(RowSet.all(_concat(kept)), (bound,)).frame]
+
+    rows = apply_post(RowSet.all(_concat(kept)), post)
+    return rows.frame if columns is None else rows.take(list(columns))
+
+
+def aggregate_file(
+    path: str = DEFAULT_REGISTER_PATH,
+    code: Optional[str] = None,
+    groups: Optional[list] = None,
+    chunk_rows: int = CHUNK_ROWS,
+    workers: int = WORKERS,
+) -> dict:
+    """
+    `payload.aggregate` of the rows of the register file `path` that `code` selects (all
+    rows without `code`), from running per-chunk counts and £ sums. A result limited by
+    `.head(n)` or `.nlargest(n, ...)` is small: it is filtered first and rolled up in memory.
+    """
+    groups = GROUP_COLUMNS if groups is None else list(groups)
+    predicate, post = plan = _plan(code)
+    read = _needed_columns(plan, groups + SUM_COLUMNS)
+    if any(op[0] in ("head", "nlargest", "nsmallest") for op in post):
+        return aggregate(filter_file(code, path, read, chunk_rows, workers), groups)
+    chunks = _first_validated(plan, iter_chunks(path, chunk_rows, read))
+
+    row_count, totals, tables = 0, None, {}
+    for count, chunk_totals, chunk_tables in _map(partial(_rollup_chunk, predicate, groups), chunks, workers):
+        row_count += count
+        totals = chunk_totals if totals is None else totals.add(chunk_totals, fill_value=0)
+        for group, table in chunk_tables.items():
+            if group in tables:
+                table = pd.concat([tables[group], table]).groupby(level=0, dropna=False).sum()
+            tables[group] = table
+
+    result = {"row_count": int(row_count)}
+    if totals is not None and len(totals):
+        result["totals"] = {c: float(totals[c]) for c in totals.index}
+    for group, table in tables.items():
+        table = table.rename_axis(group).reset_index()
+        table = table.sort_values("count", ascending=False).head(MAX_GROUPS)
+        result[f"by {group}"] = frame_csv(table)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", nargs="?", default=DEFAULT_REGISTER_PATH)
+    parser.add_argument("--code", help="filter code in the filter assistant's grammar (default: every row)")
+    parser.add_argument("--columns", nargs="+", help="columns to write (default all)")
+    parser.add_argument("--aggregate", action="store_true", help="write rollups (JSON) instead of the rows")
+    parser.add_argument("--group", action="append", help="rollup column (repeatable; default area, region, status, owner)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="processes evaluating chunks (0 = in this one)")
+    parser.add_argument("--out", help="write here instead of stdout")
+    args = parser.parse_args(argv)
+
+    if args.aggregate:
+        result = aggregate_file(args.path, args.code, args.group, args.chunk_rows, args.workers)
+        text = json.dumps(result, indent=2) + "\n"
+    else:
+        code = args.code or "filtered_df = df"
+        text = filter_file(code, args.path, args.columns, args.chunk_rows, args.workers).to_csv(index_label="Row")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+
+
+if __name__ == "__main__":
+    main()
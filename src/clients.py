@@ -0,0 +1,126 @@
+# clients.py
+"""
+Shared OpenAI clients for all assistants.
+
+Clients are created on first use, not on import, so importing the backend needs
+neither an API key nor the openai package to be loaded. Every assistant shares one
+sync client (one keep-alive connection pool across threads) and one async client per
+event loop. Pool limits and timeouts come from the environment:
+
+    ROBO_HTTP_MAX_CONNECTIONS   (20)    ROBO_HTTP_MAX_KEEPALIVE   (10)
+    ROBO_HTTP_KEEPALIVE_EXPIRY  (30 s)  ROBO_HTTP_CONNECT_TIMEOUT (5 s)
+    ROBO_HTTP_TIMEOUT           (120 s, read/write/pool)
+    ROBO_OPENAI_MAX_RETRIES     (2)
+"""
+
+import os
+import asyncio
+import threading
+import weakref
+
+from src.fetch_key import get_openai_key
+
+_MAX_CONNECTIONS = int(os.getenv("ROBO_HTTP_MAX_CONNECTIONS", "20"))
+_MAX_KEEPALIVE = int(os.getenv("ROBO_HTTP_MAX_KEEPALIVE", "10"))
+_KEEPALIVE_EXPIRY = float(os.getenv("ROBO_HTTP_KEEPALIVE_EXPIRY", "30"))
+_CONNECT_TIMEOUT = float(os.getenv("ROBO_HTTP_CONNECT_TIMEOUT", "5"))
+_TIMEOUT = float(os.getenv("ROBO_HTTP_TIMEOUT", "120"))
+_MAX_RETRIES = int(os.getenv("ROBO_OPENAI_MAX_RETRIES", "2"))
+
+_lock = threading.Lock()
+_api_key = None
+_client = None
+_rate_limiter = None
+# AsyncOpenAI connections belong to the loop that opened them
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _key() -> str:
+    global _api_key
+    if _api_key is None:
+        _api_key = get_openai_key()
+        if not _api_key:
+            raise RuntimeError("OPENAI_API_KEY not found—please set it in your .env or shell or add to secrets.")
+    return _api_key
+
+
+def _pool_settings() -> dict:
+    import openai
+
+    # openai re-exports its HTTP library's Limits/Timeout types; use them rather than importing it directly
+    limits = type(openai.DEFAULT_CONNECTION_LIMITS)(
+        max_connections=_MAX_CONNECTIONS,
+        max_keepalive_connections=_MAX_KEEPALIVE,
+        keepalive_expiry=_KEEPALIVE_EXPIRY,
+    )
+    return {"limits": limits, "timeout": openai.Timeout(_TIMEOUT, connect=_CONNECT_TIMEOUT)}
+
+
+def get_client():
+    """
+    The shared `OpenAI` client (created on first call).
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                import openai
+
+                settings = _pool_settings()
+                if _rate_limiter is not None:
+                    settings["event_hooks"] = _rate_limiter.hooks()
+                _client = openai.OpenAI(
+                    api_key=_key(),
+                    timeout=settings["timeout"],
+                    max_retries=_MAX_RETRIES,
+                    http_client=openai.DefaultHttpxClient(**settings),
+                )
+    return _client
+
+
+def get_async_client():
+    """
+    The shared `AsyncOpenAI` client of the running event loop (created on first call).
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        with _lock:
+            client = _async_clients.get(loop)
+            if client is None:
+                import openai
+
+                settings = _pool_settings()
+                if _rate_limiter is not None:
+                    settings["event_hooks"] = _rate_limiter.async_hooks()
+                client = openai.AsyncOpenAI(
+                    api_key=_key(),
+                    timeout=settings["timeout"],
+                    max_retries=_MAX_RETRIES,
+                    http_client=openai.DefaultAsyncHttpxClient(**settings),
+                )
+                _async_clients[loop] = client
+    return client
+
+
+def reset_clients():
+    """
+    Drops the shared clients (e.g. after the key or base URL changed); they are rebuilt on next use.
+    The old clients are not closed: calls still running on other threads keep using them, and
+    their connection pools are released once the last of those calls lets go of them.
+    """
+    global _api_key, _client
+    with _lock:
+        _api_key = None
+        _client = None
+        _async_clients.clear()
+
+
+def set_rate_limiter(limiter):
+    """
+    Routes every model call through `limiter` (a rate_limit.RateLimiter), or removes it with None.
+    """
+    global _rate_limiter
+    reset_clients()
+    with _lock:
+        _rate_limiter = limiter
@@ -0,0 +1,116 @@
+# evaluate_intent.py
+"""
+Offline evaluation of the local intent classifier against the LLM labels.
+
+    python -m src.evaluate_intent data/intent_queries.txt
+    python -m src.evaluate_intent labelled.jsonl --thresholds 0.7 0.8 0.9 --save-labels labelled.jsonl
+
+Input is either plain text (one query per line) or JSONL with {"query": ..., "labels": [...]}.
+Queries without labels are sent to the LLM (gpt-4.1-nano) once to get the reference label.
+As in `detect_intent`, the LLM gets the query as typed and the local classifier its normalised form.
+"""
+
+import sys
+import json
+import time
+import argparse
+
+from src.intent_classifier import LABELS, classify
+from src.plan_cache import normalize_query
+
+
+def load_queries(path: str) -> list:
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                item = json.loads(line)
+                items.append({"query": item["query"], "labels": item.get("labels"), "llm_seconds": item.get("llm_seconds")})
+            else:
+                items.append({"query": line, "labels": None, "llm_seconds": None})
+    return items
+
+
+def label_with_llm(items: list) -> list:
+    """
+    Fills in missing reference labels (and their latency) from the LLM.
+    """
+    missing = [item for item in items if item["labels"] is None]
+    if not missing:
+        return items
+    from src.intent_detector import llm_detect_intent
+
+    for item in missing:
+        start = time.perf_counter()
+        labels = llm_detect_intent(item["query"])
+        item["llm_seconds"] = time.perf_counter() - start
+        item["labels"] = [label for label in LABELS if label in labels]
+    return items
+
+
+def evaluate(items: list, thresholds) -> dict:
+    """
+    Agreement, coverage and latency saved for each confidence threshold.
+    """
+    local = []
+    for item in items:
+        start = time.perf_counter()
+        labels, confidence = classify(normalize_query(item["query"]))
+        local.append({"labels": labels, "confidence": confidence, "seconds": time.perf_counter() - start})
+
+    n = len(items)
+    llm_seconds = [item["llm_seconds"] or 0.0 for item in items]
+    report = {
+        "queries": n,
+        "local_mean_us": 1e6 * sum(r["seconds"] for r in local) / n if n else 0.0,
+        "llm_mean_seconds": sum(llm_seconds) / n if n else 0.0,
+        "unthresholded_agreement": sum(r["labels"] == i["labels"] for r, i in zip(local, items)) / n if n else 0.0,
+        "per_label_agreement": {
+            label: sum((label in r["labels"]) == (label in i["labels"]) for r, i in zip(local, items)) / n if n else 0.0
+            for label in LABELS
+        },
+        "thresholds": [],
+    }
+
+    for threshold in thresholds:
+        answered = [k for k, r in enumerate(local) if r["confidence"] >= threshold]
+        agree = sum(local[k]["labels"] == items[k]["labels"] for k in answered)
+        saved = sum(llm_seconds[k] - local[k]["seconds"] for k in answered)
+        report["thresholds"].append({
+            "threshold": threshold,
+            "coverage": len(answered) / n if n else 0.0,
+            "local_precision": agree / len(answered) if answered else None,
+            # Final answers agree whenever the local answer matched or the LLM was used
+            "end_to_end_agreement": (agree + n - len(answered)) / n if n else 0.0,
+            "llm_calls_saved": len(answered),
+            "latency_saved_seconds": saved,
+            "disagreements": [
+                {"query": items[k]["query"], "llm": items[k]["labels"], "local": local[k]["labels"]}
+                for k in answered if local[k]["labels"] != items[k]["labels"]
+            ],
+        })
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("queries", help="text file (one query per line) or JSONL with query/labels")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.99])
+    parser.add_argument("--save-labels", help="write the labelled queries (JSONL) for reuse or retraining")
+    args = parser.parse_args(argv)
+
+    items = label_with_llm(load_queries(args.queries))
+    if args.save_labels:
+        with open(args.save_labels, "w", encoding="utf-8") as f:
+            for item in items:
+                f.write(json.dumps(item) + "\n")
+
+    json.dump(evaluate(items, args.thresholds), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,21 @@
 import os
-from pathlib import Path
-import streamlit as st
-from dotenv import load_dotenv
 
 def get_openai_key() -> str | None:
-    # Load .env for local dev
-    load_dotenv()  # looks for .env up the tree
+    # Load .env for local dev; imported here so the key lookup never needs python-dotenv up front
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()  # looks for .env up the tree
+    except ImportError:
+        pass
 
     # 1) Try environment first (local dev / Docker / CI)
     key = os.getenv("OPENAI_API_KEY")
     if key:
         return key
 
-    # 2) Try Streamlit secrets (deployed)
+    # 2) Try Streamlit secrets (deployed); imported here so headless use never loads Streamlit
     try:
+        import streamlit as st
         return st.secrets["OPENAI_API_KEY"]
     except Exception:
         return None
\ No newline at end of file
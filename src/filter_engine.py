@@ -0,0 +1,789 @@
+# filter_engine.py
+
+import re
+import ast
+import operator
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from src.indexes import TEXT_COLUMNS, get_index
+from src.result import RowSet
+from src.retrieval import MIN_SCORE, similar_mask
+
+
+class FilterRejected(ValueError):
+    """
+    Raised when generated filter code falls outside the allowed grammar or schema.
+    """
+
+
+# ---- IR -----------------------------------------------------------------------------------------
+#
+# Predicates (tuples, so plans are hashable and their repr is their normalised form):
+#   ("all",)                                   every row
+#   ("and", p, q) / ("or", p, q) / ("not", p)
+#   ("cmp", column, op, value)                 op in ==, !=, <, <=, >, >=
+#   ("contains", column, pattern, case, regex)
+#   ("startswith", column, text) / ("endswith", column, text)
+#   ("similar", column, text, min_score)      semantic match on a free-text column (retrieval.py)
+#   ("isin", column, values)
+#   ("between", column, low, high, inclusive)
+#   ("isna", column) / ("notna", column)
+#   ("flag", column)                           truthy boolean column
+# Columns: ("col", name, transforms), transforms being "datetime", "str", _STR_TRANSFORMS or _DT_TRANSFORMS
+# Values:  ("lit", v) / ("ts", text) / ("today",) / ("offset", kind, kwargs) / ("arith", op, a, b)
+# Post-ops applied to the filtered frame: ("sort", columns, ascending) / ("head", n) /
+#   ("nlargest", n, column) / ("nsmallest", n, column) / ("reset_index",)
+
+_COMPARE_OPS = {
+    ast.Eq: "==", ast.NotEq: "!=", ast.Lt: "<", ast.LtE: "<=", ast.Gt: ">", ast.GtE: ">=",
+}
+_SWAPPED = {"==": "==", "!=": "!=", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
+_OPERATORS = {
+    "==": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+}
+_NA_METHODS = {"isna": "isna", "isnull": "isna", "notna": "notna", "notnull": "notna"}
+_STR_TRANSFORMS = {"lower", "upper", "strip"}
+_DT_TRANSFORMS = {"year", "month", "quarter", "day"}
+_OFFSET_KEYS = {"Timedelta": {"days", "weeks", "hours"}, "DateOffset": {"days", "weeks", "months", "years", "hours"}}
+_ORDERED_OPS = {"<", "<=", ">", ">="}
+# Lookarounds and backreferences: not supported by the Arrow (RE2) string kernels
+_UNSUPPORTED_GROUPS = ("(?=", "(?!", "(?<=", "(?<!", "(?P=", "(?(")
+_BACKREFERENCE_RE = re.compile(r"\\[1-9]")
+_GROUP_PREFIX_RE = re.compile(r"(?:\?(?:P<\w+>|[aiLmsux-]*:|>)?)?")
+_QUANTIFIER_RE = re.compile(r"(?:(?P<star>[*+])|\?|\{\d*(?P<comma>,)?(?P<upper>\d*)\})[?+]?")
+_MAX_PATTERN = 200
+_FRAME_NAME = "df"
+_RESULT_NAME = "filtered_df"
+
+
+class _Compiler:
+    """
+    Walks the AST of generated code and builds the IR, rejecting anything else.
+    """
+
+    def __init__(self):
+        self.names = {}
+
+    # ---- statements -----------------------------------------------------------------------------
+
+    def module(self, tree: ast.Module) -> tuple:
+        result = None
+        for stmt in tree.body:
+            if isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Constant) and isinstance(stmt.value.value, str):
+                continue  # stray docstring/comment string
+            if not isinstance(stmt, ast.Assign) or len(stmt.targets) != 1 or not isinstance(stmt.targets[0], ast.Name):
+                raise FilterRejected(f"Only simple assignments are allowed, got: {ast.unparse(stmt)}")
+            name = stmt.targets[0].id
+            if name == _FRAME_NAME:
+                raise FilterRejected("The register `df` cannot be reassigned")
+            if name == _RESULT_NAME:
+                result = self.frame(stmt.value)
+            else:
+                self.names[name] = self.predicate(stmt.value)
+        if result is None:
+            raise FilterRejected(f"The code must assign `{_RESULT_NAME}`")
+        return result
+
+    def frame(self, node) -> tuple:
+        """
+        `df`, `df.loc[pred]`, `df[pred]`, `df.loc[pred, :]`, followed by safe post-ops.
+        """
+        post = []
+        while isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            method = node.func.attr
+            if method == "copy" and not node.args:
+                pass
+            elif method == "reset_index":
+                if node.args or any(k.arg != "drop" or not self._literal(k.value) for k in node.keywords):
+                    raise FilterRejected("Only reset_index(drop=True) is allowed")
+                post.append(("reset_index",))
+            elif method == "head":
+                post.append(("head", self._int(node.args[0] if node.args else ast.Constant(5))))
+            elif method in ("nlargest", "nsmallest"):
+                kwargs = {k.arg: k.value for k in node.keywords}
+                n_node = node.args[0] if node.args else kwargs.get("n")
+                col_node = node.args[1] if len(node.args) > 1 else kwargs.get("columns")
+                if n_node is None or col_node is None:
+                    raise FilterRejected(f"{method} needs n and a column")
+                post.append((method, self._int(n_node), self._column_name(col_node)))
+            elif method == "sort_values":
+                kwargs = {k.arg: k.value for k in node.keywords}
+                by = node.args[0] if node.args else kwargs.get("by")
+                if by is None or set(kwargs) - {"by", "ascending", "na_position"}:
+                    raise FilterRejected("sort_values only supports by=, ascending=, na_position=")
+                columns = self._literal(by)
+                columns = [columns] if isinstance(columns, str) else list(columns)
+                ascending = self._literal(kwargs["ascending"]) if "ascending" in kwargs else True
+                post.append(("sort", tuple(columns), ascending if isinstance(ascending, bool) else tuple(ascending)))
+            else:
+                raise FilterRejected(f"Method `{method}` is not allowed on the filtered frame")
+            node = node.func.value
+
+        if isinstance(node, ast.Name) and node.id == _FRAME_NAME:
+            return ("all",), tuple(reversed(post))
+        if isinstance(node, ast.Subscript):
+            target = node.value
+            index = node.slice
+            if isinstance(target, ast.Attribute) and target.attr == "loc" and self._is_df(target.value):
+                if isinstance(index, ast.Tuple):
+                    if len(index.elts) != 2 or not (isinstance(index.elts[1], ast.Slice) and index.elts[1].lower is None
+                                                    and index.elts[1].upper is None):
+                        raise FilterRejected("Column selection in .loc is not allowed")
+                    index = index.elts[0]
+                return self.predicate(index), tuple(reversed(post))
+            if self._is_df(target):
+                return self.predicate(index), tuple(reversed(post))
+        raise FilterRejected(f"Unsupported frame expression: {ast.unparse(node)}")
+
+    # ---- predicates ---------------------------------------------------------------------------
+
+    def predicate(self, node) -> tuple:
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.BitAnd, ast.BitOr)):
+            kind = "and" if isinstance(node.op, ast.BitAnd) else "or"
+            return (kind, self.predicate(node.left), self.predicate(node.right))
+        if isinstance(node, ast.BoolOp):
+            kind = "and" if isinstance(node.op, ast.And) else "or"
+            result = self.predicate(node.values[0])
+            for value in node.values[1:]:
+                result = (kind, result, self.predicate(value))
+            return result
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Invert):
+            return ("not", self.predicate(node.operand))
+        if isinstance(node, ast.Name) and node.id in self.names:
+            return self.names[node.id]
+        if isinstance(node, ast.Compare):
+            return self._compare(node)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            return self._method_predicate(node)
+        if self._is_column(node):
+            return ("flag", self.column(node))
+        raise FilterRejected(f"Unsupported condition: {ast.unparse(node)}")
+
+    def _compare(self, node: ast.Compare) -> tuple:
+        if len(node.ops) == 2 and type(node.ops[0]) in (ast.Lt, ast.LtE) and type(node.ops[1]) in (ast.Lt, ast.LtE):
+            # low <= df[col] <= high
+            low, column, high = node.left, node.comparators[0], node.comparators[1]
+            left = ("cmp", self.column(column), _SWAPPED[_COMPARE_OPS[type(node.ops[0])]], self.value(low))
+            right = ("cmp", self.column(column), _COMPARE_OPS[type(node.ops[1])], self.value(high))
+            return ("and", left, right)
+        if len(node.ops) != 1 or type(node.ops[0]) not in _COMPARE_OPS:
+            raise FilterRejected(f"Unsupported comparison: {ast.unparse(node)}")
+        op = _COMPARE_OPS[type(node.ops[0])]
+        left, right = node.left, node.comparators[0]
+        if self._is_column(left):
+            return ("cmp", self.column(left), op, self.value(right))
+        if self._is_column(right):
+            return ("cmp", self.column(right), _SWAPPED[op], self.value(left))
+        raise FilterRejected(f"A comparison must involve a column: {ast.unparse(node)}")
+
+    def _method_predicate(self, node: ast.Call) -> tuple:
+        func = node.func
+        method = func.attr
+        kwargs = {k.arg: k.value for k in node.keywords}
+
+        # df[col].str.similar_to("topic", min_score=...)
+        if isinstance(func.value, ast.Attribute) and func.value.attr == "str" and method == "similar_to":
+            column = self.column(func.value.value)
+            text = self._literal(node.args[0]) if node.args else None
+            if not isinstance(text, str) or not text.strip() or len(text) > _MAX_PATTERN:
+                raise FilterRejected("str.similar_to needs a short description of the topic")
+            if set(kwargs) - {"min_score"}:
+                raise FilterRejected("str.similar_to only supports min_score=")
+            min_score = self._literal(kwargs["min_score"]) if "min_score" in kwargs else MIN_SCORE
+            if isinstance(min_score, bool) or not isinstance(min_score, (int, float)) or not 0 < min_score < 1:
+                raise FilterRejected("min_score must be a number between 0 and 1")
+            return ("similar", column, text, float(min_score))
+
+        # df[col].str.contains(...) / startswith / endswith
+        if isinstance(func.value, ast.Attribute) and func.value.attr == "str" and method in (
+            "contains", "startswith", "endswith"
+        ):
+            column = self.column(func.value.value)
+            if not node.args:
+                raise FilterRejected(f"str.{method} needs a pattern")
+            pattern = self._literal(node.args[0])
+            if not isinstance(pattern, str) or len(pattern) > _MAX_PATTERN:
+                raise FilterRejected(f"str.{method} needs a short string pattern")
+            if method != "contains":
+                if set(kwargs) - {"na"}:
+                    raise FilterRejected(f"Unsupported arguments to str.{method}")
+                return (method, column, pattern)
+            if set(kwargs) - {"case", "na", "regex", "flags"}:
+                raise FilterRejected("Unsupported arguments to str.contains")
+            case = self._literal(kwargs["case"]) if "case" in kwargs else True
+            regex = self._literal(kwargs["regex"]) if "regex" in kwargs else True
+            if "flags" in kwargs:
+                case = False  # re.IGNORECASE is the only flag models use here
+            if regex:
+                _check_regex(pattern)
+            return ("contains", column, pattern, bool(case), bool(regex))
+
+        if not self._is_column(func.value):
+            raise FilterRejected(f"Unsupported call: {ast.unparse(node)}")
+        column = self.column(func.value)
+
+        if method == "isin":
+            values = self._literal(node.args[0]) if node.args else None
+            if not isinstance(values, (list, tuple, set)):
+                raise FilterRejected("isin needs a literal list")
+            return ("isin", column, tuple(values))
+        if method == "between":
+            if len(node.args) < 2:
+                raise FilterRejected("between needs low and high")
+            inclusive = self._literal(kwargs["inclusive"]) if "inclusive" in kwargs else "both"
+            return ("between", column, self.value(node.args[0]), self.value(node.args[1]), inclusive)
+        if method in _NA_METHODS and not node.args:
+            return (_NA_METHODS[method], column)
+        raise FilterRejected(f"Method `{method}` is not allowed in a condition")
+
+    # ---- columns and values -----------------------------------------------------------------
+
+    def _is_df(self, node) -> bool:
+        return isinstance(node, ast.Name) and node.id == _FRAME_NAME
+
+    def _is_column(self, node) -> bool:
+        try:
+            self.column(node)
+            return True
+        except FilterRejected:
+            return False
+
+    def _column_name(self, node) -> str:
+        name = self._literal(node)
+        if not isinstance(name, str):
+            raise FilterRejected(f"Column names must be string literals: {ast.unparse(node)}")
+        return name
+
+    def column(self, node) -> tuple:
+        """
+        `df["col"]` with optional to_datetime / .str.lower() / .dt.year / .astype(str) transforms.
+        """
+        if isinstance(node, ast.Subscript) and self._is_df(node.value):
+            return ("col", self._column_name(node.slice), ())
+        if isinstance(node, ast.Call):
+            func = node.func
+            # pd.to_datetime(df["col"], errors=..., format=...)
+            if (isinstance(func, ast.Attribute) and func.attr == "to_datetime" and isinstance(func.value, ast.Name)
+                    and func.value.id == "pd" and node.args and self._is_column(node.args[0])):
+                _, name, transforms = self.column(node.args[0])
+                return ("col", name, transforms + ("datetime",))
+            if isinstance(func, ast.Attribute):
+                # df["col"].str.lower()
+                if isinstance(func.value, ast.Attribute) and func.value.attr == "str" and func.attr in _STR_TRANSFORMS \
+                        and not node.args:
+                    _, name, transforms = self.column(func.value.value)
+                    return ("col", name, transforms + (func.attr,))
+                # df["col"].astype(str)
+                if func.attr == "astype" and len(node.args) == 1 and isinstance(node.args[0], ast.Name) \
+                        and node.args[0].id == "str":
+                    _, name, transforms = self.column(func.value)
+                    return ("col", name, transforms + ("str",))
+        # df["col"].dt.year
+        if isinstance(node, ast.Attribute) and node.attr in _DT_TRANSFORMS and isinstance(node.value, ast.Attribute) \
+                and node.value.attr == "dt":
+            _, name, transforms = self.column(node.value.value)
+            return ("col", name, transforms + (node.attr,))
+        raise FilterRejected(f"Not a column: {ast.unparse(node)}")
+
+    def value(self, node) -> tuple:
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub)):
+            return ("arith", "+" if isinstance(node.op, ast.Add) else "-", self.value(node.left), self.value(node.right))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            func = node.func
+            # pd.Timestamp("2025-01-01") / pd.to_datetime("2025-01-01")
+            if isinstance(func.value, ast.Name) and func.value.id == "pd" and func.attr in ("Timestamp", "to_datetime"):
+                text = self._literal(node.args[0]) if node.args else None
+                if not isinstance(text, str):
+                    raise FilterRejected(f"pd.{func.attr} needs a date string")
+                _check_date(text)
+                return ("ts", text)
+            # pd.Timestamp.today() / pd.Timestamp.now()
+            if func.attr in ("today", "now") and isinstance(func.value, ast.Attribute) \
+                    and func.value.attr == "Timestamp" and not node.args:
+                return ("today",)
+            # pd.Timedelta(days=30) / pd.DateOffset(months=3)
+            if isinstance(func.value, ast.Name) and func.value.id == "pd" and func.attr in ("Timedelta", "DateOffset"):
+                kwargs = {k.arg: self._literal(k.value) for k in node.keywords}
+                allowed = _OFFSET_KEYS[func.attr]
+                if node.args or not kwargs or set(kwargs) - allowed:
+                    raise FilterRejected(f"pd.{func.attr} only supports the keyword offsets {', '.join(sorted(allowed))}")
+                if any(isinstance(v, bool) or not isinstance(v, (int, float)) for v in kwargs.values()):
+                    raise FilterRejected(f"pd.{func.attr} offsets must be numbers")
+                value = ("offset", func.attr, tuple(sorted(kwargs.items())))
+                _checked_resolve(value)
+                return value
+        literal = self._literal(node)
+        if isinstance(literal, (list, set)):
+            literal = tuple(literal)
+        return ("lit", literal)
+
+    def _literal(self, node):
+        try:
+            return ast.literal_eval(node)
+        except (ValueError, TypeError, SyntaxError):
+            raise FilterRejected(f"Expected a literal value, got: {ast.unparse(node)}") from None
+
+    def _int(self, node) -> int:
+        value = self._literal(node)
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise FilterRejected("Row limits must be non-negative integers")
+        return value
+
+
+# ---- validation -------------------------------------------------------------------------------
+
+def _check_regex(pattern: str):
+    """
+    Rejects patterns that do not compile, that the Arrow string kernels cannot run, or
+    with nested unbounded quantifiers such as `(a+)+`, which backtrack catastrophically.
+    """
+    try:
+        re.compile(pattern)
+    except re.error as e:
+        raise FilterRejected(f"Invalid regular expression {pattern!r}: {e}") from None
+    _check_repeats(pattern)
+
+
+def _check_repeats(pattern: str):
+    """
+    One pass over a pattern that compiles: `groups` holds, for each open group, whether an
+    unbounded quantifier occurs inside it, and a group repeated without bound must not.
+    """
+    groups = [False]
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        inner = False  # the atom just read contains an unbounded quantifier
+        if char == "\\":
+            if _BACKREFERENCE_RE.match(pattern, i):
+                raise FilterRejected(f"Lookarounds and backreferences are not supported: {pattern!r}")
+            i += 2
+        elif char == "[":
+            i = _class_end(pattern, i)
+        elif char == "(":
+            if pattern.startswith(_UNSUPPORTED_GROUPS, i):
+                raise FilterRejected(f"Lookarounds and backreferences are not supported: {pattern!r}")
+            groups.append(False)
+            i = _GROUP_PREFIX_RE.match(pattern, i + 1).end()
+            continue
+        elif char == ")":
+            inner = groups.pop()
+            i += 1
+        elif char == "|":
+            i += 1
+            continue
+        else:
+            i += 1
+        quantifier = _QUANTIFIER_RE.match(pattern, i)
+        unbounded = bool(quantifier) and bool(quantifier["star"] or (quantifier["comma"] and not quantifier["upper"]))
+        if unbounded and inner:
+            raise FilterRejected(f"Nested repetition is not allowed in a pattern: {pattern!r}")
+        groups[-1] = groups[-1] or inner or unbounded
+        if quantifier:
+            i = quantifier.end()
+
+
+def _class_end(pattern: str, start: int) -> int:
+    """
+    Position just past the character class `[...]` opening at `start`.
+    """
+    i = start + 1
+    if pattern[i:i + 1] == "^":
+        i += 1
+    if pattern[i:i + 1] == "]":
+        i += 1
+    while pattern[i] != "]":
+        i += 2 if pattern[i] == "\\" else 1
+    return i + 1
+
+
+def _check_date(text: str) -> pd.Timestamp:
+    try:
+        return pd.Timestamp(text)
+    except (TypeError, ValueError):
+        raise FilterRejected(f"{text!r} is not a date (expected yyyy-mm-dd)") from None
+
+
+def _checked_resolve(value: tuple):
+    try:
+        return _resolve(value)
+    except FilterRejected:
+        raise
+    except (TypeError, ValueError, OverflowError) as e:
+        raise FilterRejected(f"Invalid value {value!r}: {e}") from None
+
+
+def columns_of(node) -> list:
+    """
+    All column names a predicate or post-op touches.
+    """
+    if not isinstance(node, tuple) or not node:
+        return []
+    if node[0] == "col":
+        return [node[1]]
+    if node[0] in ("nlargest", "nsmallest"):
+        return [node[2]]
+    if node[0] == "sort":
+        return list(node[1])
+    names = []
+    for part in node[1:]:
+        names += columns_of(part)
+    return names
+
+
+def validate(plan: tuple, df: pd.DataFrame):
+    """
+    Checks a compiled plan against the frame it will run on (columns and basic dtypes).
+    """
+    predicate, post = plan
+    known = set(df.columns)
+    for name in columns_of(predicate) + [c for op in post for c in columns_of(op)]:
+        if name not in known:
+            raise FilterRejected(f"Unknown column: {name!r}")
+    _check_types(predicate, df)
+
+
+def check_values(plan: tuple, df: pd.DataFrame, values):
+    """
+    Checks that each condition of `plan` matching a column against one of `values` (text
+    taken from the user's query) selects some row of `df`: a word of the query that is not
+    a value of the column it was put in ("all" as a Status) means the plan is wrong for it.
+    """
+    if not len(df):
+        return
+    wanted = {str(value).lower() for value in values}
+    index = get_index(df)
+    for leaf in _leaves(plan[0]):
+        for probe in _probes(leaf, wanted):
+            with rejecting():
+                if not mask(probe, df, index).any():
+                    raise FilterRejected(f"No row has {_probe_text(probe)!r} in {probe[1][1]!r}")
+
+
+def _leaves(predicate: tuple) -> list:
+    if predicate[0] in ("and", "or"):
+        return _leaves(predicate[1]) + _leaves(predicate[2])
+    if predicate[0] == "not":
+        return _leaves(predicate[1])
+    return [predicate]
+
+
+def _probes(leaf: tuple, wanted: set) -> list:
+    """
+    The equality conditions of `leaf` on a wanted value, each of which should match a row.
+    """
+    kind = leaf[0]
+    if kind == "cmp" and leaf[2] in ("==", "!=") and leaf[3][0] == "lit" and str(leaf[3][1]).lower() in wanted:
+        return [("cmp", leaf[1], "==", leaf[3])]
+    if kind == "isin":
+        return [("isin", leaf[1], (value,)) for value in leaf[2] if str(value).lower() in wanted]
+    if kind in ("contains", "startswith", "endswith") and leaf[2].lower() in wanted:
+        return [leaf]
+    return []
+
+
+def _probe_text(probe: tuple):
+    if probe[0] == "cmp":
+        return probe[3][1]
+    return probe[2][0] if probe[0] == "isin" else probe[2]
+
+
+def _check_types(node, df):
+    kind = node[0]
+    if kind in ("and", "or"):
+        _check_types(node[1], df)
+        _check_types(node[2], df)
+    elif kind == "not":
+        _check_types(node[1], df)
+    elif kind in ("contains", "startswith", "endswith"):
+        _, name, transforms = node[1]
+        series = df[name]
+        textual = (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)
+                   or isinstance(series.dtype, pd.CategoricalDtype) or "str" in transforms)
+        if not textual:
+            raise FilterRejected(f"str.{kind} used on non-text column {name!r}")
+    elif kind == "similar":
+        _, name, transforms = node[1]
+        if name not in TEXT_COLUMNS or transforms:
+            raise FilterRejected(f"str.similar_to is only available on {', '.join(TEXT_COLUMNS)}")
+    elif kind == "cmp":
+        _check_value(df, node[1], node[2], node[3])
+    elif kind == "between":
+        _check_value(df, node[1], "<=", node[2])
+        _check_value(df, node[1], "<=", node[3])
+
+
+def _check_value(df: pd.DataFrame, column: tuple, op: str, value: tuple):
+    """
+    Checks that `column <op> value` can be evaluated: the value resolves, dates parse,
+    and ordered comparisons match the column's type (and order, for categoricals).
+    """
+    _, name, transforms = column
+    resolved = _checked_resolve(value)
+    if resolved is None:
+        return
+    dtype = df[name].dtype
+    is_date = "datetime" in transforms or (not transforms and pd.api.types.is_datetime64_any_dtype(dtype))
+    if is_date and transforms[-1:] in ((), ("datetime",)):
+        if isinstance(resolved, str):
+            _check_date(resolved)
+        elif op in _ORDERED_OPS and not isinstance(resolved, pd.Timestamp):
+            raise FilterRejected(f"Column {name!r} holds dates but is compared with {resolved!r}")
+        return
+    if transforms or op not in _ORDERED_OPS:
+        return
+    if isinstance(dtype, pd.CategoricalDtype):
+        if not dtype.ordered:
+            raise FilterRejected(f"Column {name!r} has no order: compare it with ==, != or isin")
+        if resolved not in dtype.categories:
+            raise FilterRejected(f"{resolved!r} is not a value of {name!r} (one of {', '.join(map(repr, dtype.categories))})")
+    elif pd.api.types.is_bool_dtype(dtype):
+        raise FilterRejected(f"Column {name!r} is true/false and cannot be compared with {op}")
+    elif pd.api.types.is_numeric_dtype(dtype):
+        if isinstance(resolved, bool) or not isinstance(resolved, (int, float)):
+            raise FilterRejected(f"Column {name!r} is numeric but compared with {resolved!r}")
+    elif pd.api.types.is_string_dtype(dtype) or pd.api.types.is_object_dtype(dtype):
+        if not isinstance(resolved, str):
+            raise FilterRejected(f"Column {name!r} holds text but is compared with {resolved!r}")
+
+
+# ---- evaluation -------------------------------------------------------------------------------
+
+def _series(df: pd.DataFrame, column: tuple) -> pd.Series:
+    _, name, transforms = column
+    series = df[name]
+    for transform in transforms:
+        if transform == "datetime":
+            series = pd.to_datetime(series, errors="coerce")
+        elif transform in _STR_TRANSFORMS:
+            series = getattr(series.astype("string").str, transform)()
+        elif transform == "str":
+            series = series.astype("string")
+        else:
+            series = getattr(series.dt, transform)
+    return series
+
+
+def _resolve(value: tuple):
+    kind = value[0]
+    if kind == "lit":
+        return value[1]
+    if kind == "ts":
+        return pd.Timestamp(value[1])
+    if kind == "today":
+        return pd.Timestamp.today().normalize()
+    if kind == "offset":
+        kwargs = dict(value[2])
+        return pd.Timedelta(**kwargs) if value[1] == "Timedelta" else pd.DateOffset(**kwargs)
+    if kind == "arith":
+        left, right = _resolve(value[2]), _resolve(value[3])
+        return left + right if value[1] == "+" else left - right
+    raise FilterRejected(f"Unknown value {value!r}")
+
+
+def _coerce(series: pd.Series, value):
+    """
+    Lets date columns (datetime64) compare with the "yyyy-mm-dd" strings the model writes,
+    and string date columns compare with timestamps.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series) and isinstance(value, str):
+        return series, pd.Timestamp(value)
+    if isinstance(value, pd.Timestamp) and not pd.api.types.is_datetime64_any_dtype(series):
+        return pd.to_datetime(series, errors="coerce"), value
+    return series, value
+
+
+def _bool(result) -> np.ndarray:
+    if isinstance(result, pd.Series):
+        result = result.fillna(False) if result.hasnans else result
+        return result.to_numpy(dtype=bool)
+    return np.asarray(result, dtype=bool)
+
+
+def _resolved(predicate: tuple) -> tuple:
+    """
+    The leaf with its value nodes evaluated, as the indexes expect.
+    """
+    kind = predicate[0]
+    if kind == "cmp":
+        return predicate[:3] + (("lit", _resolve(predicate[3])),)
+    if kind == "between":
+        return predicate[:2] + (("lit", _resolve(predicate[2])), ("lit", _resolve(predicate[3]))) + predicate[4:]
+    return predicate
+
+
+def mask(predicate: tuple, df: pd.DataFrame, index=None) -> np.ndarray:
+    """
+    Vectorised boolean mask (numpy) of the rows of `df` matching `predicate`.
+    Leaves are answered from `index` (a RegisterIndex over `df`) when it can, else by a scan.
+    """
+    kind = predicate[0]
+    if kind == "all":
+        return np.ones(len(df), dtype=bool)
+    if kind == "and":
+        return mask(predicate[1], df, index) & mask(predicate[2], df, index)
+    if kind == "or":
+        return mask(predicate[1], df, index) | mask(predicate[2], df, index)
+    if kind == "not":
+        return ~mask(predicate[1], df, index)
+
+    if kind == "similar":
+        return similar_mask(df, predicate[1][1], predicate[2], predicate[3])
+
+    if index is not None:
+        hit = index.lookup(_resolved(predicate))
+        if hit is not None:
+            return hit
+
+    series = _series(df, predicate[1])
+    if kind == "cmp":
+        series, value = _coerce(series, _resolve(predicate[3]))
+        if value is None:
+            return _bool(series.isna() if predicate[2] == "==" else series.notna())
+        result = _bool(_OPERATORS[predicate[2]](series, value))
+        if predicate[2] == "!=":
+            # pandas counts NaN as different on some dtypes and not others; missing never matches
+            result = result & _bool(series.notna())
+        return result
+    if kind == "contains":
+        _, _, pattern, case, regex = predicate
+        return _bool(series.astype("string").str.contains(pattern, case=case, regex=regex, na=False))
+    if kind == "startswith":
+        return _bool(series.astype("string").str.startswith(predicate[2], na=False))
+    if kind == "endswith":
+        return _bool(series.astype("string").str.endswith(predicate[2], na=False))
+    if kind == "isin":
+        return _bool(series.isin(list(predicate[2])))
+    if kind == "between":
+        series, low = _coerce(series, _resolve(predicate[2]))
+        series, high = _coerce(series, _resolve(predicate[3]))
+        return _bool(series.between(low, high, inclusive=predicate[4]))
+    if kind == "isna":
+        return _bool(series.isna())
+    if kind == "notna":
+        return _bool(series.notna())
+    if kind == "flag":
+        return _bool(series.fillna(False).astype(bool))
+    raise FilterRejected(f"Unknown predicate {kind!r}")
+
+
+def apply_post(rows: RowSet, post: tuple) -> RowSet:
+    for op in post:
+        if op[0] == "sort":
+            rows = rows.sort(list(op[1]), op[2] if isinstance(op[2], bool) else list(op[2]))
+        elif op[0] == "head":
+            rows = rows.head(op[1])
+        elif op[0] in ("nlargest", "nsmallest"):
+            rows = rows.largest(op[1], op[2], smallest=op[0] == "nsmallest")
+        elif op[0] == "reset_index":
+            rows = RowSet(rows.base, rows.rows, reset_index=True)
+    return rows
+
+
+# ---- compile + cache --------------------------------------------------------------------------
+
+_CACHE_SIZE = 512
+_by_code = OrderedDict()     # raw code → plan
+_by_form = {}                # normalised form → plan (identical filters share one object)
+_cache_lock = threading.Lock()
+
+
+def compile_filter(code: str) -> tuple:
+    """
+    Parses generated pandas code into a (predicate, post_ops) plan.
+    Raises FilterRejected for anything outside the grammar.
+    """
+    with _cache_lock:
+        plan = _by_code.get(code)
+        if plan is not None:
+            _by_code.move_to_end(code)
+            return plan
+
+    try:
+        tree = ast.parse(code, mode="exec")
+    except SyntaxError as e:
+        raise FilterRejected(f"Filter code is not valid Python: {e}") from None
+    plan = _Compiler().module(tree)
+    form = repr(plan)
+
+    with _cache_lock:
+        plan = _by_form.setdefault(form, plan)
+        _by_code[code] = plan
+        while len(_by_code) > _CACHE_SIZE:
+            old = _by_code.popitem(last=False)[1]
+            if old not in _by_code.values():
+                _by_form.pop(repr(old), None)
+    return plan
+
+
+def normalized_form(code: str) -> str:
+    """
+    Canonical text of a filter, independent of formatting and redundant parentheses.
+    """
+    return repr(compile_filter(code))
+
+
+@contextmanager
+def rejecting():
+    """
+    Re-raises what pandas/Arrow raise on a validated plan they still cannot run as FilterRejected.
+    """
+    try:
+        yield
+    except FilterRejected:
+        raise
+    except (TypeError, ValueError, re.error) as e:
+        raise FilterRejected(f"The filter cannot be applied to the register: {e}") from None
+
+
+def filter_mask(code: str, df: pd.DataFrame) -> np.ndarray:
+    """
+    Boolean mask for the rows `code` selects, ignoring any post-ops (sorting/limits).
+    """
+    plan = compile_filter(code)
+    validate(plan, df)
+    with rejecting():
+        return mask(plan[0], df, get_index(df))
+
+
+def filter_rows(code: str, df: pd.DataFrame) -> RowSet:
+    """
+    The rows `code` selects, in result order, as positions over `df` (no rows are copied).
+    Compiles, validates against `df`'s schema and uses the secondary indexes built for
+    `df` (src/indexes.py) where the predicate allows.
+    """
+    predicate, post = compile_filter(code)
+    validate((predicate, post), df)
+    with rejecting():
+        if predicate == ("all",):
+            rows = RowSet.all(df)
+        else:
+            rows = RowSet.from_mask(df, mask(predicate, df, get_index(df)))
+        return apply_post(rows, post)
+
+
+def refine_rows(code: str, previous: RowSet) -> RowSet:
+    """
+    The rows of an earlier result `previous` that `code` also selects (a follow-up that
+    narrows it down), in `previous`'s order unless `code` re-sorts or limits them.
+    The predicate is answered over the whole register, indexes included, then intersected.
+    """
+    predicate, post = compile_filter(code)
+    validate((predicate, post), previous.base)
+    rows = previous
+    with rejecting():
+        if predicate != ("all",):
+            rows = previous.refine(mask(predicate, previous.base, get_index(previous.base))[previous.rows])
+        return apply_post(rows, post)
+
+
+def apply_filter(code: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Safe replacement for exec-ing generated filter code: the rows of `filter_rows` as a frame.
+    """
+    return filter_rows(code, df).frame
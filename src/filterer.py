@@ -2,17 +2,38 @@
 
 import os
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
-import streamlit as st
-from src.fetch_key import get_openai_key
+import time
+import hashlib
+import threading
+from typing import Optional
 
-api_key = get_openai_key()
-if not api_key:
-    raise RuntimeError("OPENAI_API_KEY not found—please set it in your .env or shell or add to secrets.")
+import pandas as pd
 
-# Initialize OpenAI client
-client = OpenAI(api_key=api_key)
+from src.calls import acomplete, answered_by, complete
+from src.filter_engine import check_values, compile_filter, validate
+from src.plan_cache import PlanCache
+from src.schema import REGISTER_COLUMNS, column_list_text, schema_hash
+from src.tracing import span
+
+_MODEL = "gpt-4.1"
+
+# The register columns and the filter code grammar (shared with the fused planner, src/planner.py)
+COLUMNS_SECTION = """
+The DataFrame `df` contains the following columns:
+
+- <<COLUMNS>>
+
+Only use these columns. If the request involves subjective or ambiguous terms like “unclear mitigation” or “missing data,” respond only with filters that can be **objectively implemented**, such as string matches, date comparisons, numeric thresholds, boolean flags, or exact text presence.
+**NOTE**: "Date Raised", "Date Updated" and "By When" are datetime64 columns: compare them with "yyyy-mm-dd" strings or `pd.Timestamp(...)`, and use `.dt` for parts like `.dt.month`. The "Risk Type - ..." columns are real booleans. Likelihood/Impact columns are ordered categories ("Low" < "Medium" < "High").""".strip().replace("<<COLUMNS>>", column_list_text())
+
+CODE_GRAMMAR = """
+The code is not executed as Python: it is parsed and only this subset is accepted:
+- conditions on columns written as `df["<column>"]`: comparisons (`==`, `!=`, `<`, `<=`, `>`, `>=`) with literal values, `.isin([...])`, `.between(a, b)`, `.isna()`, `.notna()`, `.str.contains("text", case=False, na=False)`, `.str.startswith(...)`, `.str.endswith(...)`, and boolean flag columns compared with `True`/`False`
+- for topics rather than exact words ("risks like supplier failure", "anything about cyber security"), `df["Description of Risk/Opportunity"].str.similar_to("<short topic description>")` (also on "Control Measure / Mitigation") matches semantically similar text; prefer it to guessing several `.str.contains` keywords
+- dates: compare with "yyyy-mm-dd" strings, `pd.Timestamp("yyyy-mm-dd")`, or `pd.Timestamp.today()` +/- `pd.DateOffset(months=N)` / `pd.Timedelta(days=N)`; wrap the column in `pd.to_datetime(...)` when comparing with timestamps
+- combine conditions with `&`, `|` and `~`, each condition in parentheses
+- optionally end with `.sort_values(...)`, `.head(n)`, `.nlargest(n, "<column>")` or `.nsmallest(n, "<column>")`
+Anything else (imports, loops, lambdas, `.apply`, `.query`, other functions) is rejected.""".strip()
 
 # System prompt for generating pandas filter code
 _SYSTEM_PROMPT = """
@@ -23,19 +44,20 @@ Your job is to:
 1. Generate valid, executable pandas code that applies filters to `df` based on a user's natural language request.
 2. Provide a short explanation (1-3 sentences) of what the filter does, so the user understands what was applied.
 
-The DataFrame `df` contains the following columns:
-
-- "Risk Area", "Date Raised", "Contract", "Contract:Region", "Date Updated", "RiskIDNumber", "Raised By", "Risk/Opportunity", "Description of Risk/Opportunity", "Risk Type - Financial", "Risk Type - Commercial/Contractual", "Risk Type - Reputational", "Risk Type - People", "Risk Type - Regulatory and Law", "Risk Type - SHE", "Probability - Pre Mitigation - Likelihood", "Probability - Pre Mitigation - Impact", "Probability - Pre Mitigation - Score (out of 25)", "Probability - Pre Mitigation - % Risk Score", "Impact (£) - Worst Case (Unmitigated)", "Impact (£) - Best Case", "Impact (£) - Expected", "Sum of Financial Year Impacts", "Status", "Risk Owner", "Control Measure / Mitigation", "By When", "Probability - Post Mitigation - Likelihood", "Probability - Post Mitigation - Impact", "Probability - Post Mitigation - Score (out of 25)", "Probability - Post Mitigation - % Risk Score", "Risk Paper", "Contract Manager", "Regional Manager", "Expected Impact FY 23-24", "Accounting Treatment FY 23-24", "Expected Impact FY 24-25", "Accounting Treatment FY 24-25", "Expected Impact FY 25-26", "Accounting Treatment FY 25-26", "Expected Impact FY 26-27", "Accounting Treatment FY 26-27", "Expected Impact FY 27-28", "Accounting Treatment FY 27-28", "OriginList"
-
-Only use these columns. If the request involves subjective or ambiguous terms like “unclear mitigation” or “missing data,” respond only with filters that can be **objectively implemented**, such as string matches, date comparisons, numeric thresholds, boolean flags, or exact text presence.
-**BEWARE**: Dates are in format yyyy-mm-dd, as strings. DO NOT assume they are datetime objects!
+<<COLUMNS_SECTION>>
 
 ### Output format:
 
 Respond with a **JSON object** with two fields:
-- "code": the exact Python pandas code block (as a string) that applies the filter using `.loc[]` and ends with `.copy()`
+- "code": the exact Python pandas code block (as a string) that assigns `filtered_df = df.loc[<condition>]`
 - "explanation": a short natural-language explanation of what the filter does and any assumptions made
 
+<<GRAMMAR>>
+
+### Follow-up requests:
+
+Earlier requests of the conversation and your answers to them may come before the current one. When the current request narrows down the previous result ("now only the open ones", "of those, which are owned by Alice", "just the north region"), add a third field "refine": true and let "code" select only the **additional** condition: it is applied to the previous result, not to the whole register. For a new, unrelated request, filter the whole register as usual and omit "refine".
+
 Respond with only valid JSON. Do not use code block formatting, triple backticks, or any Markdown. The "code" field must be valid Python code, and the whole response must be directly parsable by json.loads()
 
 
@@ -45,30 +67,142 @@ Respond with only valid JSON. Do not use code block formatting, triple backticks
 
 ```json
 {
-  "code": "filtered_df = df.loc[\n    (df[\"Risk Type - Reputational\"] == True) &\n    (df[\"Contract:Region\"].str.contains(\"north\", case=False, na=False))\n].copy()",
+  "code": "filtered_df = df.loc[\n    (df[\"Risk Type - Reputational\"] == True) &\n    (df[\"Contract:Region\"].str.contains(\"north\", case=False, na=False))\n]",
   "explanation": "This filters for risks marked as 'Reputational' where the contract region includes 'north' (case-insensitive)."
 }
-```"""
+```""".replace("<<COLUMNS_SECTION>>", COLUMNS_SECTION).replace("<<GRAMMAR>>", CODE_GRAMMAR)
+
+# Plans are reused across identical (or literal-only different) queries, keyed by model,
+# column schema and system prompt so changing any of them never serves a stale plan.
+_PLAN_NAMESPACE = f"{_MODEL}:{schema_hash()}:{hashlib.sha256(_SYSTEM_PROMPT.encode('utf-8')).hexdigest()[:16]}"
+# Opened on the first filter request, not on import (it writes to ROBO_CACHE_DIR)
+_plan_cache = None
+_plan_cache_lock = threading.Lock()
+
 
-def filter_assistant(user_input: str) -> dict:
+def _get_plan_cache() -> Optional[PlanCache]:
+    global _plan_cache
+    if _plan_cache is None and os.getenv("ROBO_PLAN_CACHE", "1") != "0":
+        with _plan_cache_lock:
+            if _plan_cache is None:
+                _plan_cache = PlanCache(namespace=_PLAN_NAMESPACE, reserved_literals=REGISTER_COLUMNS)
+    return _plan_cache
+
+
+def _check_plan(code: str, df: Optional[pd.DataFrame], values=()):
     """
-    Generates pandas filtering code and explanation based on the user's request.
+    Raises FilterRejected unless `code` compiles and, given the register `df`, fits its
+    schema with each of `values` (literals taken from the query) found in its column.
+    """
+    plan = compile_filter(code)
+    if df is not None:
+        validate(plan, df)
+        check_values(plan, df, values)
+
+
+def _fits(code: str, df: Optional[pd.DataFrame]) -> bool:
+    try:
+        _check_plan(code, df)
+    except ValueError:
+        return False
+    return True
+
+
+def _cached(user_input: str, df: Optional[pd.DataFrame]) -> Optional[dict]:
+    cache = _get_plan_cache()
+    if cache is None:
+        return None
+    return cache.get(user_input, check=lambda code, values: _check_plan(code, df, values))
+
+
+def forget_plan(user_input: str):
     """
-    response = client.chat.completions.create(
-        model="gpt-4.1",
-        messages=[
-            {"role": "system",  "content": _SYSTEM_PROMPT.strip()},
-            {"role": "user",    "content": user_input}
-        ],
-        temperature=0
-    )
+    Drops the cached plan for `user_input`, e.g. after the register rejected it.
+    """
+    if _plan_cache is not None:
+        _plan_cache.discard(user_input)
+
+
+def _messages(user_input: str, history: Optional[list] = None) -> list:
+    # The system prompt stays first and unchanged, so the provider can cache it as a prefix
+    return [
+        {"role": "system",  "content": _SYSTEM_PROMPT.strip()},
+        *(history or []),
+        {"role": "user",    "content": user_input}
+    ]
 
+
+def _parse(user_input: str, response, latency: float, cache: bool = True, df: Optional[pd.DataFrame] = None) -> dict:
+    """
+    Validates the model's JSON and stores it in the plan cache (with `cache`) if it
+    compiles and fits the register `df`.
+    """
     raw_output = response.choices[0].message.content
     try:
         result = json.loads(raw_output)
         if not isinstance(result, dict) or "code" not in result or "explanation" not in result:
             raise ValueError("Unexpected response format. Expected a JSON object with 'code' and 'explanation'.")
+        # A fallback model's plan is not stored as the primary model's
+        plan_cache = _get_plan_cache()
+        if plan_cache is not None and cache and answered_by(response, _MODEL) and _fits(result["code"], df):
+            usage = getattr(response, "usage", None)
+            plan_cache.put(user_input, result, latency=latency, tokens=getattr(usage, "total_tokens", 0) or 0)
         return result
     except json.JSONDecodeError as e:
         raise RuntimeError(f"Failed to parse filter response as JSON: {e}\nRaw output was:\n{raw_output}")
-    
\ No newline at end of file
+
+
+def filter_assistant(user_input: str, history: Optional[list] = None, df: Optional[pd.DataFrame] = None) -> dict:
+    """
+    Generates pandas filtering code and explanation based on the user's request.
+    Served from the plan cache when the same (or an equivalent) query was seen before;
+    `df`, the register the plan will run on, is what cached plans are checked against.
+    With `history` (earlier turns of a conversation, see src/session.py) the answer depends
+    on them, so the plan cache is bypassed and the plan may come back with "refine": true.
+    """
+    with span("filter", model=_MODEL) as s:
+        if not history:
+            cached = _cached(user_input, df)
+            s.set(plan_cache="hit" if cached is not None else "miss")
+            if cached is not None:
+                return cached
+
+        start = time.perf_counter()
+        response = complete(
+            "filter",
+            model=_MODEL,
+            messages=_messages(user_input, history),
+            temperature=0
+        )
+        s.usage(response)
+        return _parse(user_input, response, time.perf_counter() - start, cache=not history, df=df)
+
+
+async def afilter_assistant(user_input: str, history: Optional[list] = None, df: Optional[pd.DataFrame] = None) -> dict:
+    """
+    Async version of `filter_assistant`.
+    """
+    with span("filter", model=_MODEL) as s:
+        if not history:
+            cached = _cached(user_input, df)
+            s.set(plan_cache="hit" if cached is not None else "miss")
+            if cached is not None:
+                return cached
+
+        start = time.perf_counter()
+        response = await acomplete(
+            "filter",
+            model=_MODEL,
+            messages=_messages(user_input, history),
+            temperature=0
+        )
+        s.usage(response)
+        return _parse(user_input, response, time.perf_counter() - start, cache=not history, df=df)
+
+def plan_cache_stats() -> dict:
+    """
+    Hit/miss counters of the filter plan cache, with the LLM seconds and tokens saved.
+    """
+    if _plan_cache is None:
+        return {}
+    return _plan_cache.stats()
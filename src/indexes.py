@@ -0,0 +1,363 @@
+# indexes.py
+
+import re
+import threading
+import weakref
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.schema import CATEGORY_COLUMNS, DATE_COLUMNS, FLAG_COLUMNS, LEVEL_COLUMNS, NUMERIC_COLUMNS
+
+# Free-text columns that get an n-gram index
+TEXT_COLUMNS = ["Description of Risk/Opportunity", "Control Measure / Mitigation"]
+# Columns with more distinct values than this are not bitmap-indexed
+_MAX_BITMAP_VALUES = 1024
+_NGRAM = 3
+_REGEX_META = re.compile(r"[.^$*+?{}\[\]\\|()]")
+
+
+class _Bitmaps:
+    """
+    One boolean vector per distinct value of a low-cardinality column.
+    """
+
+    def __init__(self, series: pd.Series):
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        self.values = list(uniques)
+        self.dtype = series.dtype
+        self.na = codes == -1
+        self.bitmaps = {value: codes == i for i, value in enumerate(self.values)}
+        self.n = len(series)
+
+    def eq(self, value) -> np.ndarray:
+        if value is None:
+            # `== None` means missing, as in the scan
+            return self.na.copy()
+        try:
+            bitmap = self.bitmaps.get(value)
+        except TypeError:
+            return None
+        return bitmap if bitmap is not None else np.zeros(self.n, dtype=bool)
+
+    def ne(self, value) -> np.ndarray:
+        eq = self.eq(value)
+        if eq is None:
+            return None
+        # Missing values are not "different from" anything, as in the scan
+        return ~eq if value is None else ~eq & ~self.na
+
+    def any_of(self, values) -> np.ndarray:
+        result = np.zeros(self.n, dtype=bool)
+        for value in values:
+            bitmap = self.eq(value)
+            if bitmap is None:
+                return None
+            result |= bitmap
+        return result
+
+    def where(self, predicate) -> np.ndarray:
+        """
+        OR of the bitmaps whose value satisfies `predicate` (evaluated once per distinct value).
+        """
+        return self.any_of([value for value in self.values if predicate(value)])
+
+
+class _Sorted:
+    """
+    Row positions sorted by value, for range and equality lookups by binary search.
+    """
+
+    def __init__(self, series: pd.Series):
+        valid = series.notna().to_numpy()
+        self.is_datetime = pd.api.types.is_datetime64_any_dtype(series)
+        values = series.to_numpy()[valid]
+        positions = np.flatnonzero(valid)
+        order = np.argsort(values, kind="stable")
+        self.sorted = values[order]
+        self.positions = positions[order]
+        self.na = ~valid
+        self.n = len(series)
+
+    def _key(self, value):
+        if self.is_datetime:
+            if isinstance(value, str):
+                value = pd.Timestamp(value)
+            if not isinstance(value, pd.Timestamp):
+                return None
+            return value.to_datetime64()
+        if isinstance(value, (bool, np.bool_)) or not isinstance(value, (int, float, np.integer, np.floating)):
+            return None
+        return value
+
+    def _mask(self, lo: int, hi: int) -> np.ndarray:
+        result = np.zeros(self.n, dtype=bool)
+        result[self.positions[lo:hi]] = True
+        return result
+
+    def compare(self, op: str, value) -> Optional[np.ndarray]:
+        key = self._key(value)
+        if key is None:
+            return None
+        left = np.searchsorted(self.sorted, key, side="left")
+        right = np.searchsorted(self.sorted, key, side="right")
+        end = len(self.sorted)
+        if op == "==":
+            return self._mask(left, right)
+        if op == "!=":
+            return ~self._mask(left, right) & ~self.na
+        if op == "<":
+            return self._mask(0, left)
+        if op == "<=":
+            return self._mask(0, right)
+        if op == ">":
+            return self._mask(right, end)
+        if op == ">=":
+            return self._mask(left, end)
+        return None
+
+    def between(self, low, high, inclusive: str) -> Optional[np.ndarray]:
+        low_key, high_key = self._key(low), self._key(high)
+        if low_key is None or high_key is None:
+            return None
+        lo = np.searchsorted(self.sorted, low_key, side="left" if inclusive in ("both", "left") else "right")
+        hi = np.searchsorted(self.sorted, high_key, side="right" if inclusive in ("both", "right") else "left")
+        return self._mask(lo, max(lo, hi))
+
+
+class _NGrams:
+    """
+    Inverted index from lower-cased character trigrams to the distinct texts containing them.
+    Substring queries only verify the candidate texts, then map them back to rows.
+
+    Trigrams are packed into int64 keys (three 21-bit code points) and the postings are
+    stored as one sorted array of (trigram, text) pairs, so building is vectorised even
+    for many distinct texts.
+    """
+
+    def __init__(self, series: pd.Series):
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        self.codes = codes
+        self.texts = pd.Series(uniques, dtype="string")
+        self.na = codes == -1
+
+        lowered = [text.lower() for text in self.texts]
+        # "\x00" separates texts so no trigram spans two of them
+        points = np.frombuffer("\x00".join(lowered).encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+        owner = np.repeat(np.arange(len(lowered), dtype=np.int64), [len(text) + 1 for text in lowered])[:len(points)]
+        self.grams = {}
+        self.pairs = np.empty(0, dtype=np.int64)
+        if len(points) >= _NGRAM:
+            valid = (points[:-2] != 0) & (points[1:-1] != 0) & (points[2:] != 0)
+            gram_ids, grams = pd.factorize(_pack(points)[valid])
+            self.grams = {int(gram): i for i, gram in enumerate(grams)}
+            # One sorted int64 per (trigram, text) pair: gram_id * n_texts + text_id
+            pairs = np.sort(gram_ids.astype(np.int64) * len(lowered) + owner[:-2][valid])
+            keep = np.ones(len(pairs), dtype=bool)
+            keep[1:] = pairs[1:] != pairs[:-1]
+            self.pairs = pairs[keep]
+
+    def _postings(self, key: int) -> np.ndarray:
+        gram_id = self.grams.get(int(key))
+        if gram_id is None:
+            return np.empty(0, dtype=np.int64)
+        base = gram_id * len(self.texts)
+        lo = np.searchsorted(self.pairs, base, side="left")
+        hi = np.searchsorted(self.pairs, base + len(self.texts), side="left")
+        return self.pairs[lo:hi] - base
+
+    def _candidates(self, needle: str) -> np.ndarray:
+        needle = needle.lower()
+        if len(needle) < _NGRAM:
+            return np.arange(len(self.texts))
+        keys = np.unique(_pack(np.frombuffer(needle.encode("utf-32-le"), dtype=np.uint32).astype(np.int64)))
+        lists = sorted((self._postings(key) for key in keys), key=len)
+        candidates = lists[0]
+        for ids in lists[1:]:
+            if not len(candidates):
+                break
+            candidates = np.intersect1d(candidates, ids, assume_unique=True)
+        return candidates
+
+    def search(self, kind: str, text: str, case: bool = True) -> np.ndarray:
+        candidates = self._candidates(text)
+        texts = self.texts.iloc[candidates]
+        if kind == "contains":
+            hits = texts.str.contains(text, case=case, regex=False, na=False)
+        elif kind == "startswith":
+            hits = texts.str.startswith(text, na=False)
+        else:
+            hits = texts.str.endswith(text, na=False)
+        matched = candidates[hits.to_numpy(dtype=bool)]
+        return np.isin(self.codes, matched)
+
+
+def _pack(points: np.ndarray) -> np.ndarray:
+    """
+    int64 key of every trigram in a code-point array.
+    """
+    return (points[:-2] << 42) | (points[1:-1] << 21) | points[2:]
+
+
+class RegisterIndex:
+    """
+    Secondary indexes over a register frame, answering filter leaves without a scan:
+
+    - bitmaps for low-cardinality columns (regions, status, risk area, owners, risk-type flags...)
+    - sorted positions for dates and £/score columns (range queries by binary search)
+    - trigram inverted index for the free-text description and mitigation columns
+    - `semantic`: their embedding vectors, filled lazily by src/retrieval.py
+    """
+
+    def __init__(self, df: pd.DataFrame, base: Optional["RegisterIndex"] = None, changed=()):
+        """
+        With `base` (the index of a frame with the same rows in the same order), only the
+        `changed` columns are rebuilt; the other column indexes are shared with `base`.
+        """
+        self.n = len(df)
+        self.bitmaps = {}
+        self.sorted = {}
+        self.text = {}
+        self.semantic = {}
+        self.stats = {"index_hits": 0, "scans": 0}
+        if base is not None and base.n != self.n:
+            raise ValueError("A base index must cover the same rows")
+
+        for column in CATEGORY_COLUMNS + LEVEL_COLUMNS + FLAG_COLUMNS + DATE_COLUMNS + NUMERIC_COLUMNS + TEXT_COLUMNS:
+            if column not in df.columns:
+                continue
+            if base is not None and column not in changed:
+                self._share(base, column)
+            else:
+                self._build(df[column], column)
+
+    def _build(self, series: pd.Series, column: str):
+        if column in CATEGORY_COLUMNS + LEVEL_COLUMNS + FLAG_COLUMNS:
+            if series.nunique(dropna=True) <= _MAX_BITMAP_VALUES:
+                self.bitmaps[column] = _Bitmaps(series)
+        elif column in DATE_COLUMNS + NUMERIC_COLUMNS:
+            if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+                self.sorted[column] = _Sorted(series)
+        else:
+            self.text[column] = _NGrams(series)
+
+    def _share(self, base: "RegisterIndex", column: str):
+        for own, theirs in ((self.bitmaps, base.bitmaps), (self.sorted, base.sorted), (self.text, base.text),
+                            (self.semantic, base.semantic)):
+            if column in theirs:
+                own[column] = theirs[column]
+
+    def lookup(self, predicate: tuple) -> Optional[np.ndarray]:
+        """
+        Mask for a single filter leaf (see filter_engine IR, with values already resolved
+        to ("lit", value)), or None if no index applies.
+        """
+        result = self._lookup(predicate)
+        self.stats["index_hits" if result is not None else "scans"] += 1
+        return result
+
+    def _lookup(self, predicate: tuple) -> Optional[np.ndarray]:
+        kind = predicate[0]
+        if kind in ("and", "or", "not", "all"):
+            return None
+        _, name, transforms = predicate[1]
+        if transforms:
+            return None
+
+        if kind == "isna" or kind == "notna":
+            index = self.bitmaps.get(name) or self.sorted.get(name) or self.text.get(name)
+            if index is None:
+                return None
+            return index.na.copy() if kind == "isna" else ~index.na
+
+        bitmaps = self.bitmaps.get(name)
+        if bitmaps is not None:
+            return self._bitmap_lookup(bitmaps, predicate)
+
+        ordered = self.sorted.get(name)
+        if ordered is not None:
+            if kind == "cmp" and predicate[3][0] == "lit":
+                return ordered.compare(predicate[2], predicate[3][1])
+            if kind == "between" and predicate[2][0] == "lit" and predicate[3][0] == "lit":
+                return ordered.between(predicate[2][1], predicate[3][1], predicate[4])
+            return None
+
+        text = self.text.get(name)
+        if text is not None:
+            if kind == "contains":
+                _, _, pattern, case, regex = predicate
+                if regex and _REGEX_META.search(pattern):
+                    return None
+                return text.search("contains", pattern, case)
+            if kind in ("startswith", "endswith"):
+                return text.search(kind, predicate[2])
+            if kind == "cmp" and predicate[2] in ("==", "!=") and predicate[3][0] == "lit" \
+                    and isinstance(predicate[3][1], str):
+                exact = np.isin(text.codes, np.flatnonzero(text.texts.to_numpy() == predicate[3][1]))
+                return exact if predicate[2] == "==" else ~exact & ~text.na
+        return None
+
+    def _bitmap_lookup(self, bitmaps: _Bitmaps, predicate: tuple) -> Optional[np.ndarray]:
+        kind = predicate[0]
+        if kind == "flag":
+            return bitmaps.eq(True) if pd.api.types.is_bool_dtype(bitmaps.dtype) else None
+        if kind == "isin":
+            return bitmaps.any_of(predicate[2])
+        if kind == "contains":
+            _, _, pattern, case, regex = predicate
+            flags = 0 if case else re.IGNORECASE
+            compiled = re.compile(pattern if regex else re.escape(pattern), flags)
+            return bitmaps.where(lambda value: isinstance(value, str) and compiled.search(value) is not None)
+        if kind == "startswith":
+            return bitmaps.where(lambda value: isinstance(value, str) and value.startswith(predicate[2]))
+        if kind == "endswith":
+            return bitmaps.where(lambda value: isinstance(value, str) and value.endswith(predicate[2]))
+        if kind == "cmp" and predicate[3][0] == "lit":
+            op, value = predicate[2], predicate[3][1]
+            if op == "==":
+                return bitmaps.eq(value)
+            if op == "!=":
+                return bitmaps.ne(value)
+            dtype = bitmaps.dtype
+            if isinstance(dtype, pd.CategoricalDtype) and dtype.ordered and value in dtype.categories:
+                rank = {category: i for i, category in enumerate(dtype.categories)}
+                target = rank[value]
+                compare = {"<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal}[op]
+                return bitmaps.where(lambda v: compare(rank[v], target))
+        return None
+
+
+# ---- registry: one index per live frame -------------------------------------------------------
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def build_index(df: pd.DataFrame, base: Optional[RegisterIndex] = None, changed=()) -> RegisterIndex:
+    """
+    Builds the indexes for `df` and keeps them alongside it until the frame is garbage collected.
+    `base`/`changed` rebuild only some columns (see RegisterIndex).
+    """
+    index = RegisterIndex(df, base, changed)
+    key = id(df)
+    with _registry_lock:
+        _registry[key] = (weakref.ref(df), index)
+    weakref.finalize(df, _forget, key)
+    return index
+
+
+def _forget(key: int):
+    with _registry_lock:
+        _registry.pop(key, None)
+
+
+def get_index(df: pd.DataFrame) -> Optional[RegisterIndex]:
+    """
+    The index built for exactly this frame, or None.
+    """
+    with _registry_lock:
+        entry = _registry.get(id(df))
+    if entry is None or entry[0]() is not df:
+        return None
+    return entry[1]
@@ -0,0 +1,350 @@
+# ingest.py
+"""
+Incremental ingestion of register changes.
+
+    python -m src.ingest watch data/Risk_Register.csv      # apply edits to the file as they happen
+    python -m src.ingest diff old.csv new.csv              # what would change
+
+A `RegisterStore` holds the current register and applies changes to it as deltas
+keyed by RiskIDNumber: upserted rows (new or changed, possibly only some columns),
+removed IDs, or the diff between the store and the edited source file. Every delta
+that changes something produces a new snapshot with the next version number.
+Snapshots are never mutated, so a reader still holding an older frame is unaffected.
+
+Derived state only pays for what changed:
+- filter indexes are rebuilt for the changed columns only, as long as no rows were added
+  or removed (row positions stay the same); otherwise they are rebuilt in full
+- aggregate rollups (analytics) already built are carried over, recomputing only the
+  dimensions and metrics among the changed columns
+- cached chunk summaries (summariser) are keyed by chunk content, so only the chunks
+  holding changed rows are summarised again
+- other derived state subscribes to deltas with `RegisterStore.subscribe`
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.analytics import derive_rollups
+from src.indexes import build_index, get_index
+from src.register import DEFAULT_REGISTER_PATH, apply_schema, load_register, source_stamp
+from src.tracing import span
+
+ID_COLUMN = "RiskIDNumber"
+POLL_SECONDS = float(os.getenv("ROBO_INGEST_POLL_SECONDS", "2"))
+
+_log = logging.getLogger("robo.ingest")
+
+
+class Delta:
+    """
+    What one ingestion step changed. IDs are RiskIDNumber values; `columns` are the
+    columns whose values changed in updated rows. `moved` is True when rows were added,
+    removed or reordered, i.e. row positions differ from the previous version.
+    """
+
+    def __init__(self, version: int, added=(), updated=(), removed=(), columns=(), moved: bool = False):
+        self.version = version
+        self.added = list(added)
+        self.updated = list(updated)
+        self.removed = list(removed)
+        self.columns = set(columns)
+        self.moved = moved
+
+    @property
+    def ids(self) -> set:
+        return set(self.added) | set(self.updated) | set(self.removed)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.updated or self.removed or self.moved)
+
+    def summary(self) -> dict:
+        return {
+            "version": self.version,
+            "added": len(self.added),
+            "updated": len(self.updated),
+            "removed": len(self.removed),
+            "columns": sorted(self.columns),
+            "moved": self.moved,
+        }
+
+
+def _check_ids(df: pd.DataFrame):
+    if ID_COLUMN not in df.columns:
+        raise ValueError(f"Register rows need a {ID_COLUMN} column")
+    if df[ID_COLUMN].isna().any() or not df[ID_COLUMN].is_unique:
+        raise ValueError(f"{ID_COLUMN} values must be present and unique")
+
+
+def _common(a: pd.Series, b: pd.Series) -> tuple:
+    """
+    `a` and `b` cast to one dtype that holds the values of both.
+    """
+    if a.dtype == b.dtype:
+        return a, b
+    if isinstance(a.dtype, pd.CategoricalDtype) and isinstance(b.dtype, pd.CategoricalDtype):
+        if not a.dtype.ordered and not b.dtype.ordered:
+            categories = a.cat.categories.union(b.cat.categories, sort=False)
+            return a.cat.set_categories(categories), b.cat.set_categories(categories)
+    elif pd.api.types.is_bool_dtype(a.dtype) and pd.api.types.is_bool_dtype(b.dtype):
+        return a.astype("boolean"), b.astype("boolean")
+    elif isinstance(a.dtype, np.dtype) and isinstance(b.dtype, np.dtype) and (
+            a.dtype.kind == b.dtype.kind or a.dtype.kind in "iuf" and b.dtype.kind in "iuf"):
+        # e.g. int8 vs int16 after an edit, int vs float once a value is missing
+        dtype = np.result_type(a.dtype, b.dtype)
+        return a.astype(dtype), b.astype(dtype)
+    return a.astype(object), b.astype(object)
+
+
+def _member(values: pd.Series, ids) -> np.ndarray:
+    """
+    Which `values` are among the (unique) `ids`; much faster than Series.isin on Arrow strings.
+    """
+    return pd.Index(ids).get_indexer(values) >= 0
+
+
+def _differs(a: pd.Series, b: pd.Series) -> np.ndarray:
+    # Value hashes: categoricals compare by value, NaN equals NaN
+    return (pd.util.hash_pandas_object(a, index=False).to_numpy()
+            != pd.util.hash_pandas_object(b, index=False).to_numpy())
+
+
+def _merge(old: pd.DataFrame, rows: pd.DataFrame, removed) -> tuple:
+    """
+    Applies upserted `rows` and `removed` IDs to `old`.
+    Returns: (new frame, added IDs, updated IDs, removed IDs, changed columns)
+    """
+    unknown = [c for c in rows.columns if c not in old.columns]
+    if unknown:
+        raise ValueError(f"Unknown register columns: {unknown}")
+    if len(rows):
+        _check_ids(rows)
+
+    old_ids = pd.Index(old[ID_COLUMN])
+    positions = old_ids.get_indexer(rows[ID_COLUMN]) if len(rows) else np.empty(0, dtype=np.intp)
+    existing = positions >= 0
+    targets = positions[existing]
+    fresh = rows[~existing]
+
+    new = old.copy(deep=False)
+    updated = np.zeros(len(old), dtype=bool)
+    columns = set()
+    for column in rows.columns:
+        if column == ID_COLUMN or not existing.any():
+            continue
+        current, incoming = _common(old[column], rows[column][existing].reset_index(drop=True))
+        differs = _differs(current.iloc[targets].reset_index(drop=True), incoming)
+        if differs.any():
+            values = current.copy()
+            values.iloc[targets[differs]] = incoming[differs].to_numpy()
+            new[column] = values
+            updated[targets[differs]] = True
+            columns.add(column)
+
+    if len(fresh):
+        missing = [c for c in old.columns if c not in fresh.columns]
+        if missing:
+            raise ValueError(f"New rows need every register column; missing: {missing}")
+        parts = {}
+        for column in old.columns:
+            current, incoming = _common(new[column], fresh[column])
+            parts[column] = pd.concat([current, incoming], ignore_index=True)
+        new = pd.DataFrame(parts)
+
+    removed = list(dict.fromkeys(i for i in removed if i in old_ids))
+    if removed:
+        new = new[~_member(new[ID_COLUMN], removed)]
+
+    if len(fresh) or removed:
+        new.index = pd.RangeIndex(1, len(new) + 1)
+    return new, fresh[ID_COLUMN].tolist(), old[ID_COLUMN][updated].tolist(), removed, columns
+
+
+class RegisterStore:
+    """
+    The current register snapshot, changed only through deltas.
+    Listeners added with `subscribe` are called as `callback(delta, df)` after every change.
+    """
+
+    def __init__(self, df: pd.DataFrame, path: Optional[str] = None):
+        _check_ids(df)
+        self.df = df
+        self.version = 0
+        self.path = path
+        self.stamp = source_stamp(path) if path else None
+        self._lock = threading.RLock()
+        self._listeners = []
+        if get_index(df) is None:
+            build_index(df)
+
+    @classmethod
+    def from_path(cls, path: str = DEFAULT_REGISTER_PATH) -> "RegisterStore":
+        stamp = source_stamp(path)
+        store = cls(load_register(path), path)
+        store.stamp = stamp
+        return store
+
+    def current(self) -> tuple:
+        """
+        (df, version) of the latest snapshot.
+        """
+        with self._lock:
+            return self.df, self.version
+
+    def subscribe(self, callback: Callable):
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback: Callable):
+        self._listeners.remove(callback)
+
+    def upsert(self, rows: pd.DataFrame) -> Delta:
+        """
+        Adds new rows and updates existing ones (matched by RiskIDNumber). Updated rows may
+        carry only some columns; new rows need all of them.
+        """
+        with self._lock:
+            return self._commit(*_merge(self.df, apply_schema(rows), ()))
+
+    def remove(self, ids) -> Delta:
+        with self._lock:
+            return self._commit(*_merge(self.df, self.df.iloc[:0], ids))
+
+    def sync(self) -> Delta:
+        """
+        Applies the difference between the store and its source file.
+        """
+        if self.path is None:
+            raise ValueError("This store has no source file")
+        with self._lock:
+            stamp = source_stamp(self.path)
+            source = load_register(self.path, index=False)
+            _check_ids(source)
+            old = self.df
+            old_ids, new_ids = old[ID_COLUMN], source[ID_COLUMN]
+            kept_mask = _member(old_ids, new_ids)
+            kept = old_ids[kept_mask].to_numpy()
+            # Deltas keep row order: edits in place, removals dropped, additions at the end
+            in_order = list(source.columns) == list(old.columns) and np.array_equal(new_ids.to_numpy()[:len(kept)], kept)
+            if in_order:
+                delta = self._commit(*_merge(old, source, old_ids[~kept_mask].tolist()))
+            else:
+                delta = self._replace(source)
+            self.stamp = stamp
+            return delta
+
+    def refresh(self) -> tuple:
+        """
+        Syncs with the source file if it changed since the last sync.
+        Returns: (df, version) of the latest snapshot
+        """
+        if self.path is not None and source_stamp(self.path) != self.stamp:
+            with self._lock:
+                # Concurrent callers wait for one sync instead of each parsing the file
+                if source_stamp(self.path) != self.stamp:
+                    self.sync()
+        with self._lock:
+            return self.df, self.version
+
+    def _replace(self, df: pd.DataFrame) -> Delta:
+        old_ids, new_ids = self.df[ID_COLUMN], df[ID_COLUMN]
+        known, kept = _member(new_ids, old_ids), _member(old_ids, new_ids)
+        df.index = pd.RangeIndex(1, len(df) + 1)
+        return self._publish(df, Delta(
+            self.version + 1,
+            added=new_ids[~known].tolist(),
+            updated=new_ids[known].tolist(),
+            removed=old_ids[~kept].tolist(),
+            columns=df.columns,
+            moved=True,
+        ), base=None)
+
+    def _commit(self, new: pd.DataFrame, added: list, updated: list, removed: list, columns: set) -> Delta:
+        moved = bool(added or removed)
+        delta = Delta(self.version + 1, added, updated, removed, columns, moved)
+        if not delta:
+            return Delta(self.version)
+        return self._publish(new, delta, base=None if moved else get_index(self.df))
+
+    def _publish(self, df: pd.DataFrame, delta: Delta, base) -> Delta:
+        with span("ingest", **delta.summary()) as s:
+            start = time.perf_counter()
+            build_index(df, base, delta.columns)
+            derive_rollups(self.df, df, delta.columns, delta.moved)
+            s.set(index_seconds=round(time.perf_counter() - start, 3), index_reused=base is not None)
+            self.df, self.version = df, delta.version
+        for callback in list(self._listeners):
+            try:
+                callback(delta, df)
+            except Exception:
+                _log.exception("Register listener %r failed for version %s", callback, delta.version)
+        return delta
+
+
+def watch(store: RegisterStore, interval: float = POLL_SECONDS, stop: Optional[threading.Event] = None,
+          on_delta: Optional[Callable] = None):
+    """
+    Polls the store's source file and applies each edit as a delta until `stop` is set.
+    """
+    stop = stop or threading.Event()
+    while not stop.wait(interval):
+        try:
+            if source_stamp(store.path) == store.stamp:
+                continue
+            delta = store.sync()
+        except (OSError, ValueError) as e:
+            # A half-written file: try again on the next poll
+            _log.warning("Could not sync %s: %s", store.path, e)
+            continue
+        if delta and on_delta is not None:
+            on_delta(delta)
+
+
+def start_watcher(store: RegisterStore, interval: float = POLL_SECONDS) -> threading.Event:
+    """
+    Runs `watch` on a daemon thread; set the returned event to stop it.
+    """
+    stop = threading.Event()
+    threading.Thread(target=watch, args=(store, interval, stop), name="register-watch", daemon=True).start()
+    return stop
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    watch_parser = commands.add_parser("watch", help="apply edits of the source file as deltas")
+    watch_parser.add_argument("path", nargs="?", default=DEFAULT_REGISTER_PATH)
+    watch_parser.add_argument("--interval", type=float, default=POLL_SECONDS)
+    diff_parser = commands.add_parser("diff", help="print the delta between two register files")
+    diff_parser.add_argument("old")
+    diff_parser.add_argument("new")
+    args = parser.parse_args(argv)
+
+    if args.command == "diff":
+        store = RegisterStore(load_register(args.old), args.new)
+        json.dump(store.sync().summary(), sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+
+    store = RegisterStore.from_path(args.path)
+    sys.stderr.write(f"Watching {args.path} ({len(store.df)} rows)\n")
+
+    def report(delta):
+        sys.stdout.write(json.dumps(delta.summary()) + "\n")
+        sys.stdout.flush()
+
+    try:
+        watch(store, args.interval, on_delta=report)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+# intent_classifier.py
+
+import re
+import math
+from collections import Counter
+from typing import Optional
+
+LABELS = ["filter_data", "summarise_risks", "other"]
+
+# ---- rules ------------------------------------------------------------------------------------
+
+# Words that point at a specific field of the register (→ filter_data)
+_FIELD_TERMS = {
+    # regions / contracts
+    "north", "south", "east", "west", "northern", "southern", "eastern", "western", "scotland", "wales",
+    "england", "midlands", "region", "regional", "contract", "contracts",
+    # risk types / areas
+    "financial", "commercial", "contractual", "reputational", "people", "regulatory", "law", "she",
+    "safety", "cybersecurity", "cyber", "operational", "compliance", "environmental", "it",
+    # status / ownership
+    "open", "closed", "owner", "owned", "owners", "raised", "manager", "status",
+    # time
+    "today", "week", "month", "months", "quarter", "year", "years", "fy", "date", "dates", "due",
+    "overdue", "updated", "since", "before", "after", "january", "february", "march", "april",
+    "may", "june", "july", "august", "september", "october", "november", "december",
+    # figures
+    "impact", "impacts", "score", "scores", "likelihood", "cost", "costs", "£", "worst", "best", "expected",
+    "over", "under", "above", "below", "exceeding", "greater", "less", "highest", "lowest",
+}
+_SUMMARY_RE = re.compile(
+    r"\b(summar\w*|overview|trends?|themes?|tell me about|explain the|describe|insights?|key|biggest|top|most|"
+    r"main|who is|who are|what are|how many|pressing|important|concerns?|analy\w*)\b"
+)
+_OTHER_RE = re.compile(
+    r"\b(mean|means|meaning|definition|define|difference between|what does|what is an?\b|what an? \w+( \w+)? is|stand for|"
+    r"how do i|how should|why is|joke|weather|who plays|actor)\b"
+)
+_LIST_RE = re.compile(r"^(show|list|display|give me|find|get|filter|return)\b")
+_DATE_RE = re.compile(r"\b(19|20)\d{2}\b|\b\d{1,2}/\d{1,2}\b|\b\d{4}-\d{2}-\d{2}\b|£\s?\d|\d+\s?(k|m)\b")
+_TOKEN_RE = re.compile(r"£|[a-z0-9]+(?:'[a-z]+)?")
+
+
+def _tokens(text: str) -> list:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def rule_votes(query: str) -> dict:
+    """
+    Keyword/column-name rules. Each label gets True, False or None (no opinion).
+    """
+    text = query.lower()
+    tokens = set(_tokens(text))
+    has_field = bool(tokens & _FIELD_TERMS) or bool(_DATE_RE.search(text)) or "risk owner" in text
+    mentions_risk = "risk" in text or "opportunit" in text
+    wants_summary = bool(_SUMMARY_RE.search(text))
+    asks_other = bool(_OTHER_RE.search(text))
+
+    votes = {label: None for label in LABELS}
+
+    # A general question naming a field may or may not filter on it ("what does FY mean",
+    # "what is due this week"): no opinion, so filter_data is left to the LLM
+    if asks_other and not mentions_risk:
+        votes["filter_data"] = None if has_field else False
+    elif has_field:
+        votes["filter_data"] = True
+
+    if wants_summary:
+        votes["summarise_risks"] = True
+    elif _LIST_RE.search(text) or (asks_other and not mentions_risk):
+        votes["summarise_risks"] = False
+
+    if asks_other:
+        votes["other"] = True
+    elif mentions_risk or _LIST_RE.search(text):
+        votes["other"] = False
+
+    return votes
+
+
+def _features(query: str) -> list:
+    """
+    Bag of words + bigrams, plus the rule votes as extra tokens.
+    """
+    words = _tokens(query)
+    features = words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+    for label, vote in rule_votes(query).items():
+        if vote is not None:
+            features.append(f"__rule_{label}_{vote}")
+    return features
+
+
+# ---- model ------------------------------------------------------------------------------------
+
+# Small labelled seed set (the detect_intent prompt examples plus typical analyst questions)
+SEED_EXAMPLES = [
+    ("What is the biggest risks this quarter and tell me who the risk owner is?", ["filter_data", "summarise_risks"]),
+    ("What are the most pressing risks in the next 12 months and tell me about these risks", ["filter_data", "summarise_risks"]),
+    ("I'm looking at the North Scotland risks and wondering what 'quaich' means", ["filter_data", "other"]),
+    ("Show me all open reputational risks in the south region", ["filter_data"]),
+    ("What is the difference between inherent and residual risk?", ["other"]),
+    ("Show open risks in the north", ["filter_data"]),
+    ("List all closed financial risks", ["filter_data"]),
+    ("Show risks owned by Alice", ["filter_data"]),
+    ("Display risks raised after 2025-06-01", ["filter_data"]),
+    ("Give me risks with expected impact over £500k", ["filter_data"]),
+    ("Find SHE risks on the logistics contract", ["filter_data"]),
+    ("Show regulatory risks due this month", ["filter_data"]),
+    ("List risks with a pre mitigation score above 15", ["filter_data"]),
+    ("Show all people risks in the east region", ["filter_data"]),
+    ("Filter to commercial risks updated in July", ["filter_data"]),
+    ("Show me cybersecurity risks", ["filter_data"]),
+    ("Which risks in the west are still open and what should we do about them?", ["filter_data", "summarise_risks"]),
+    ("Summarise the reputational risks in the north region", ["filter_data", "summarise_risks"]),
+    ("Tell me about the open financial risks", ["filter_data", "summarise_risks"]),
+    ("Who is the risk owner for the data breach risk?", ["filter_data", "summarise_risks"]),
+    ("Give me an overview of risks owned by Bob", ["filter_data", "summarise_risks"]),
+    ("What are the key themes in the south region risks?", ["filter_data", "summarise_risks"]),
+    ("Explain the top 5 risks by expected impact", ["filter_data", "summarise_risks"]),
+    ("How many open SHE risks are there per contract?", ["filter_data", "summarise_risks"]),
+    ("What are the trends in regulatory risks this year?", ["filter_data", "summarise_risks"]),
+    ("Summarise the risk register", ["summarise_risks"]),
+    ("Give me an overview of all the risks", ["summarise_risks"]),
+    ("What are the main themes across the risks?", ["summarise_risks"]),
+    ("Tell me about the risks", ["summarise_risks"]),
+    ("What are the biggest risks we face?", ["summarise_risks"]),
+    ("Describe the overall risk picture", ["summarise_risks"]),
+    ("What does mitigation mean?", ["other"]),
+    ("Define risk appetite", ["other"]),
+    ("What is a risk register?", ["other"]),
+    ("Which actor plays Mufasa in the original Lion King film?", ["other"]),
+    ("What does RAG status stand for?", ["other"]),
+    ("How should I write a good control measure?", ["other"]),
+    ("What's the difference between a risk and an issue?", ["other"]),
+    ("Tell me a joke", ["other"]),
+    ("What is an opportunity in risk management?", ["other"]),
+    ("Summarise the open risks in the north and explain what residual risk means", ["filter_data", "summarise_risks", "other"]),
+    ("Tell me about the financial risks this quarter and what a provision is", ["filter_data", "summarise_risks", "other"]),
+    ("Show the south region risks and define contingency", ["filter_data", "other"]),
+    ("List risks owned by Eve and what does expense mean in accounting treatment", ["filter_data", "other"]),
+    ("Give me an overview of the risks and explain what a risk score is", ["summarise_risks", "other"]),
+]
+
+
+class NaiveBayesIntent:
+    """
+    One binary multinomial Naive Bayes per label over the query features.
+    Tiny, dependency-free and trainable from logged LLM labels.
+    """
+
+    def __init__(self, alpha: float = 1.0):
+        self.alpha = alpha
+        self.counts = {label: {True: Counter(), False: Counter()} for label in LABELS}
+        self.totals = {label: {True: 0, False: 0} for label in LABELS}
+        self.docs = {label: {True: 0, False: 0} for label in LABELS}
+        self.vocabulary = set()
+        self._log_prior = {}
+        self._log_ratio = {}
+
+    def fit(self, examples):
+        for query, labels in examples:
+            features = _features(query)
+            self.vocabulary.update(features)
+            for label in LABELS:
+                cls = label in labels
+                self.counts[label][cls].update(features)
+                self.totals[label][cls] += len(features)
+                self.docs[label][cls] += 1
+
+        # Precompute log P(f|label) - log P(f|not label) so prediction is a dict lookup per feature
+        size = len(self.vocabulary) or 1
+        for label in LABELS:
+            docs = self.docs[label]
+            self._log_prior[label] = math.log((docs[True] + 1) / (docs[False] + 1))
+            denominators = {cls: self.totals[label][cls] + self.alpha * size for cls in (True, False)}
+            self._log_ratio[label] = {
+                f: math.log((self.counts[label][True][f] + self.alpha) / denominators[True])
+                - math.log((self.counts[label][False][f] + self.alpha) / denominators[False])
+                for f in self.vocabulary
+            }
+        return self
+
+    def predict_proba(self, query: str) -> dict:
+        """
+        Probability that each label applies to `query`.
+        """
+        features = _features(query)
+        probs = {}
+        for label in LABELS:
+            ratios = self._log_ratio[label]
+            score = self._log_prior[label] + sum(ratios.get(f, 0.0) for f in features)
+            score = max(min(score, 50.0), -50.0)
+            probs[label] = 1 / (1 + math.exp(-score))
+        return probs
+
+
+_model = NaiveBayesIntent().fit(SEED_EXAMPLES)
+
+# Naive Bayes counts correlated words and bigrams as independent evidence, so on this small
+# seed set its probabilities run close to 0 or 1 ("how many risks are there" → filter_data).
+# A label no rule has an opinion on is held below the default threshold: the LLM decides it.
+_MODEL_ONLY_CERTAINTY = 0.75
+
+
+def retrain(examples):
+    """
+    Rebuilds the local model from the seed set plus extra (query, labels) pairs,
+    e.g. LLM answers collected by the evaluation harness.
+    """
+    global _model
+    _model = NaiveBayesIntent().fit(SEED_EXAMPLES + list(examples))
+
+
+def classify(query: str) -> tuple:
+    """
+    Local intent guess for `query`.
+
+    Returns (labels, confidence). Confidence is the weakest per-label certainty. It drops
+    to 0 when a rule contradicts the model and is at most `_MODEL_ONLY_CERTAINTY` when a
+    label has no rule vote, so the caller falls back to the LLM in both cases. filter_data
+    is never guessed without a rule: it drops to 0 too.
+    """
+    probs = _model.predict_proba(query)
+    votes = rule_votes(query)
+    labels = []
+    confidence = 1.0
+    for label in LABELS:
+        decision = probs[label] >= 0.5
+        certainty = max(probs[label], 1 - probs[label])
+        vote = votes[label]
+        if vote is None and label == "filter_data" and decision:
+            certainty = 0.0
+        elif vote is None:
+            certainty = min(certainty, _MODEL_ONLY_CERTAINTY)
+        elif vote != decision:
+            certainty = 0.0
+        else:
+            certainty = 1 - (1 - certainty) / 2
+        confidence = min(confidence, certainty)
+        if decision:
+            labels.append(label)
+    if not labels:
+        return [], 0.0
+    return labels, confidence
+
+
+def fast_intent(query: str, threshold: float) -> Optional[list]:
+    """
+    The local answer if it is at least `threshold` confident, else None.
+    """
+    labels, confidence = classify(query)
+    if confidence >= threshold:
+        return labels
+    return None
@@ -2,15 +2,16 @@
 
 import os
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
-import streamlit as st
-from src.fetch_key import get_openai_key
+import threading
+from collections import OrderedDict
+from typing import Optional
+from src.calls import acomplete, complete
+from src.intent_classifier import LABELS, fast_intent
+from src.plan_cache import normalize_query
+from src.tracing import current, span
 
-api_key = get_openai_key()
-if not api_key:
-    raise RuntimeError("OPENAI_API_KEY not found—please set it in your .env or shell or add to secrets.")
-client = OpenAI(api_key=api_key)
+# Local classifier answers when at least this confident; otherwise the LLM decides
+CONFIDENCE_THRESHOLD = float(os.getenv("ROBO_INTENT_THRESHOLD", "0.9"))
 
 # Your system instruction:
 SYSTEM_PROMPT = """
@@ -53,14 +54,100 @@ Note: - Often when you filter the user may benefit from a summary, if they ask f
 **Actions**: ["other"]
 """
 
-def detect_intent(user_input: str) -> list:
-    resp = client.chat.completions.create(
-        model="gpt-4.1-nano",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT.strip()},
-            {"role": "user",   "content": user_input}
-        ],
-        temperature=0
-    )
+def _messages(user_input: str) -> list:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT.strip()},
+        {"role": "user",   "content": user_input}
+    ]
+
+
+def llm_detect_intent(user_input: str) -> list:
+    """
+    Classifies `user_input` with gpt-4.1-nano.
+    """
+    with span("intent.llm", model="gpt-4.1-nano") as s:
+        resp = complete(
+            "intent",
+            model="gpt-4.1-nano",
+            messages=_messages(user_input),
+            temperature=0
+        )
+        s.usage(resp)
     raw = resp.choices[0].message.content
-    return json.loads(raw)
\ No newline at end of file
+    return json.loads(raw)
+
+
+async def allm_detect_intent(user_input: str) -> list:
+    """
+    Async version of `llm_detect_intent`.
+    """
+    with span("intent.llm", model="gpt-4.1-nano") as s:
+        resp = await acomplete(
+            "intent",
+            model="gpt-4.1-nano",
+            messages=_messages(user_input),
+            temperature=0
+        )
+        s.usage(resp)
+    raw = resp.choices[0].message.content
+    return json.loads(raw)
+
+
+# Memo of answers per normalised query (local or LLM)
+_MEMO_SIZE = 1024
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _remember(query: str, labels) -> list:
+    labels = [label for label in LABELS if label in labels]
+    with _memo_lock:
+        _memo[query] = labels
+        _memo.move_to_end(query)
+        while len(_memo) > _MEMO_SIZE:
+            _memo.popitem(last=False)
+    return list(labels)
+
+
+def known_intent(user_input: str) -> Optional[list]:
+    """
+    The intent if it can be answered without the LLM (memo or confident local classifier), else None.
+    """
+    query = normalize_query(user_input)
+    with _memo_lock:
+        if query in _memo:
+            _memo.move_to_end(query)
+            current().set(intent_source="memo")
+            return list(_memo[query])
+    local = fast_intent(query, CONFIDENCE_THRESHOLD)
+    if local is not None:
+        current().set(intent_source="local")
+        return _remember(query, local)
+    return None
+
+
+def detect_intent(user_input: str) -> list:
+    """
+    Returns the list of actions for `user_input`.
+    Tries the local classifier (on the normalised query) first, falls back to the LLM (on
+    `user_input` as typed), and memoizes per normalised query.
+    """
+    with span("intent") as s:
+        known = known_intent(user_input)
+        if known is not None:
+            return known
+        s.set(intent_source="llm")
+        # The model sees what the user typed; the memo is keyed by the normalised form
+        return _remember(normalize_query(user_input), llm_detect_intent(user_input))
+
+
+async def adetect_intent(user_input: str) -> list:
+    """
+    Async version of `detect_intent`.
+    """
+    with span("intent") as s:
+        known = known_intent(user_input)
+        if known is not None:
+            return known
+        s.set(intent_source="llm")
+        return _remember(normalize_query(user_input), await allm_detect_intent(user_input))
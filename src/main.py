@@ -1,9 +1,41 @@
 # main.py
-from dotenv import load_dotenv
-import pandas as pd
-from src.filterer import filter_assistant 
-from src.summariser import summary_assistant
-from src.other import other_assistant
+import os
+import asyncio
+from typing import Iterator, Optional
+from src.filter_engine import FilterRejected, filter_rows
+from src.filterer import afilter_assistant, filter_assistant, forget_plan
+from src.intent_detector import adetect_intent, detect_intent, known_intent
+from src.summariser import asummary_assistant, summary_assistant
+from src.other import aother_assistant, other_assistant
+from src.planner import answer_data, aplan_query, plan_query
+from src.tracing import span
+
+# Per-step deadlines (seconds) for the async pipeline
+STEP_TIMEOUTS = {"intent": 15, "filter": 45, "plan": 45, "summary": 90, "other": 90}
+# "multi": intent, filter and summary assistants in turn; "fused": one planner call + one answer call
+PLANNER = os.getenv("ROBO_PLANNER", "multi")
+
+
+def _run_filter(user_query, df):
+    """
+    Generates the filter for `user_query` and applies it to `df`.
+    Returns: (filtered_df, filter_explanation); filtered_df is a RowSet over `df`
+    (src/result.py), so its columns are only materialised where they are needed
+    """
+    return _apply_filter(filter_assistant(user_query, df=df), df, user_query)
+
+
+def _apply_filter(filter_json, df, user_query=None):
+    # Generated code is compiled into a validated plan, never exec'd
+    with span("filter.apply", rows_in=len(df)) as s:
+        try:
+            filtered_df = filter_rows(filter_json['code'], df)
+        except FilterRejected:
+            if user_query is not None:
+                forget_plan(user_query)  # a cached plan the register rejects is not served again
+            raise
+        s.set(rows_out=len(filtered_df))
+    return filtered_df, filter_json['explanation']
 
 
 def process_query(user_query, df, intent):
@@ -11,28 +43,234 @@ def process_query(user_query, df, intent):
     Handles full pipeline given a user_query and a DataFrame.
     Returns: (filtered_df, filter_explanation, summary, final_summary)
     """
-    filtered_df = None
-    filter_explanation = ""
-    summary = ""
-    final_summary = ""
+    with span("query", intent=",".join(intent)):
+        filtered_df = None
+        filter_explanation = ""
+        summary = ""
+        final_summary = ""
+
+        if "filter_data" in intent:
+            filtered_df, filter_explanation = _run_filter(user_query, df)
+
+        if "summarise_risks" in intent:
+            # Without a filter the summariser reads the whole register (token-budgeted in payload.py)
+            data = filtered_df if "filter_data" in intent else df
+            summary = summary_assistant(user_query, data, filter_explanation, intent)
+
+        if "other" in intent:
+            if "summarise_risks" not in intent:
+                final_summary = other_assistant(user_query, summary, filter_explanation, filtered_df)
+
+            else:
+               final_summary = other_assistant(user_query, summary, filter_explanation)
+
+        return filtered_df, filter_explanation, summary, final_summary
+
+
+def stream_query(user_query, df, intent) -> Iterator[tuple]:
+    """
+    Streaming version of `process_query`. Yields events as soon as they are available:
+        ("filter", (filtered_df, filter_explanation))  once the filter step is done
+        ("token", text)                                 answer text as the model produces it
+        ("done", (filtered_df, filter_explanation, summary, final_summary))
+    The streamed answer is the final summary when "other" is in the intent, else the summary.
+    """
+    with span("query", intent=",".join(intent), stream=True):
+        filtered_df = None
+        filter_explanation = ""
+        summary = ""
+        final_summary = ""
+
+        if "filter_data" in intent:
+            filtered_df, filter_explanation = _run_filter(user_query, df)
+            yield "filter", (filtered_df, filter_explanation)
+
+        if "summarise_risks" in intent:
+            data = filtered_df if "filter_data" in intent else df
+            if "other" in intent:
+                # The final assistant builds on the full summary, so it is not streamed
+                summary = summary_assistant(user_query, data, filter_explanation, intent)
+            else:
+                parts = []
+                for token in summary_assistant(user_query, data, filter_explanation, intent, stream=True):
+                    parts.append(token)
+                    yield "token", token
+                summary = "".join(parts).strip()
 
-    if "filter_data" in intent:
-        filter_json = filter_assistant(user_query)
-        pandas_code = filter_json['code']
-        filter_explanation = filter_json['explanation']
-        ns = {"df": df, "pd": pd}
-        exec(pandas_code, ns)
-        filtered_df = ns['filtered_df']
+        if "other" in intent:
+            if "summarise_risks" not in intent:
+                tokens = other_assistant(user_query, summary, filter_explanation, filtered_df, stream=True)
+            else:
+                tokens = other_assistant(user_query, summary, filter_explanation, stream=True)
+            parts = []
+            for token in tokens:
+                parts.append(token)
+                yield "token", token
+            final_summary = "".join(parts).strip()
 
-    if "summarise_risks" in intent:
-        summary = summary_assistant(user_query, filtered_df, filter_explanation, intent)
+        yield "done", (filtered_df, filter_explanation, summary, final_summary)
 
+
+def _answer_args(plan, user_query, df, filtered_df, filter_explanation):
+    """
+    (answering assistant, its arguments) for a planned query: the summariser, or the final
+    assistant when the question goes beyond the data, reading the rows itself.
+    """
+    intent = plan["intent"]
+    rows = filtered_df if "filter_data" in intent else (df if "summarise_risks" in intent else None)
+    data = answer_data(plan, user_query, rows, filter_explanation) if rows is not None else None
     if "other" in intent:
-        if "summarise_risks" not in intent:
-            final_summary = other_assistant(user_query, summary, filter_explanation, filtered_df)
+        return "other", (user_query, None, filter_explanation, rows), {"data": data}
+    return "summary", (user_query, rows, filter_explanation, intent), {"data": data}
+
+
+def fused_query(user_query, df):
+    """
+    `detect_intent` + `process_query` with the fused planner (src/planner.py): one call plans
+    the intent, the filter and the data the answer needs, one call writes the answer.
+    Returns: (intent, filtered_df, filter_explanation, summary, final_summary)
+    """
+    with span("query", planner="fused") as s:
+        plan = plan_query(user_query)
+        intent = plan["intent"]
+        s.set(intent=",".join(intent))
+        filtered_df = None
+        filter_explanation = ""
+        summary = ""
+        final_summary = ""
+
+        if "filter_data" in intent:
+            filtered_df, filter_explanation = _apply_filter(plan, df)
+
+        if "summarise_risks" in intent or "other" in intent:
+            kind, args, kwargs = _answer_args(plan, user_query, df, filtered_df, filter_explanation)
+            if kind == "other":
+                final_summary = other_assistant(*args, **kwargs)
+            else:
+                summary = summary_assistant(*args, **kwargs)
+
+        return intent, filtered_df, filter_explanation, summary, final_summary
 
-        else:
-           final_summary = other_assistant(user_query, summary, filter_explanation)
 
-    return filtered_df, filter_explanation, summary, final_summary
+def run_query(user_query, df):
+    """
+    Detects the intent and runs the pipeline, on the planner path chosen by ROBO_PLANNER.
+    Returns: (intent, filtered_df, filter_explanation, summary, final_summary)
+    """
+    if PLANNER == "fused":
+        return fused_query(user_query, df)
+    intent = detect_intent(user_query)
+    return (intent, *process_query(user_query, df, intent))
+
+
+async def _step(name, coro, timeouts):
+    """
+    Awaits one pipeline step under its deadline.
+    """
+    try:
+        return await asyncio.wait_for(coro, timeouts[name])
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"The {name} step did not finish within {timeouts[name]}s") from None
+
+
+async def aprocess_query(user_query, df, intent, timeouts: Optional[dict] = None, _filter_task=None):
+    """
+    Async version of `process_query` on the AsyncOpenAI clients, with per-step timeouts.
+    Returns: (filtered_df, filter_explanation, summary, final_summary)
+    """
+    timeouts = {**STEP_TIMEOUTS, **(timeouts or {})}
+    with span("query", intent=",".join(intent)):
+        filtered_df = None
+        filter_explanation = ""
+        summary = ""
+        final_summary = ""
+
+        if "filter_data" in intent:
+            if _filter_task is None:
+                _filter_task = asyncio.ensure_future(_step("filter", afilter_assistant(user_query, df=df), timeouts))
+            filter_json = await _filter_task
+            # Applying the filter is CPU work; keep it off the event loop
+            filtered_df, filter_explanation = await asyncio.to_thread(_apply_filter, filter_json, df, user_query)
+        elif _filter_task is not None:
+            # Speculation lost: drop the filter (and any error it raised)
+            _filter_task.cancel()
+            _filter_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+        if "summarise_risks" in intent:
+            data = filtered_df if "filter_data" in intent else df
+            summary = await _step("summary", asummary_assistant(user_query, data, filter_explanation, intent), timeouts)
+
+        if "other" in intent:
+            if "summarise_risks" not in intent:
+                final_summary = await _step(
+                    "other", aother_assistant(user_query, summary, filter_explanation, filtered_df), timeouts
+                )
+            else:
+                final_summary = await _step("other", aother_assistant(user_query, summary, filter_explanation), timeouts)
+
+        return filtered_df, filter_explanation, summary, final_summary
+
+
+async def afused_query(user_query, df, timeouts: Optional[dict] = None):
+    """
+    Async version of `fused_query`, with per-step timeouts.
+    Returns: (intent, filtered_df, filter_explanation, summary, final_summary)
+    """
+    timeouts = {**STEP_TIMEOUTS, **(timeouts or {})}
+    with span("query", planner="fused") as s:
+        plan = await _step("plan", aplan_query(user_query), timeouts)
+        intent = plan["intent"]
+        s.set(intent=",".join(intent))
+        filtered_df = None
+        filter_explanation = ""
+        summary = ""
+        final_summary = ""
+
+        if "filter_data" in intent:
+            filtered_df, filter_explanation = await asyncio.to_thread(_apply_filter, plan, df)
+
+        if "summarise_risks" in intent or "other" in intent:
+            kind, args, kwargs = await asyncio.to_thread(
+                _answer_args, plan, user_query, df, filtered_df, filter_explanation
+            )
+            if kind == "other":
+                final_summary = await _step("other", aother_assistant(*args, **kwargs), timeouts)
+            else:
+                summary = await _step("summary", asummary_assistant(*args, **kwargs), timeouts)
+
+        return intent, filtered_df, filter_explanation, summary, final_summary
+
+
+async def arun_query(user_query, df, timeouts: Optional[dict] = None):
+    """
+    Detects the intent and runs the pipeline asynchronously.
+
+    When the intent needs the LLM, filter generation starts speculatively at the same
+    time and is cancelled if the intent turns out not to include filter_data, so a
+    filter query no longer waits for two model round trips in a row.
+    With ROBO_PLANNER=fused the fused planner path (`afused_query`) runs instead.
+    Returns: (intent, filtered_df, filter_explanation, summary, final_summary)
+    """
+    timeouts = {**STEP_TIMEOUTS, **(timeouts or {})}
+    if PLANNER == "fused":
+        with span("request"):
+            return await afused_query(user_query, df, timeouts)
+    with span("request"):
+        intent = known_intent(user_query)
+        filter_task = None
+
+        if intent is None:
+            filter_task = asyncio.ensure_future(_step("filter", afilter_assistant(user_query, df=df), timeouts))
+            try:
+                intent = await _step("intent", adetect_intent(user_query), timeouts)
+            except BaseException:
+                filter_task.cancel()
+                raise
 
+        try:
+            result = await aprocess_query(user_query, df, intent, timeouts, _filter_task=filter_task)
+        except BaseException:
+            if filter_task is not None:
+                filter_task.cancel()
+            raise
+    return (intent, *result)
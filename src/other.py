@@ -1,22 +1,14 @@
 # other.py
 
-import os
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
 import pandas as pd
-from typing import Optional
-import streamlit as st
-from src.fetch_key import get_openai_key
+from typing import Iterator, Optional, Union
+from src.calls import acomplete, complete, stream as stream_completion
+from src.payload import build_payload
+from src.result import RowSet
+from src.tracing import span
 
-api_key = get_openai_key()
-if not api_key:
-    raise RuntimeError("OPENAI_API_KEY not found—please set it in your .env or shell or add to secrets.")
-if not api_key:
-    raise RuntimeError("OPENAI_API_KEY not found—please set it in your .env or shell.")
-
-# Initialize OpenAI client
-client = OpenAI(api_key=api_key)
+_MODEL = "gpt-4o-mini"
 
 # System prompt for generating high quality summaries
 _SYSTEM_PROMPT = """
@@ -42,13 +34,15 @@ INSTRUCTIONS:
    • `user_prompt` (string): the user's question
    • `prior_summary` (string or null): summary of filtered data or outputs from prior assistants (may be omitted)
    • `filter_explanation` (string or null): explanation of how data was filtered (may be omitted)
-   • `filtered_df` (dataframe converted to JSON or null): filtered risk data (may be omitted)
+   • `filtered_data` (object or null): filtered risk data (may be omitted), given compactly as `csv` text with only the relevant columns, a `row_count`, optional `constant_columns` shared by every row, and — for large results — `aggregates` over all rows with only the highest-risk rows (or, with `retrieved`, the rows most relevant to the question) in `csv`
+     - `partial_summaries` (instead of `csv`, for very large sets): findings written for each group of rows, together covering ALL rows, plus `aggregates` over all rows. Combine them into one answer.
+     - `computed` (instead of `csv`, for totals, averages, counts and top-N questions): the exact answer already calculated over ALL matching rows (`description` and a small `csv` table). Report these figures as given; never recalculate or estimate them.
 
 2. RESPONSE LOGIC:
    • If `prior_summary` is provided:
       - Reference, quote, or clarify the summary, making it relevant to the user's prompt.
-      - Use `filtered_df` to supplement your answer with specific data or examples only if it adds value or clarity.
-   • If only `filtered_df` is provided:
+      - Use `filtered_data` to supplement your answer with specific data or examples only if it adds value or clarity.
+   • If only `filtered_data` is provided:
       - Analyze and summarize the data to directly answer the user's question.
    • If neither is provided or data is empty:
       - Respond: "No risks matched the criteria."
@@ -81,21 +75,13 @@ EXAMPLES:
 ----------------------------------------------------
 """
 
-def other_assistant(
+def _messages(
     user_input: str,
     prior_summary: Optional[str] = None,
     filter_explanation: Optional[str] = None,
-    filtered_df: Optional[pd.DataFrame] = None
-) -> str:
-    """
-    Generate a final summary report for `user_input` using:
-        - earlier summary report 
-        - user prompt
-        - filter explanation
-
-    Returns the assistant's summary as a string.
-    """
-
+    filtered_df: Optional[Union[pd.DataFrame, RowSet]] = None,
+    data: Optional[dict] = None
+) -> list:
     payload = {"user_prompt": user_input}
 
     if filter_explanation is not None:
@@ -103,21 +89,102 @@ def other_assistant(
 
     if prior_summary is not None:
         payload['prior_summary'] = prior_summary
-    
+
     if filtered_df is not None:
-        records = filtered_df.to_dict(orient="records")
-        payload["filtered_data"] = records
-
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system",  "content": _SYSTEM_PROMPT.strip()},
-            {"role": "user",    "content": json.dumps(payload)}
-        ],
-        temperature=0
-    )
+        payload["filtered_data"] = data if data is not None else build_payload(filtered_df, user_input)
+
+    return [
+        {"role": "system",  "content": _SYSTEM_PROMPT.strip()},
+        {"role": "user",    "content": json.dumps(payload)}
+    ]
+
 
+def _text(response) -> str:
     final_summary = response.choices[0].message.content.strip()
     if not final_summary:
         raise ValueError("Empty summary returned")
-    return final_summary
\ No newline at end of file
+    return final_summary
+
+
+def _traced_messages(
+    user_input: str,
+    prior_summary: Optional[str],
+    filter_explanation: Optional[str],
+    filtered_df: Optional[Union[pd.DataFrame, RowSet]],
+    data: Optional[dict] = None
+) -> list:
+    with span("other.payload", rows=None if filtered_df is None else len(filtered_df)) as s:
+        messages = _messages(user_input, prior_summary, filter_explanation, filtered_df, data)
+        s.set(payload_bytes=len(messages[-1]["content"]))
+    return messages
+
+
+def other_assistant(
+    user_input: str,
+    prior_summary: Optional[str] = None,
+    filter_explanation: Optional[str] = None,
+    filtered_df: Optional[Union[pd.DataFrame, RowSet]] = None,
+    stream: bool = False,
+    data: Optional[dict] = None
+) -> Union[str, Iterator[str]]:
+    """
+    Generate a final summary report for `user_input` using:
+        - earlier summary report 
+        - user prompt
+        - filter explanation
+        - the filtered rows, as `data` if their prompt data is already built
+
+    Returns the assistant's summary as a string, or with `stream=True` an iterator
+    over the text as the model produces it.
+    """
+    messages = _traced_messages(user_input, prior_summary, filter_explanation, filtered_df, data)
+    if stream:
+        return _stream(messages)
+
+    with span("other", model=_MODEL) as s:
+        response = complete(
+            "other",
+            model=_MODEL,
+            messages=messages,
+            temperature=0
+        )
+        s.usage(response)
+    return _text(response)
+
+
+async def aother_assistant(
+    user_input: str,
+    prior_summary: Optional[str] = None,
+    filter_explanation: Optional[str] = None,
+    filtered_df: Optional[Union[pd.DataFrame, RowSet]] = None,
+    data: Optional[dict] = None
+) -> str:
+    """
+    Async version of `other_assistant`.
+    """
+    messages = _traced_messages(user_input, prior_summary, filter_explanation, filtered_df, data)
+    with span("other", model=_MODEL) as s:
+        response = await acomplete(
+            "other",
+            model=_MODEL,
+            messages=messages,
+            temperature=0
+        )
+        s.usage(response)
+    return _text(response)
+
+
+def _stream(messages: list) -> Iterator[str]:
+    with span("other", model=_MODEL, stream=True) as s:
+        response = stream_completion(
+            "other",
+            model=_MODEL,
+            messages=messages,
+            temperature=0,
+            stream_options={"include_usage": True}
+        )
+        for chunk in response:
+            if chunk.usage is not None:
+                s.usage(chunk)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
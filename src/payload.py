@@ -0,0 +1,386 @@
+# payload.py
+
+import io
+import os
+import re
+import csv
+import math
+from typing import Optional, Union
+
+import pandas as pd
+
+from src.result import RowSet, as_frame
+from src.retrieval import RETRIEVAL_K, names_topic, relevant_rows
+
+# Prompt budget for the data part of a payload (tokens)
+DEFAULT_TOKEN_BUDGET = int(os.getenv("ROBO_PAYLOAD_TOKEN_BUDGET", "6000"))
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken is optional; fall back to the ~4 chars/token rule of thumb
+    _ENCODING = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Token count of `text` (exact with tiktoken installed, estimated otherwise).
+    """
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+# Columns every payload carries, so the model can always name and describe a risk
+_CORE_COLUMNS = [
+    "RiskIDNumber", "Risk Area", "Description of Risk/Opportunity", "Status",
+]
+
+# Columns used when the question does not point anywhere in particular
+_DEFAULT_COLUMNS = [
+    "Contract", "Contract:Region", "Risk/Opportunity", "Risk Owner",
+    "Risk Type - Financial", "Risk Type - Commercial/Contractual", "Risk Type - Reputational",
+    "Risk Type - People", "Risk Type - Regulatory and Law", "Risk Type - SHE",
+    "Probability - Pre Mitigation - Score (out of 25)", "Probability - Post Mitigation - Score (out of 25)",
+    "Impact (£) - Expected", "Control Measure / Mitigation", "By When",
+]
+
+# Question keywords → extra columns they need
+_KEYWORD_COLUMNS = [
+    (r"\bwho\b|owner|owned|raised by|manager|responsib", [
+        "Risk Owner", "Raised By", "Contract Manager", "Regional Manager"]),
+    (r"region|contract|north|south|east|west|scotland", ["Contract", "Contract:Region"]),
+    (r"date|when|due|overdue|month|quarter|week|year|recent|updated|raised|deadline|timeline", [
+        "Date Raised", "Date Updated", "By When"]),
+    (r"impact|£|cost|exposure|financial|money|value|worst|best case|expected|biggest|largest", [
+        "Impact (£) - Worst Case (Unmitigated)", "Impact (£) - Best Case", "Impact (£) - Expected",
+        "Sum of Financial Year Impacts"]),
+    (r"score|likelihood|probability|severity|rating|pressing|critical|top|highest|important", [
+        "Probability - Pre Mitigation - Likelihood", "Probability - Pre Mitigation - Impact",
+        "Probability - Pre Mitigation - Score (out of 25)", "Probability - Post Mitigation - Likelihood",
+        "Probability - Post Mitigation - Impact", "Probability - Post Mitigation - Score (out of 25)"]),
+    (r"%|percent", [
+        "Probability - Pre Mitigation - % Risk Score", "Probability - Post Mitigation - % Risk Score"]),
+    (r"mitigat|control|action|plan|residual|post", [
+        "Control Measure / Mitigation", "By When", "Probability - Post Mitigation - Score (out of 25)"]),
+    (r"opportunit", ["Risk/Opportunity"]),
+    (r"paper|document|link", ["Risk Paper"]),
+    (r"origin|source|audit", ["OriginList"]),
+]
+FY_RE = re.compile(r"\b(?:fy\s*)?(\d{2})\s*[-/]\s*(\d{2})\b", re.IGNORECASE)
+_FY_ANY_RE = re.compile(r"financial year|\bfy\b|yearly|per year|annual", re.IGNORECASE)
+_ACCOUNTING_RE = re.compile(r"accounting|treatment|provision|expense|accrual", re.IGNORECASE)
+
+# Row ranking used when a payload has to be cut down
+_RANK_COLUMNS = ["Probability - Post Mitigation - Score (out of 25)", "Impact (£) - Expected"]
+# Questions about every row, answered from all of them rather than the most relevant few
+_EVERY_ROW_RE = re.compile(r"\b(summar\w*|overview|all|every\w*|each|overall|across|themes?|trends?|whole|entire)\b",
+                           re.IGNORECASE)
+# Groupings reported when rows are aggregated (largest groups only)
+GROUP_COLUMNS = ["Risk Area", "Contract:Region", "Status", "Risk Owner"]
+MAX_GROUPS = 20
+SUM_COLUMNS = ["Impact (£) - Expected", "Impact (£) - Worst Case (Unmitigated)", "Sum of Financial Year Impacts"]
+
+
+def select_columns(df: pd.DataFrame, question: str) -> list:
+    """
+    The columns of `df` that `question` plausibly needs, in register order.
+    """
+    question = question or ""
+    text = question.lower()
+    wanted = set(_CORE_COLUMNS)
+    matched_keyword = False
+
+    for pattern, columns in _KEYWORD_COLUMNS:
+        if re.search(pattern, text):
+            wanted.update(columns)
+            matched_keyword = True
+
+    fy_columns = [c for c in df.columns if c.startswith("Expected Impact FY")]
+    accounting = _ACCOUNTING_RE.search(text)
+    years = {f"{a}-{b}" for a, b in FY_RE.findall(question)}
+    for column in fy_columns:
+        year = column.rsplit(" ", 1)[-1]
+        if year in years or (_FY_ANY_RE.search(text) and not years):
+            wanted.add(column)
+            if accounting:
+                wanted.add(f"Accounting Treatment FY {year}")
+    if accounting and not years:
+        wanted.update(c for c in df.columns if c.startswith("Accounting Treatment FY"))
+
+    # Columns named explicitly in the question
+    wanted.update(c for c in df.columns if c.lower() in text)
+
+    if not matched_keyword:
+        wanted.update(_DEFAULT_COLUMNS)
+
+    return [c for c in df.columns if c in wanted]
+
+
+def with_core_columns(df: pd.DataFrame, columns: list) -> list:
+    """
+    `columns` plus the columns every payload carries, in register order.
+    """
+    wanted = set(columns) | set(_CORE_COLUMNS)
+    return [c for c in df.columns if c in wanted]
+
+
+def format_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compact, JSON-safe cell values: ISO dates, integers without ".0", no NaN.
+    """
+    out = {}
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            series = series.dt.strftime("%Y-%m-%d")
+        elif pd.api.types.is_float_dtype(series):
+            non_null = series.dropna()
+            if len(non_null) and (non_null % 1 == 0).all():
+                series = series.astype("Int64")
+        out[column] = series
+    return pd.DataFrame(out, index=df.index)
+
+
+def _scalar(value):
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def frame_csv(df: pd.DataFrame) -> str:
+    return format_frame(df).to_csv(index=False, lineterminator="\n").strip()
+
+
+def _rank(df: Union[pd.DataFrame, RowSet]) -> list:
+    """
+    Row positions of `df`, highest-risk rows first, so truncation keeps the rows a summary
+    cares about most. Reads the ranking columns of `df` whether or not a payload shows them.
+    """
+    keys = [c for c in _RANK_COLUMNS if c in df.columns]
+    if not keys:
+        return list(range(len(df)))
+    values = as_frame(df, keys).reset_index(drop=True)
+    return values.sort_values(keys, ascending=False, na_position="last", kind="stable").index.tolist()
+
+
+def aggregate(df: Union[pd.DataFrame, RowSet], groups: Optional[list] = None) -> dict:
+    """
+    Small per-group rollups (counts and £ sums) describing all rows of `df`, grouped by
+    each of `groups` (default: risk area, region, status and owner).
+    """
+    groups = GROUP_COLUMNS if groups is None else groups
+    df = as_frame(df, list(dict.fromkeys(c for c in groups + SUM_COLUMNS if c in df.columns)))
+    sums = [c for c in SUM_COLUMNS if c in df.columns and pd.api.types.is_numeric_dtype(df[c])]
+    result = {"row_count": int(len(df))}
+    if sums:
+        result["totals"] = {c: float(df[c].sum()) for c in sums}
+    for group in (c for c in groups if c in df.columns):
+        grouped = df.groupby(group, observed=True, dropna=False)
+        table = grouped.size().rename("count").to_frame()
+        for column in sums:
+            table[column] = grouped[column].sum()
+        table = table.reset_index().sort_values("count", ascending=False).head(MAX_GROUPS)
+        result[f"by {group}"] = frame_csv(table)
+    return result
+
+
+def _retrieves(question: str) -> bool:
+    """
+    Whether an over-budget payload shows the rows most relevant to `question`: not when it
+    asks about every row ("summarise all open risks") without naming a topic.
+    """
+    if not RETRIEVAL_K or not question:
+        return False
+    return names_topic(question) or not _EVERY_ROW_RE.search(question)
+
+
+def build_payload(
+    df: Union[pd.DataFrame, RowSet],
+    question: str = "",
+    token_budget: Optional[int] = None,
+    columns: Optional[list] = None,
+    sample: bool = True,
+) -> Optional[dict]:
+    """
+    Compact, token-budgeted representation of `df` for an LLM prompt.
+
+    - projects to the columns the question needs (or `columns`)
+    - drops empty columns and lifts constant ones into `constant_columns`
+    - encodes rows as CSV text (header once, not per row)
+    - over `token_budget`, keeps the rows that fit plus `aggregates` over all rows: the (at most
+      ROBO_RETRIEVAL_K) rows most relevant to the question when some are and the question names
+      a topic or does not ask about every row (src/retrieval.py), else the highest-risk rows; or,
+      with `sample=False`, returns None instead of those (the caller summarises all rows another
+      way, see summariser map-reduce)
+    """
+    budget = DEFAULT_TOKEN_BUDGET if token_budget is None else token_budget
+    payload = {"format": "csv", "row_count": int(len(df))}
+    if df.empty:
+        payload["csv"] = ""
+        return payload
+
+    frame = as_frame(df, columns if columns is not None else select_columns(df, question))
+    frame = frame.dropna(axis=1, how="all")
+
+    if len(frame) > 1:
+        constant = [c for c in frame.columns if frame[c].nunique(dropna=False) == 1 and c not in _CORE_COLUMNS]
+        if constant:
+            first = format_frame(frame[constant].iloc[:1]).iloc[0]
+            payload["constant_columns"] = {c: _scalar(first[c]) for c in constant}
+            frame = frame.drop(columns=constant)
+
+    text = frame_csv(frame)
+    tokens = count_tokens(text)
+    if tokens <= budget:
+        payload["csv"] = text
+        payload["tokens"] = tokens
+        return payload
+
+    # Over budget: aggregates over everything + as many top rows as still fit
+    hits = relevant_rows(df, question) if _retrieves(question) else []
+    if not len(hits) and not sample:
+        return None
+    payload["aggregates"] = aggregate(df)
+    remaining = budget - count_tokens(str(payload["aggregates"]))
+    if len(hits):
+        ranked, order = frame.iloc[hits], "most relevant to the question first"
+        payload["retrieved"] = True
+    else:
+        ranked, order = frame.iloc[_rank(df)], "highest post-mitigation score / expected impact first"
+    lo, hi = 0, len(ranked)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(frame_csv(ranked.iloc[:mid])) <= remaining:
+            lo = mid
+        else:
+            hi = mid - 1
+    text = frame_csv(ranked.iloc[:lo]) if lo else ""
+    payload["csv"] = text
+    payload["sampled"] = f"{lo} of {len(frame)} rows shown, {order}"
+    payload["tokens"] = count_tokens(text) + count_tokens(str(payload["aggregates"]))
+    return payload
+
+
+def _shown_columns(payload: dict) -> set:
+    header = next(csv.reader(io.StringIO(payload.get("csv") or "")), [])
+    return set(header) | set(payload.get("constant_columns", {}))
+
+
+def delta_payload(
+    previous: Optional[dict],
+    df: Union[pd.DataFrame, RowSet],
+    question: str = "",
+) -> Optional[dict]:
+    """
+    Compact representation of `df`, a subset of rows already sent in full as `previous`
+    (a follow-up narrowing an earlier result, see src/session.py): the RiskIDNumbers of the
+    rows that remain, plus a CSV of only the columns the new question needs that `previous`
+    did not show. None when `previous` was sampled, aggregated or lacks the IDs, since the
+    model has then not seen every row.
+    """
+    if not previous or "csv" not in previous or "sampled" in previous:
+        return None
+    shown = _shown_columns(previous)
+    if "RiskIDNumber" not in shown and previous.get("row_count"):
+        return None
+
+    payload = {"format": "delta", "row_count": int(len(df))}
+    if df.empty:
+        payload["risk_ids"] = []
+        return payload
+    payload["risk_ids"] = [_scalar(v) for v in df["RiskIDNumber"]]
+    new_columns = [c for c in select_columns(df, question) if c not in shown]
+    if new_columns:
+        extra = build_payload(df, question, columns=["RiskIDNumber"] + new_columns)
+        if "constant_columns" in extra:
+            payload["constant_columns"] = extra["constant_columns"]
+        # Unless every new column was constant (the IDs alone are already in `risk_ids`)
+        if _shown_columns({"csv": extra["csv"]}) - {"RiskIDNumber"}:
+            for key in ("csv", "aggregates", "sampled", "retrieved"):
+                if key in extra:
+                    payload[key] = extra[key]
+    payload["tokens"] = count_tokens(str(payload))
+    return payload
+
+
+# Columns tried, in order, to split rows into chunks that summarise well on their own
+_PARTITION_COLUMNS = ["Risk Area", "Contract:Region"]
+_MAX_PARTITION_GROUPS = 50
+# A chunk is cut early at a boundary row only once it holds this share of the budget
+_MIN_CHUNK_FILL = 0.25
+
+
+def partition(
+    df: Union[pd.DataFrame, RowSet],
+    question: str = "",
+    token_budget: Optional[int] = None,
+    columns: Optional[list] = None,
+) -> list:
+    """
+    Splits `df` into chunks whose CSV fits `token_budget`, for map-reduce summarisation.
+
+    Rows are grouped by risk area (or region) when that gives a manageable number of
+    groups, in register order. Within a group, chunk boundaries are content-defined: a
+    chunk ends after a row whose RiskIDNumber hash is a multiple of a divisor sized so
+    chunks average about half the budget, or earlier if the next row would not fit. An
+    edited, added or removed row therefore only changes the chunk it falls in; chunks are
+    labelled by their first and last RiskIDNumber, which the edit does not move either.
+    Returns: [(label, frame), ...]
+    """
+    budget = DEFAULT_TOKEN_BUDGET if token_budget is None else token_budget
+    columns = columns if columns is not None else select_columns(df, question)
+    if df.empty:
+        return []
+
+    by = next((c for c in _PARTITION_COLUMNS
+               if c in df.columns and df[c].nunique(dropna=False) <= _MAX_PARTITION_GROUPS), None)
+    ids = "RiskIDNumber" if "RiskIDNumber" in df.columns else None
+    df = as_frame(df, list(dict.fromkeys(columns + [c for c in (by, ids) if c])))
+    # Rows without an ID are keyed by their content
+    keys = pd.util.hash_pandas_object(df[ids].astype("string") if ids else df[columns], index=False).to_numpy()
+    # Grouped by position, whatever the labels of `df`
+    by_position = df.reset_index(drop=True)
+    groups = by_position.groupby(by, observed=True, dropna=False, sort=True) if by else [("all rows", by_position)]
+
+    header = count_tokens(",".join(columns))
+    sized = []
+    for value, group in groups:
+        label = f"{by}: {_scalar(value) if not pd.isna(value) else 'unknown'}" if by else value
+        rows = group.index.to_numpy()
+        # Cells joined without CSV quoting: close enough to size a chunk
+        tokens = [count_tokens(",".join("" if pd.isna(v) else str(v) for v in row)) + 1
+                  for row in format_frame(group[columns]).itertuples(index=False)]
+        sized.append((label, df.iloc[rows], keys[rows], tokens))
+
+    # Rows per chunk at about half the budget, rounded to a power of two so that the small
+    # shifts of the mean row size an edit causes keep the same divisor
+    mean = sum(sum(tokens) for *_, tokens in sized) / len(df)
+    divisor = 2 ** max(0, round(math.log2(max(1.0, (budget / 2 - header) / mean))))
+
+    chunks = []
+    for label, group, group_keys, tokens in sized:
+        start, used = 0, header
+        for i, row_tokens in enumerate(tokens):
+            if i > start and used + row_tokens > budget:
+                chunks.append((label, group.iloc[start:i]))
+                start, used = i, header
+            used += row_tokens
+            if group_keys[i] % divisor == 0 and used >= _MIN_CHUNK_FILL * budget and i + 1 < len(tokens):
+                chunks.append((label, group.iloc[start:i + 1]))
+                start, used = i + 1, header
+        chunks.append((label, group.iloc[start:]))
+
+    parts = {}
+    for label, _ in chunks:
+        parts[label] = parts.get(label, 0) + 1
+    named, seen = [], {}
+    for label, frame in chunks:
+        seen[label] = seen.get(label, 0) + 1
+        if parts[label] > 1 and ids:
+            first, last = _scalar(frame[ids].iloc[0]), _scalar(frame[ids].iloc[-1])
+            label = f"{label} ({first}–{last})" if first != last else f"{label} ({first})"
+        elif parts[label] > 1:
+            label = f"{label} (part {seen[label]})"
+        named.append((label, frame))
+    return named
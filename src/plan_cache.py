@@ -0,0 +1,383 @@
+# plan_cache.py
+
+import os
+import re
+import ast
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# Defaults, overridable from the environment
+_DEFAULT_DIR = os.getenv("ROBO_CACHE_DIR", ".cache")
+_DEFAULT_MEMORY_SIZE = int(os.getenv("ROBO_PLAN_CACHE_MEMORY_SIZE", "256"))
+_DEFAULT_DISK_SIZE = int(os.getenv("ROBO_PLAN_CACHE_DISK_SIZE", "5000"))
+_DEFAULT_TTL = float(os.getenv("ROBO_PLAN_CACHE_TTL", str(7 * 24 * 3600)))
+
+# One word of a substituted value (keeps it safe inside a string literal)
+_WORD = r"\w[\w\-/.&]*"
+_SLOT_VALUE_RE = re.compile(rf"{_WORD}(?: {_WORD})*")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical form of a user query: lower case, single spaces, no trailing punctuation.
+    """
+    q = " ".join(query.strip().split())
+    return q.rstrip(" ?!.").lower()
+
+
+def _case_of(literal: str) -> str:
+    """
+    Casing convention of a literal in the code, re-applied to substituted values
+    (so "Open" stays title case whatever the user typed).
+    """
+    if literal.islower():
+        return "lower"
+    if literal.isupper():
+        return "upper"
+    if literal == literal.title():
+        return "title"
+    return "same"
+
+
+def _apply_case(value: str, case: str) -> str:
+    return {"same": value, "lower": value.lower(), "upper": value.upper(), "title": value.title()}[case]
+
+
+def _string_constants(code: str) -> list:
+    """
+    (start, end, value) of the plain string constants of `code` ("north", 'Open'), spans
+    including the quotes. Strings with escapes or prefixes and parts of f-strings are left
+    out, as is text that only looks quoted (in comments); code that does not parse has none.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return []
+    lines = code.split("\n")
+    line_starts = [0]
+    for line in lines:
+        line_starts.append(line_starts[-1] + len(line) + 1)
+
+    def offset(lineno: int, col: int) -> int:
+        # ast columns count UTF-8 bytes
+        return line_starts[lineno - 1] + len(lines[lineno - 1].encode("utf-8")[:col].decode("utf-8"))
+
+    in_fstrings = {id(part) for node in ast.walk(tree) if isinstance(node, ast.JoinedStr) for part in node.values}
+    constants = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Constant) or not isinstance(node.value, str) or id(node) in in_fstrings:
+            continue
+        start, end = offset(node.lineno, node.col_offset), offset(node.end_lineno, node.end_col_offset)
+        if code[start:end] in (f'"{node.value}"', f"'{node.value}'"):
+            constants.append((start, end, node.value))
+    return sorted(constants)
+
+
+def parameterize(query: str, code: str, explanation: str = "", reserved=()) -> Optional[dict]:
+    """
+    Turns a (query, code, explanation) triple into a reusable template.
+
+    Any string constant of `code` that also appears as a whole word/phrase in `query`
+    becomes a slot, so "open risks in the north" and "open risks in the south" share
+    one plan. Only the constants themselves are substituted, never the same text elsewhere
+    in the code. Literals listed in `reserved` (column names) are never parameterized.
+    Returns None when nothing can be parameterized.
+    """
+    text = " ".join(query.strip().split()).rstrip(" ?!.")
+    reserved = {r.lower() for r in reserved}
+    constants = _string_constants(code)
+    slots = []
+    seen_values = set()
+
+    for _, _, literal in constants:
+        if len(literal) < 2 or literal.lower() in reserved or literal.lower() in seen_values:
+            continue
+        if not _SLOT_VALUE_RE.fullmatch(literal):
+            continue
+        hit = re.search(r"(?<!\w)" + re.escape(literal) + r"(?!\w)", text, re.IGNORECASE)
+        if not hit:
+            continue
+        case = _case_of(literal)
+        if any(hit.start() < s["span"][1] and s["span"][0] < hit.end() for s in slots):
+            continue
+        seen_values.add(literal.lower())
+        slots.append({"literal": literal, "case": case, "span": hit.span()})
+
+    if not slots:
+        return None
+
+    # Build the query regex: literal text escaped, slot values captured
+    slots.sort(key=lambda slot: slot["span"][0])
+    pattern, cursor = "", 0
+    template_explanation = explanation
+    slot_of = {}
+    for i, slot in enumerate(slots):
+        start, end = slot["span"]
+        words = len(slot["literal"].split())
+        pattern += re.escape(text[cursor:start].lower()) + rf"(?P<p{i}>{_WORD}(?: {_WORD}){{{words - 1}}})"
+        cursor = end
+        slot_of[slot["literal"]] = i
+        template_explanation = re.sub(
+            r"(?<!\w)" + re.escape(slot["literal"]) + r"(?!\w)", f"\x00p{i}\x00", template_explanation, flags=re.IGNORECASE
+        )
+    pattern += re.escape(text[cursor:].lower())
+
+    # Every constant holding a slot's value, and nothing else, becomes the slot (right to left: offsets hold)
+    template_code = code
+    for start, end, value in reversed(constants):
+        if value in slot_of:
+            quote = code[start]
+            template_code = template_code[:start] + f"{quote}\x00p{slot_of[value]}\x00{quote}" + template_code[end:]
+
+    return {
+        "pattern": pattern,
+        "code": template_code,
+        "explanation": template_explanation,
+        "slots": [s["case"] for s in slots],
+    }
+
+
+def instantiate(template: dict, query: str) -> Optional[dict]:
+    """
+    Fills a template with the values found in `query`.
+    Returns {"code", "explanation", "values"}, or None if the query does not fit the template.
+    """
+    text = " ".join(query.strip().split()).rstrip(" ?!.")
+    match = re.fullmatch(template["pattern"], text, re.IGNORECASE)
+    if not match:
+        return None
+    code, explanation, values = template["code"], template["explanation"], []
+    for i, case in enumerate(template["slots"]):
+        value = match.group(f"p{i}")
+        if not _SLOT_VALUE_RE.fullmatch(value):
+            return None
+        value = _apply_case(value, case)
+        code = code.replace(f"\x00p{i}\x00", value)
+        explanation = explanation.replace(f"\x00p{i}\x00", value)
+        values.append(value)
+    return {"code": code, "explanation": explanation, "values": values}
+
+
+class PlanCache:
+    """
+    Two-tier cache for generated filter plans.
+
+    - memory: LRU of recently used plans
+    - disk: SQLite file that survives restarts, evicted by size and TTL
+
+    Plans are keyed by the normalised query within a namespace (model name, schema and
+    system prompt hashes), so a prompt/column change or a model switch never serves a
+    stale plan. Queries that only differ in a literal reuse a stored template.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        cache_dir: Optional[str] = _DEFAULT_DIR,
+        memory_size: int = _DEFAULT_MEMORY_SIZE,
+        disk_size: int = _DEFAULT_DISK_SIZE,
+        ttl: float = _DEFAULT_TTL,
+        reserved_literals=(),
+    ):
+        self.namespace = namespace
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.ttl = ttl
+        self.reserved_literals = tuple(reserved_literals)
+
+        self._memory = OrderedDict()
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "memory_hits": 0, "disk_hits": 0, "template_hits": 0, "misses": 0,
+            "saved_seconds": 0.0, "saved_tokens": 0,
+        }
+
+        self._db = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(cache_dir, "plan_cache.sqlite3"), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS plans ("
+                " key TEXT PRIMARY KEY, namespace TEXT, kind TEXT, body TEXT,"
+                " created REAL, accessed REAL)"
+            )
+            self._db.commit()
+            self._load_templates()
+
+    # ---- keys -------------------------------------------------------------------------------
+
+    def key(self, query: str) -> str:
+        raw = f"{self.namespace}\x00{normalize_query(query)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    # ---- public API -------------------------------------------------------------------------
+
+    def get(self, query: str, check=None) -> Optional[dict]:
+        """
+        Returns a cached plan ({"code", "explanation", ...}) for `query`, or None.
+        A plan filled in from a template is only served if `check(code, values)` accepts it
+        (raises no ValueError), `values` being what was substituted into the slots.
+        """
+        key = self.key(query)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._expired(entry["created"]):
+                self._memory.move_to_end(key)
+                return self._hit("memory_hits", entry)
+            self._memory.pop(key, None)
+
+            entry = self._disk_get(key)
+            if entry is not None:
+                self._remember(key, entry)
+                return self._hit("disk_hits", entry)
+
+            for template_key, template in reversed(self._templates.items()):
+                if self._expired(template["created"]):
+                    continue
+                filled = instantiate(template, query)
+                if filled is None or not self._valid(check, filled.pop("values"), filled["code"]):
+                    continue
+                self._templates.move_to_end(template_key)
+                entry = dict(template["entry"], plan=dict(template["entry"]["plan"], **filled))
+                self._remember(key, entry)
+                return self._hit("template_hits", entry)
+
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, query: str, plan: dict, latency: Optional[float] = None, tokens: Optional[int] = None):
+        """
+        Stores a freshly generated plan. `latency`/`tokens` are what the LLM call cost,
+        and are credited to the savings counters on every later hit.
+        """
+        now = time.time()
+        entry = {"plan": dict(plan), "created": now, "latency": latency or 0.0, "tokens": tokens or 0}
+        key = self.key(query)
+        template = parameterize(query, plan.get("code", ""), plan.get("explanation", ""), self.reserved_literals)
+
+        with self._lock:
+            self._remember(key, entry)
+            if template is not None:
+                template_key = hashlib.sha256(f"{self.namespace}\x00{template['pattern']}".encode("utf-8")).hexdigest()
+                template = dict(template, entry=entry, created=now)
+                self._templates[template_key] = template
+                self._templates.move_to_end(template_key)
+                while len(self._templates) > self.memory_size:
+                    self._templates.popitem(last=False)
+            if self._db is not None:
+                self._disk_put(key, "plan", entry, now)
+                if template is not None:
+                    self._disk_put(template_key, "template", template, now)
+                self._evict_disk(now)
+
+    def discard(self, query: str):
+        """
+        Forgets the plan stored for `query` and the templates it fits, e.g. when the register
+        rejected the plan: it is generated afresh next time.
+        """
+        key = self.key(query)
+        with self._lock:
+            self._memory.pop(key, None)
+            stale = [k for k, template in self._templates.items() if instantiate(template, query) is not None]
+            for template_key in stale:
+                del self._templates[template_key]
+            if self._db is not None:
+                self._db.executemany("DELETE FROM plans WHERE key = ?", [(k,) for k in [key, *stale]])
+                self._db.commit()
+
+    def stats(self) -> dict:
+        """
+        Hit/miss counters plus the LLM latency and tokens the hits avoided.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            hits = stats["memory_hits"] + stats["disk_hits"] + stats["template_hits"]
+            stats["hits"] = hits
+            stats["hit_rate"] = hits / (hits + stats["misses"]) if hits + stats["misses"] else 0.0
+            stats["memory_entries"] = len(self._memory)
+            stats["templates"] = len(self._templates)
+            return stats
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._templates.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM plans WHERE namespace = ?", (self.namespace,))
+                self._db.commit()
+
+    # ---- internals --------------------------------------------------------------------------
+
+    @staticmethod
+    def _valid(check, values: list, code: str) -> bool:
+        if check is None:
+            return True
+        try:
+            check(code, values)
+        except ValueError:
+            return False
+        return True
+
+    def _hit(self, counter: str, entry: dict) -> dict:
+        self._counters[counter] += 1
+        self._counters["saved_seconds"] += entry.get("latency", 0.0)
+        self._counters["saved_tokens"] += entry.get("tokens", 0)
+        return dict(entry["plan"])
+
+    def _remember(self, key: str, entry: dict):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[dict]:
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT body, created FROM plans WHERE key = ? AND kind = 'plan'", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if self._expired(row[1]):
+            self._db.execute("DELETE FROM plans WHERE key = ?", (key,))
+            self._db.commit()
+            return None
+        self._db.execute("UPDATE plans SET accessed = ? WHERE key = ?", (time.time(), key))
+        self._db.commit()
+        return json.loads(row[0])
+
+    def _disk_put(self, key: str, kind: str, body: dict, now: float):
+        self._db.execute(
+            "INSERT OR REPLACE INTO plans (key, namespace, kind, body, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, self.namespace, kind, json.dumps(body), now, now),
+        )
+        self._db.commit()
+
+    def _evict_disk(self, now: float):
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM plans WHERE created < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM plans WHERE key IN ("
+            " SELECT key FROM plans ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.disk_size,),
+        )
+        self._db.commit()
+
+    def _load_templates(self):
+        rows = self._db.execute(
+            "SELECT key, body FROM plans WHERE namespace = ? AND kind = 'template' ORDER BY accessed DESC LIMIT ?",
+            (self.namespace, self.memory_size),
+        ).fetchall()
+        for key, body in reversed(rows):
+            template = json.loads(body)
+            if not self._expired(template["created"]):
+                self._templates[key] = template
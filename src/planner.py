@@ -0,0 +1,136 @@
+# planner.py
+"""
+Fused planner: one model call plans the whole query.
+
+The multi-call path asks the intent, filter and summary assistants in turn, and each
+sends its own copy of the register schema. The planner sends it once and gets back one
+JSON object with:
+
+- "intent": the actions, as `detect_intent` returns them
+- "code" / "explanation": the filter, in the filter assistant's grammar (with filter_data)
+- "columns": the register columns the answer needs
+- "aggregates": columns to group counts and £ totals by
+
+Only the natural-language answer then needs a second call. It is switched on with
+ROBO_PLANNER=fused (src/main.py). Compare the two paths with `python -m src.bench.planner`.
+"""
+
+import json
+from typing import Optional, Union
+
+import pandas as pd
+
+from src.calls import acomplete, complete
+from src.filterer import CODE_GRAMMAR, COLUMNS_SECTION
+from src.intent_classifier import LABELS
+from src.payload import aggregate, with_core_columns
+from src.result import RowSet
+from src.schema import REGISTER_COLUMNS
+from src.summariser import prompt_data
+from src.tracing import span
+
+_MODEL = "gpt-4.1"
+
+_SYSTEM_PROMPT = """
+You are an assistant that plans how to answer a question about a company's risk register, held in a pandas DataFrame named `df`.
+
+Decide, in one go:
+
+1. "intent": the actions the question needs, one or more of
+   - "filter_data": the question is about risks with specific attributes (region, time, contract, risk type, owner, status, financial figures or other fields)
+   - "summarise_risks": it asks for a summary, overview, trends, top risks, specific values from columns, or to be told about the risks
+   - "other": it asks for a definition, clarification or anything not about retrieving or summarising risks
+   A question asking for a value from a column ("Who owns the X risk?") needs "filter_data" and "summarise_risks".
+2. "code" and "explanation" (only with "filter_data"): pandas code assigning `filtered_df = df.loc[<condition>]` that selects the risks the question is about, and a short explanation (1-3 sentences) of what it does and any assumptions made.
+3. "columns": the columns the answer has to read (e.g. "Risk Owner" for who owns what, the "Impact (£) - ..." columns for exposure). Leave it empty when you are unsure; a default set is then used.
+4. "aggregates": the columns it helps to group counts and £ totals by (e.g. ["Risk Area"] for "which areas carry the most exposure?"), or an empty list.
+
+<<COLUMNS_SECTION>>
+
+<<GRAMMAR>>
+
+### Output format:
+
+Respond with only a JSON object directly parsable by json.loads(), without Markdown or code fences:
+
+{"intent": ["filter_data", "summarise_risks"], "code": "filtered_df = df.loc[(df[\\"Risk Type - Reputational\\"] == True) & (df[\\"Contract:Region\\"].str.contains(\\"north\\", case=False, na=False))]", "explanation": "Reputational risks in regions containing 'north'.", "columns": ["Risk Owner", "Impact (£) - Expected"], "aggregates": ["Risk Area"]}
+""".replace("<<COLUMNS_SECTION>>", COLUMNS_SECTION).replace("<<GRAMMAR>>", CODE_GRAMMAR)
+
+
+def _messages(user_input: str) -> list:
+    return [
+        {"role": "system", "content": _SYSTEM_PROMPT.strip()},
+        {"role": "user",   "content": user_input}
+    ]
+
+
+def _columns(values) -> list:
+    return [c for c in dict.fromkeys(values or []) if c in REGISTER_COLUMNS]
+
+
+def _parse(response) -> dict:
+    """
+    Validates the model's JSON into a plan; unknown columns are dropped.
+    """
+    raw_output = response.choices[0].message.content
+    try:
+        result = json.loads(raw_output)
+    except json.JSONDecodeError as e:
+        raise RuntimeError(f"Failed to parse planner response as JSON: {e}\nRaw output was:\n{raw_output}")
+    if not isinstance(result, dict) or not isinstance(result.get("intent"), list):
+        raise ValueError("Unexpected planner response format. Expected a JSON object with an 'intent' list.")
+    plan = {
+        "intent": [label for label in LABELS if label in result["intent"]],
+        "columns": _columns(result.get("columns")),
+        "aggregates": _columns(result.get("aggregates")),
+    }
+    if not plan["intent"]:
+        raise ValueError(f"The planner returned no known intent: {result['intent']}")
+    if "filter_data" in plan["intent"]:
+        if "code" not in result or "explanation" not in result:
+            raise ValueError("Unexpected planner response format. filter_data needs 'code' and 'explanation'.")
+        plan["code"], plan["explanation"] = result["code"], result["explanation"]
+    return plan
+
+
+def plan_query(user_input: str) -> dict:
+    """
+    Plans `user_input` in one call: its intent, filter and the data its answer needs.
+    Returns: {"intent", "columns", "aggregates"} (+ "code", "explanation" with filter_data)
+    """
+    with span("plan", model=_MODEL) as s:
+        response = complete("plan", model=_MODEL, messages=_messages(user_input), temperature=0)
+        s.usage(response)
+        plan = _parse(response)
+        s.set(intent=",".join(plan["intent"]))
+    return plan
+
+
+async def aplan_query(user_input: str) -> dict:
+    """
+    Async version of `plan_query`.
+    """
+    with span("plan", model=_MODEL) as s:
+        response = await acomplete("plan", model=_MODEL, messages=_messages(user_input), temperature=0)
+        s.usage(response)
+        plan = _parse(response)
+        s.set(intent=",".join(plan["intent"]))
+    return plan
+
+
+def answer_data(
+    plan: dict,
+    user_input: str,
+    df: Union[pd.DataFrame, RowSet],
+    filter_explanation: Optional[str] = None,
+) -> dict:
+    """
+    Prompt data for the answer to a planned query: the plan's columns of `df` (or those
+    the question needs, when it named none) and rollups by the plan's aggregate columns.
+    """
+    columns = with_core_columns(df, plan["columns"]) if plan["columns"] else None
+    data = prompt_data(user_input, df, filter_explanation, plan["intent"], columns=columns)
+    if plan["aggregates"] and data.get("format") == "csv":
+        rollups = aggregate(df, groups=plan["aggregates"])
+        data["aggregates"] = {**data.get("aggregates", {}), **rollups}
+    return data
@@ -0,0 +1,205 @@
+# rate_limit.py
+"""
+Client-side requests-per-minute / tokens-per-minute budgets per model.
+
+A `RateLimiter` is installed on the shared OpenAI clients (see clients.set_rate_limiter).
+Every outgoing chat-completion request first takes one request and its estimated tokens
+from the model's buckets, waiting if they are empty. A 429 halves the model's rate and
+pauses it for the server's Retry-After; successful calls then restore the rate step by
+step (additive increase, multiplicative decrease).
+"""
+
+import json
+import time
+import asyncio
+import threading
+from typing import Optional
+
+from src.payload import count_tokens
+
+# Default budgets (requests/min, tokens/min); override per model with RateLimiter(limits=...)
+DEFAULT_LIMITS = {
+    "gpt-4.1": (500, 30_000),
+    "gpt-4.1-mini": (500, 200_000),
+    "gpt-4.1-nano": (500, 200_000),
+    "gpt-4o-mini": (500, 200_000),
+}
+# Completion tokens assumed for a request without max_tokens
+_COMPLETION_ESTIMATE = 400
+# Seconds of budget a bucket can save up
+_BURST_SECONDS = 10.0
+_MIN_FACTOR = 1 / 16
+_RECOVERY_STEP = 0.05
+
+
+class _Bucket:
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.level = self.capacity(1.0)
+        self.updated = time.monotonic()
+
+    def capacity(self, factor: float) -> float:
+        return max(1.0, self.per_minute * factor * _BURST_SECONDS / 60)
+
+    def refill(self, now: float, factor: float):
+        self.level = min(self.capacity(factor), self.level + (now - self.updated) * self.per_minute * factor / 60)
+        self.updated = now
+
+    def wait(self, amount: float, factor: float) -> float:
+        # Requests larger than the bucket go through once it is full (and leave it in debt)
+        needed = min(amount, self.capacity(factor)) - self.level
+        return 0.0 if needed <= 0 else needed * 60 / (self.per_minute * factor)
+
+
+class ModelLimit:
+    """
+    Request and token buckets of one model, with an adaptive rate factor.
+    """
+
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        self.factor = 1.0
+        self.paused_until = 0.0
+        self.stats = {"requests": 0, "tokens": 0, "throttled": 0, "waited_seconds": 0.0}
+
+    def try_take(self, tokens: int) -> float:
+        """
+        Takes the budget for one request and returns 0, or returns how long to wait first.
+        """
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.requests.refill(now, self.factor)
+        self.tokens.refill(now, self.factor)
+        wait = max(self.requests.wait(1, self.factor), self.tokens.wait(tokens, self.factor))
+        if wait > 0:
+            return wait
+        self.requests.level -= 1
+        self.tokens.level -= tokens
+        self.stats["requests"] += 1
+        self.stats["tokens"] += tokens
+        return 0.0
+
+    def throttled(self, retry_after: Optional[float]):
+        self.factor = max(_MIN_FACTOR, self.factor / 2)
+        pause = retry_after if retry_after is not None else 60 / max(self.requests.per_minute * self.factor, 1)
+        self.paused_until = max(self.paused_until, time.monotonic() + pause)
+        self.stats["throttled"] += 1
+
+    def succeeded(self):
+        self.factor = min(1.0, self.factor + _RECOVERY_STEP)
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    for name, scale in (("retry-after-ms", 1000.0), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return float(value) / scale
+            except ValueError:
+                pass
+    return None
+
+
+def _request_cost(request) -> tuple:
+    """
+    (model, estimated tokens) of an outgoing chat-completion request, or (None, 0).
+    """
+    if not request.url.path.endswith("/chat/completions"):
+        return None, 0
+    try:
+        body = json.loads(request.content)
+    except (ValueError, TypeError):
+        return None, 0
+    prompt = sum(count_tokens(m.get("content") or "") for m in body.get("messages", []) if isinstance(m.get("content"), str))
+    completion = body.get("max_completion_tokens") or body.get("max_tokens") or _COMPLETION_ESTIMATE
+    return body.get("model"), prompt + completion
+
+
+class RateLimiter:
+    """
+    Per-model budgets, applied through HTTP event hooks on the OpenAI clients.
+    Models without a configured limit are not throttled.
+    """
+
+    def __init__(self, limits: Optional[dict] = None):
+        self.models = {model: ModelLimit(rpm, tpm) for model, (rpm, tpm) in {**DEFAULT_LIMITS, **(limits or {})}.items()}
+        self._lock = threading.Lock()
+
+    def _limit(self, model: Optional[str]) -> Optional[ModelLimit]:
+        if model is None:
+            return None
+        # Dated snapshots ("gpt-4.1-2025-04-14") share the budget of their model
+        return self.models.get(model) or next(
+            (limit for name, limit in sorted(self.models.items(), key=lambda item: -len(item[0]))
+             if model.startswith(name + "-")), None)
+
+    def _try(self, limit: ModelLimit, tokens: int) -> float:
+        with self._lock:
+            return limit.try_take(tokens)
+
+    def acquire(self, model: Optional[str], tokens: int):
+        limit = self._limit(model)
+        if limit is None:
+            return
+        while (wait := self._try(limit, tokens)) > 0:
+            with self._lock:
+                limit.stats["waited_seconds"] += wait
+            time.sleep(wait)
+
+    async def aacquire(self, model: Optional[str], tokens: int):
+        limit = self._limit(model)
+        if limit is None:
+            return
+        while (wait := self._try(limit, tokens)) > 0:
+            with self._lock:
+                limit.stats["waited_seconds"] += wait
+            await asyncio.sleep(wait)
+
+    def record(self, model: Optional[str], status: int, headers):
+        limit = self._limit(model)
+        if limit is None:
+            return
+        with self._lock:
+            if status == 429:
+                limit.throttled(parse_retry_after(headers))
+            elif status < 400:
+                limit.succeeded()
+
+    # ---- HTTP hooks -----------------------------------------------------------------------------
+
+    def _on_request(self, request):
+        self.acquire(*_request_cost(request))
+
+    def _on_response(self, response):
+        self.record(_request_cost(response.request)[0], response.status_code, response.headers)
+
+    async def _aon_request(self, request):
+        await self.aacquire(*_request_cost(request))
+
+    async def _aon_response(self, response):
+        self._on_response(response)
+
+    def hooks(self) -> dict:
+        return {"request": [self._on_request], "response": [self._on_response]}
+
+    def async_hooks(self) -> dict:
+        return {"request": [self._aon_request], "response": [self._aon_response]}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {model: dict(limit.stats, rate_factor=limit.factor)
+                    for model, limit in self.models.items() if limit.stats["requests"] or limit.stats["throttled"]}
+
+
+def parse_limit(text: str) -> tuple:
+    """
+    "gpt-4.1=500:30000" → ("gpt-4.1", (500.0, 30000.0))
+    """
+    try:
+        model, budget = text.split("=", 1)
+        rpm, tpm = budget.split(":", 1)
+        return model.strip(), (float(rpm), float(tpm))
+    except ValueError:
+        raise ValueError(f"Expected MODEL=RPM:TPM, got {text!r}") from None
@@ -0,0 +1,197 @@
+# register.py
+
+import os
+import json
+import hashlib
+import threading
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+
+from src.indexes import build_index
+from src.schema import (
+    REGISTER_COLUMNS, DATE_COLUMNS, FLAG_COLUMNS, LEVEL_COLUMNS, LEVELS, CATEGORY_COLUMNS, NUMERIC_COLUMNS,
+    schema_hash,
+)
+
+DEFAULT_REGISTER_PATH = os.getenv("ROBO_REGISTER_PATH", "data/Risk_Register__100_Rows.csv")
+_CACHE_DIR = os.path.join(os.getenv("ROBO_CACHE_DIR", ".cache"), "register")
+# Bump when the parsing below changes, so old binary caches are rebuilt
+_LOADER_VERSION = 1
+
+_lock = threading.Lock()
+
+
+def source_dtypes(columns=REGISTER_COLUMNS) -> dict:
+    """
+    `read_csv` dtypes for the text columns among `columns`; the rest are typed by `apply_schema`.
+    """
+    return {c: "string" for c in columns if c not in NUMERIC_COLUMNS + FLAG_COLUMNS}
+
+
+def _read_source(path: str) -> pd.DataFrame:
+    """
+    Parses the CSV once with an explicit schema.
+    """
+    df = pd.read_csv(path, dtype=source_dtypes())
+    return apply_schema(df)
+
+
+def _compact_numeric(series: pd.Series) -> pd.Series:
+    series = pd.to_numeric(series, errors="coerce")
+    if series.isna().any():
+        return series.astype("float64")
+    if (series % 1 == 0).all():
+        return pd.to_numeric(series.astype("int64"), downcast="integer")
+    return pd.to_numeric(series, downcast="float")
+
+
+def _flag(series: pd.Series) -> pd.Series:
+    if pd.api.types.is_bool_dtype(series) and not series.isna().any():
+        return series.astype(bool)
+    mapped = series.astype("string").str.strip().str.lower().map(
+        {"true": True, "false": False, "yes": True, "no": False, "1": True, "0": False, "y": True, "n": False}
+    )
+    if mapped.isna().any():
+        return mapped.astype("boolean")
+    return mapped.astype(bool)
+
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Casts register columns to their compact types:
+    datetime64 dates, bool flags, categoricals, downcast numerics.
+    """
+    out = {}
+    for column in df.columns:
+        series = df[column]
+        if column in DATE_COLUMNS:
+            series = pd.to_datetime(series, format="%Y-%m-%d", errors="coerce")
+        elif column in FLAG_COLUMNS:
+            series = _flag(series)
+        elif column in LEVEL_COLUMNS:
+            series = pd.Categorical(series, categories=LEVELS, ordered=True)
+        elif column in CATEGORY_COLUMNS:
+            series = series.astype("category")
+        elif column in NUMERIC_COLUMNS:
+            series = _compact_numeric(series)
+        else:
+            series = series.astype("string")
+        out[column] = series
+    return pd.DataFrame(out, index=df.index)
+
+
+# ---- binary cache -------------------------------------------------------------------------------
+
+def _cache_paths(path: str) -> tuple:
+    key = hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+    base = os.path.join(_CACHE_DIR, f"{os.path.splitext(os.path.basename(path))[0]}-{key}")
+    return base + ".arrow", base + ".meta.json"
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_stamp(path: str = DEFAULT_REGISTER_PATH) -> tuple:
+    """
+    Cheap change marker for the source file (mtime, size); used to key shared caches.
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _write_cache(df: pd.DataFrame, arrow_path: str, meta_path: str, meta: dict):
+    os.makedirs(os.path.dirname(arrow_path), exist_ok=True)
+    table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+    tmp = arrow_path + ".tmp"
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, arrow_path)
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def _read_cache(arrow_path: str) -> pd.DataFrame:
+    """
+    The cached frame, typed as `_read_source` types it. `to_pandas` copies every column into
+    pandas memory (zero-copy ArrowDtype columns would not be the numpy and categorical
+    columns the filter engine and indexes work on): the cache saves the parse, not the copy.
+    """
+    with pa.memory_map(arrow_path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    df = table.to_pandas(split_blocks=True, self_destruct=True, types_mapper={pa.string(): pd.StringDtype()}.get)
+    # Dictionary values come back as str; a parse gives categories the "string" dtype of the text
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].cat.rename_categories(df[column].cat.categories.astype("string"))
+    return df
+
+
+def _read_meta(meta_path: str) -> Optional[dict]:
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_register(path: str = DEFAULT_REGISTER_PATH, use_cache: bool = True, index: bool = True) -> pd.DataFrame:
+    """
+    Loads the risk register with its typed schema.
+
+    The parsed frame is persisted as an Arrow IPC file next to a small metadata file.
+    Later loads convert that file back instead of parsing and typing the CSV, which is
+    only re-parsed when its mtime/size changed *and* its content hash differs. The index starts at 1, as shown in the app.
+    With `index=True` the secondary filter indexes (src/indexes.py) are built alongside.
+    """
+    with _lock:
+        df = _load(path, use_cache)
+    df.index = pd.RangeIndex(1, len(df) + 1)
+    if index:
+        build_index(df)
+    return df
+
+
+def _load(path: str, use_cache: bool) -> pd.DataFrame:
+    if not use_cache:
+        return _read_source(path)
+
+    arrow_path, meta_path = _cache_paths(path)
+    stat = os.stat(path)
+    meta = _read_meta(meta_path)
+    expected = {"loader": _LOADER_VERSION, "schema": schema_hash()}
+
+    if meta is not None and all(meta.get(k) == v for k, v in expected.items()) and os.path.exists(arrow_path):
+        if meta.get("mtime_ns") == stat.st_mtime_ns and meta.get("size") == stat.st_size:
+            return _read_cache(arrow_path)
+        # Touched but maybe not changed: compare content before re-parsing
+        digest = _file_hash(path)
+        if meta.get("sha256") == digest:
+            meta.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            return _read_cache(arrow_path)
+    else:
+        digest = _file_hash(path)
+
+    df = _read_source(path)
+    try:
+        _write_cache(df, arrow_path, meta_path, dict(expected, mtime_ns=stat.st_mtime_ns, size=stat.st_size, sha256=digest))
+    except OSError:
+        return df  # read-only deployments still work, just without the binary cache
+    # Serve the mapped copy so a first load and a cached load give identical frames
+    return _read_cache(arrow_path)
+
+
+def memory_usage(df: pd.DataFrame) -> int:
+    """
+    Deep memory footprint of `df` in bytes.
+    """
+    return int(df.memory_usage(deep=True).sum())
@@ -0,0 +1,133 @@
+# result.py
+"""
+Query results as row positions over the shared register frame.
+
+A filter selects rows; it does not need its own copy of them. A RowSet keeps the
+register frame (never modified; ingest publishes a new frame instead) and an int64
+array of the selected positions, in result order. Columns are only materialised
+when a consumer asks for them, and only the columns and rows it asks for: a prompt
+payload takes a handful of columns, a UI page takes a few dozen rows. Per-query memory
+is then eight bytes per matching row, whatever the width of the register.
+"""
+
+from functools import cached_property
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+
+class RowSet:
+    """
+    Rows `rows` (positions, in result order) of the register frame `base`.
+    With `reset_index` the materialised rows are numbered 0..n-1 instead of keeping
+    the register's index labels.
+    """
+
+    def __init__(self, base: pd.DataFrame, rows: np.ndarray, reset_index: bool = False):
+        self.base = base
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.reset_index = reset_index
+        # Every row in register order: materialising it is the register frame itself
+        self.is_full = len(self.rows) == len(base) and bool((self.rows == np.arange(len(base))).all())
+
+    @classmethod
+    def all(cls, base: pd.DataFrame) -> "RowSet":
+        return cls(base, np.arange(len(base), dtype=np.int64))
+
+    @classmethod
+    def from_mask(cls, base: pd.DataFrame, mask: np.ndarray) -> "RowSet":
+        return cls(base, np.flatnonzero(mask))
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __repr__(self) -> str:
+        return f"<RowSet {len(self.rows)} of {len(self.base)} rows>"
+
+    @property
+    def empty(self) -> bool:
+        return len(self.rows) == 0
+
+    @property
+    def columns(self) -> pd.Index:
+        return self.base.columns
+
+    @property
+    def index(self) -> pd.Index:
+        if self.reset_index:
+            return pd.RangeIndex(len(self.rows))
+        return self.base.index.take(self.rows)
+
+    @property
+    def mask(self) -> np.ndarray:
+        """
+        Boolean mask of the selected rows over the register (result order is lost).
+        """
+        result = np.zeros(len(self.base), dtype=bool)
+        result[self.rows] = True
+        return result
+
+    def __getitem__(self, column: str) -> pd.Series:
+        series = self.base[column].take(self.rows)
+        if self.reset_index:
+            series = series.reset_index(drop=True)
+        return series
+
+    def take(self, columns: Optional[list] = None, start: int = 0, stop: Optional[int] = None) -> pd.DataFrame:
+        """
+        The rows [start:stop] of the result as a frame, with only `columns` (default all).
+        """
+        if self.is_full and columns is None and start == 0 and stop is None and not self.reset_index:
+            return self.base
+        rows = self.rows[start:stop]
+        frame = self.base if columns is None else self.base[list(columns)]
+        frame = frame.take(rows)
+        if self.reset_index:
+            frame.index = pd.RangeIndex(start, start + len(rows))
+        return frame
+
+    @cached_property
+    def frame(self) -> pd.DataFrame:
+        """
+        The whole result as a frame, materialised on first use.
+        """
+        return self.take()
+
+    def refine(self, mask: np.ndarray) -> "RowSet":
+        """
+        The rows of this result for which `mask` (aligned with this result) is True.
+        """
+        return RowSet(self.base, self.rows[np.asarray(mask, dtype=bool)], self.reset_index)
+
+    def head(self, n: int) -> "RowSet":
+        return RowSet(self.base, self.rows[:n], self.reset_index)
+
+    def sort(self, by: Union[str, list], ascending: Union[bool, list] = True) -> "RowSet":
+        """
+        This result reordered by the values of `by`; only those columns are read.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        keys = self.base[by].take(self.rows).reset_index(drop=True)
+        order = keys.sort_values(by, ascending=ascending).index.to_numpy()
+        return RowSet(self.base, self.rows[order], self.reset_index)
+
+    def largest(self, n: int, column: str, smallest: bool = False) -> "RowSet":
+        """
+        The `n` rows with the largest (or smallest) `column`, as DataFrame.nlargest orders them.
+        """
+        values = self.base[column].take(self.rows).reset_index(drop=True)
+        order = (values.nsmallest(n) if smallest else values.nlargest(n)).index.to_numpy()
+        return RowSet(self.base, self.rows[order], self.reset_index)
+
+
+def as_frame(data: Union[pd.DataFrame, RowSet], columns: Optional[list] = None, start: int = 0,
+             stop: Optional[int] = None) -> pd.DataFrame:
+    """
+    `data` (a frame or a RowSet) as a frame holding only `columns` and rows [start:stop].
+    """
+    if isinstance(data, RowSet):
+        return data.take(columns, start, stop)
+    if start or stop is not None:
+        data = data.iloc[start:stop]
+    return data if columns is None else data[list(columns)]
@@ -0,0 +1,305 @@
+# retrieval.py
+"""
+Offline semantic retrieval over the free-text columns (risk descriptions and mitigations).
+
+Each distinct text is embedded as a hashed TF-IDF vector: stemmed words plus their
+character trigrams (so related forms like "supply"/"supplier" still overlap), signed-hashed
+into ROBO_RETRIEVAL_DIM buckets and L2-normalised into one float32 matrix per column.
+Nothing leaves the process and nothing is downloaded. A search is a matrix product
+with the query vectors, so a batch of queries costs one pass over the matrix and
+top-k is an argpartition, which stays in milliseconds at 1e5+ rows.
+
+Vectors are built lazily, once per register frame, and kept on its RegisterIndex
+(src/indexes.py); filtered subsets of that frame reuse its rows instead of re-embedding.
+"""
+
+import os
+import re
+import zlib
+import threading
+import weakref
+from itertools import chain
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.indexes import TEXT_COLUMNS, get_index
+from src.result import RowSet
+
+DIM = int(os.getenv("ROBO_RETRIEVAL_DIM", "256"))
+# Rows of a too-large result picked for a prompt by relevance (0 disables retrieval there)
+RETRIEVAL_K = int(os.getenv("ROBO_RETRIEVAL_K", "40"))
+# Cosine similarity below which a row is not considered related to the query
+MIN_SCORE = float(os.getenv("ROBO_RETRIEVAL_MIN_SCORE", "0.2"))
+# A description match counts for more than a mitigation match
+_WEIGHTS = {"Description of Risk/Opportunity": 2.0, "Control Measure / Mitigation": 1.0}
+_TRIGRAM_WEIGHT = 0.5
+# Texts embedded per block, bounding the temporary (text, feature) arrays
+_BLOCK = 8192
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("""
+a about above after all also an and any are as at be been being below between both but by can could
+did do does doing due during each for from further had has have having how i if in into is it its
+me more most my no nor not of off on once only or other our out over own per same should so some
+such than that the their them then there these they this those through to too under until up very
+was we were what when where which while who whom why will with would you your
+""".split())
+_SUFFIXES = (("ies", "y"), ("sses", "ss"), ("ches", "ch"), ("shes", "sh"), ("xes", "x"), ("ing", ""), ("ed", ""), ("s", ""))
+# Words of a question about the register itself rather than a topic of its texts (stemmed below)
+_REGISTER_WORDS = """
+risk opportunity register row item summary summarise summarize overview describe explain tell show list give
+find display key main top biggest largest worst highest important pressing theme trend insight concern issue
+picture overall everything every across whole entire open closed current status owner region contract area
+type score impact expected likelihood probability description mitigation control measure action date north
+south east west global please
+""".split()
+
+
+def _stem(word: str) -> str:
+    for suffix, replacement in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 2 and not word.endswith("ss"):
+            return word[:-len(suffix)] + replacement
+    return word
+
+
+_REGISTER_TERMS = frozenset(_stem(word) for word in _REGISTER_WORDS)
+
+
+def _terms(text: str) -> dict:
+    """
+    Stemmed, non-stopword terms of `text` with their counts.
+    """
+    counts = {}
+    for word in _TOKEN_RE.findall(text.lower()):
+        if word not in _STOPWORDS:
+            term = _stem(word)
+            counts[term] = counts.get(term, 0) + 1
+    return counts
+
+
+def _features(terms) -> tuple:
+    """
+    Hashed features of each term: the term itself and its character trigrams (none for
+    numbers, which only match exactly), as CSR-style (offsets, buckets, values) arrays.
+    """
+    offsets, buckets, values = [0], [], []
+    for term in terms:
+        padded = f"<{term}>"
+        grams = [] if term.isdigit() else [padded[i:i + 3] for i in range(len(padded) - 2)]
+        gram_weight = _TRIGRAM_WEIGHT / np.sqrt(max(len(grams), 1))
+        for key, weight in chain(((term, 1.0),), ((f"#{gram}", gram_weight) for gram in grams)):
+            h = zlib.crc32(key.encode("utf-8"))
+            buckets.append(h % DIM)
+            values.append(weight if h & 0x80000000 else -weight)
+        offsets.append(len(buckets))
+    return np.array(offsets, dtype=np.int64), np.array(buckets, dtype=np.int64), np.array(values, dtype=np.float32)
+
+
+def _normalise(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms > 0, norms, 1)
+    return matrix
+
+
+class TextVectors:
+    """
+    Unit vectors of the distinct texts of one column, with each row's text code.
+    The last matrix row is all zeros and stands for missing text.
+    """
+
+    def __init__(self, codes: np.ndarray, texts: pd.Index, matrix: np.ndarray, idf: dict, default_idf: float):
+        self.codes = np.where(codes < 0, len(texts), codes)
+        self.texts = texts
+        self.matrix = matrix
+        self.idf = idf
+        self.default_idf = default_idf
+
+    @classmethod
+    def build(cls, series: pd.Series) -> "TextVectors":
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        texts = [str(text).lower() for text in uniques]
+        tokens = [_TOKEN_RE.findall(text) for text in texts]
+        owner = np.repeat(np.arange(len(texts), dtype=np.int64), [len(words) for words in tokens])
+        word_ids, words = pd.factorize(np.array(list(chain.from_iterable(tokens)), dtype=object))
+
+        # Stems of the vocabulary (stopwords dropped), then (text, term) frequencies
+        stems = pd.Series([None if word in _STOPWORDS else _stem(word) for word in words], dtype=object)
+        stem_ids, terms = pd.factorize(stems, use_na_sentinel=True)
+        term = stem_ids[word_ids] if len(word_ids) else np.empty(0, dtype=np.int64)
+        keep = term >= 0
+        owner, term = owner[keep], term[keep].astype(np.int64)
+        n_terms = max(len(terms), 1)
+        pairs, tf = np.unique(owner * n_terms + term, return_counts=True)
+        doc, term = pairs // n_terms, pairs % n_terms
+
+        df_counts = np.bincount(term, minlength=len(terms))
+        idf = np.log((1 + len(texts)) / (1 + df_counts)) + 1
+        weight = ((1 + np.log(tf)) * idf[term]).astype(np.float32)
+
+        offsets, buckets, values = _features(terms)
+        matrix = np.zeros((len(texts) + 1, DIM), dtype=np.float32)
+        bounds = np.searchsorted(doc, np.arange(0, len(texts) + _BLOCK, _BLOCK))
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            if lo == hi:
+                continue
+            block_term, block_doc, block_weight = term[lo:hi], doc[lo:hi], weight[lo:hi]
+            counts = offsets[block_term + 1] - offsets[block_term]
+            feature = np.repeat(offsets[block_term] - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+            np.add.at(matrix, (np.repeat(block_doc, counts), buckets[feature]),
+                      np.repeat(block_weight, counts) * values[feature])
+
+        return cls(codes, pd.Index(uniques), _normalise(matrix),
+                   dict(zip(terms, idf.tolist())), float(np.log(1 + len(texts)) + 1))
+
+    def derive(self, series: pd.Series, min_known: float = 0.0) -> Optional["TextVectors"]:
+        """
+        Vectors for another series (e.g. a filtered subset or an edited copy of this column),
+        reusing the rows of texts already embedded here and this column's term weights for
+        new ones. None if fewer than `min_known` of its distinct texts are already embedded.
+        """
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        position = self.texts.get_indexer(uniques)
+        known = position >= 0
+        if len(uniques) and known.mean() < min_known:
+            return None
+        matrix = np.zeros((len(uniques) + 1, DIM), dtype=np.float32)
+        matrix[:-1][known] = self.matrix[position[known]]
+        derived = TextVectors(codes, pd.Index(uniques), matrix, self.idf, self.default_idf)
+        if not known.all():
+            new = [str(text) for text in uniques[~known]]
+            # Words new to the column get the rarest weight
+            derived.idf = dict(self.idf)
+            for text in new:
+                for term in _terms(text):
+                    derived.idf.setdefault(term, self.default_idf)
+            matrix[:-1][~known] = derived.embed(new)
+        return derived
+
+    def embed(self, queries: list) -> np.ndarray:
+        """
+        Unit vectors (queries × DIM) of free-text queries, weighted like this column's texts.
+        Words no text uses cannot match and would only add hash-collision noise, so are skipped.
+        """
+        result = np.zeros((len(queries), DIM), dtype=np.float32)
+        for i, query in enumerate(queries):
+            counts = {term: tf for term, tf in _terms(query).items() if term in self.idf}
+            if not counts:
+                continue
+            offsets, buckets, values = _features(list(counts))
+            for j, (term, tf) in enumerate(counts.items()):
+                weight = (1 + np.log(tf)) * self.idf[term]
+                np.add.at(result[i], buckets[offsets[j]:offsets[j + 1]], weight * values[offsets[j]:offsets[j + 1]])
+        return _normalise(result)
+
+    def scores(self, queries: list) -> np.ndarray:
+        """
+        Cosine similarity of every row with each query: (rows × queries) float32.
+        """
+        return (self.matrix @ self.embed(queries).T)[self.codes]
+
+
+# ---- per-frame vectors ------------------------------------------------------------------------
+
+_build_lock = threading.Lock()
+# Most recently built vectors per column, reused for filtered subsets and edited registers
+_latest = {}
+# An edited register reuses the previous vectors (and term weights) while this share of its
+# texts is unchanged; past that it is embedded afresh
+_REUSE_FRACTION = 0.9
+
+
+def _previous(column: str) -> Optional[TextVectors]:
+    ref = _latest.get(column)
+    return ref() if ref is not None else None
+
+
+def vectors(df: pd.DataFrame, column: str) -> TextVectors:
+    """
+    Vectors of `df[column]`: built once and kept on the frame's RegisterIndex, or derived
+    from the register's vectors for subsets (built from scratch as a last resort).
+    """
+    index = get_index(df)
+    if index is None:
+        base = _previous(column)
+        return base.derive(df[column]) if base is not None else TextVectors.build(df[column])
+    with _build_lock:
+        built = index.semantic.get(column)
+        if built is None:
+            base = _previous(column)
+            if base is not None:
+                built = base.derive(df[column], min_known=_REUSE_FRACTION)
+            if built is None:
+                built = TextVectors.build(df[column])
+            index.semantic[column] = built
+            _latest[column] = weakref.ref(built)
+    return built
+
+
+def warm(df: pd.DataFrame):
+    """
+    Builds the vectors of every text column of `df` ahead of its first search.
+    """
+    for column in TEXT_COLUMNS:
+        if column in df.columns:
+            vectors(df, column)
+
+
+def score_rows(df: pd.DataFrame, queries: list, columns: Optional[list] = None) -> np.ndarray:
+    """
+    Relevance (rows × queries) of each row to each query: cosine similarity over the text
+    columns, description weighted above mitigation.
+    """
+    if isinstance(df, RowSet):
+        # Scored against the register's own (cached) vectors
+        return score_rows(df.base, queries, columns)[df.rows]
+    columns = [c for c in (columns or TEXT_COLUMNS) if c in df.columns]
+    result = np.zeros((len(df), len(queries)), dtype=np.float32)
+    if not columns or df.empty or not queries:
+        return result
+    total = sum(_WEIGHTS.get(c, 1.0) for c in columns)
+    for column in columns:
+        result += (_WEIGHTS.get(column, 1.0) / total) * vectors(df, column).scores(queries)
+    return result
+
+
+def search(df: pd.DataFrame, queries: list, k: int = RETRIEVAL_K, min_score: float = MIN_SCORE,
+           columns: Optional[list] = None) -> list:
+    """
+    Batched top-k search: for each query, the positions of its (at most) `k` best rows
+    scoring at least `min_score`, best first, and their scores.
+    Returns: [(positions, scores), ...]
+    """
+    scores = score_rows(df, queries, columns)
+    results = []
+    for column in scores.T:
+        if k < len(column):
+            top = np.argpartition(-column, k)[:k]
+        else:
+            top = np.arange(len(column))
+        top = top[column[top] >= min_score]
+        top = top[np.argsort(-column[top], kind="stable")]
+        results.append((top, column[top]))
+    return results
+
+
+def relevant_rows(df: pd.DataFrame, question: str, k: int = RETRIEVAL_K, min_score: float = MIN_SCORE) -> np.ndarray:
+    """
+    Positions of the rows of `df` most relevant to `question`, best first (may be empty).
+    """
+    return search(df, [question], k, min_score)[0][0]
+
+
+def similar_mask(df: pd.DataFrame, column: str, text: str, min_score: float = MIN_SCORE) -> np.ndarray:
+    """
+    Boolean mask of the rows whose `column` is semantically similar to `text`.
+    """
+    return vectors(df, column).scores([text])[:, 0] >= min_score
+
+
+def names_topic(question: str) -> bool:
+    """
+    Whether `question` names something to look for in the risk texts ("supplier failure",
+    "flooding") rather than only asking about the register ("summarise all open risks").
+    """
+    return any(term not in _REGISTER_TERMS and not term.isdigit() for term in _terms(question))
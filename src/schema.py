@@ -0,0 +1,62 @@
+# schema.py
+
+import hashlib
+
+# Columns of the risk register, in file order
+REGISTER_COLUMNS = [
+    "Risk Area", "Date Raised", "Contract", "Contract:Region", "Date Updated", "RiskIDNumber", "Raised By",
+    "Risk/Opportunity", "Description of Risk/Opportunity", "Risk Type - Financial",
+    "Risk Type - Commercial/Contractual", "Risk Type - Reputational", "Risk Type - People",
+    "Risk Type - Regulatory and Law", "Risk Type - SHE", "Probability - Pre Mitigation - Likelihood",
+    "Probability - Pre Mitigation - Impact", "Probability - Pre Mitigation - Score (out of 25)",
+    "Probability - Pre Mitigation - % Risk Score", "Impact (£) - Worst Case (Unmitigated)",
+    "Impact (£) - Best Case", "Impact (£) - Expected", "Sum of Financial Year Impacts", "Status", "Risk Owner",
+    "Control Measure / Mitigation", "By When", "Probability - Post Mitigation - Likelihood",
+    "Probability - Post Mitigation - Impact", "Probability - Post Mitigation - Score (out of 25)",
+    "Probability - Post Mitigation - % Risk Score", "Risk Paper", "Contract Manager", "Regional Manager",
+    "Expected Impact FY 23-24", "Accounting Treatment FY 23-24", "Expected Impact FY 24-25",
+    "Accounting Treatment FY 24-25", "Expected Impact FY 25-26", "Accounting Treatment FY 25-26",
+    "Expected Impact FY 26-27", "Accounting Treatment FY 26-27", "Expected Impact FY 27-28",
+    "Accounting Treatment FY 27-28", "OriginList",
+]
+
+
+def column_list_text(columns=REGISTER_COLUMNS) -> str:
+    """
+    Renders the column list the way the system prompts quote it.
+    """
+    return ", ".join(f'"{c}"' for c in columns)
+
+
+def schema_hash(columns=REGISTER_COLUMNS) -> str:
+    """
+    Short, stable fingerprint of a column list (used to key caches).
+    """
+    return hashlib.sha256("\x1f".join(columns).encode("utf-8")).hexdigest()[:16]
+
+
+# Column types used by the register loader
+DATE_COLUMNS = ["Date Raised", "Date Updated", "By When"]
+
+FLAG_COLUMNS = [c for c in REGISTER_COLUMNS if c.startswith("Risk Type - ")]
+
+# Ordered Low < Medium < High, so comparisons like `>= "Medium"` work
+LEVEL_COLUMNS = [
+    "Probability - Pre Mitigation - Likelihood", "Probability - Pre Mitigation - Impact",
+    "Probability - Post Mitigation - Likelihood", "Probability - Post Mitigation - Impact",
+]
+LEVELS = ["Low", "Medium", "High"]
+
+CATEGORY_COLUMNS = [
+    "Risk Area", "Contract", "Contract:Region", "Raised By", "Risk/Opportunity", "Status", "Risk Owner",
+    "Risk Paper", "Contract Manager", "Regional Manager", "OriginList",
+] + [c for c in REGISTER_COLUMNS if c.startswith("Accounting Treatment FY")]
+
+NUMERIC_COLUMNS = [
+    c for c in REGISTER_COLUMNS
+    if c.startswith(("Probability - Pre Mitigation - Score", "Probability - Pre Mitigation - %",
+                     "Probability - Post Mitigation - Score", "Probability - Post Mitigation - %",
+                     "Impact (£)", "Sum of Financial Year Impacts", "Expected Impact FY"))
+]
+
+# Free text (kept as strings): "RiskIDNumber", "Description of Risk/Opportunity", "Control Measure / Mitigation"
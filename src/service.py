@@ -0,0 +1,240 @@
+# service.py
+"""
+HTTP service around the query pipeline.
+
+    python -m src.service --port 8000
+    ROBO_SERVICE_URL=http://127.0.0.1:8000 streamlit run ui_app.py     # app as a thin client
+
+One warm, read-only register is shared by all requests; edits to the source file are
+applied to it as deltas (src/ingest.py). Requests run on the async pipeline (main.arun_query). Identical queries that are
+in flight at the same time share a single pipeline run, and with it the same model calls.
+At most ROBO_SERVICE_MAX_CONCURRENCY runs execute at once and ROBO_SERVICE_MAX_QUEUE
+more may wait; beyond that requests get 503 with Retry-After.
+
+    POST /query     {"query": str, "intent": [optional], "max_rows": int}
+    POST /intent    {"query": str}
+    GET  /register  ?offset=0&limit=1000
+    GET  /health, GET /stats
+"""
+
+import os
+import json
+import asyncio
+import argparse
+from typing import Optional, Union
+
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from src.analytics import get_rollups
+from src.filter_engine import FilterRejected
+from src.filterer import plan_cache_stats
+from src.intent_classifier import LABELS
+from src.intent_detector import adetect_intent
+from src.main import aprocess_query, arun_query
+from src.payload import format_frame
+from src.plan_cache import normalize_query
+from src.ingest import RegisterStore
+from src.register import DEFAULT_REGISTER_PATH
+from src.result import RowSet, as_frame
+from src.retrieval import warm
+
+MAX_CONCURRENCY = int(os.getenv("ROBO_SERVICE_MAX_CONCURRENCY", "8"))
+MAX_QUEUE = int(os.getenv("ROBO_SERVICE_MAX_QUEUE", "32"))
+MAX_ROWS = int(os.getenv("ROBO_SERVICE_MAX_ROWS", "1000"))
+# Seconds a rejected client is asked to wait
+_RETRY_AFTER = 2
+
+
+def frame_payload(df: Union[pd.DataFrame, RowSet], offset: int = 0, limit: Optional[int] = None) -> dict:
+    """
+    JSON form of (a page of) `df`: columns, index and rows, dates as ISO strings.
+    Only the page is materialised. Read back with service_client.frame_from_payload.
+    """
+    page = as_frame(df, start=offset, stop=offset + limit if limit is not None else None)
+    data = json.loads(format_frame(page).to_json(orient="split", index=True))
+    data["total_rows"] = int(len(df))
+    data["offset"] = offset
+    return data
+
+
+class QueryService:
+    """
+    Coalescing and admission control in front of the async pipeline.
+    """
+
+    def __init__(self, register_path: str = DEFAULT_REGISTER_PATH, max_concurrency: int = MAX_CONCURRENCY,
+                 max_queue: int = MAX_QUEUE):
+        self.register = RegisterStore.from_path(register_path)
+        get_rollups(self.register.df)
+        warm(self.register.df)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._running = asyncio.Semaphore(max_concurrency)
+        self._in_flight = {}
+        self.stats = {"requests": 0, "runs": 0, "coalesced": 0, "rejected": 0, "errors": 0}
+
+    def load(self) -> int:
+        return len(self._in_flight)
+
+    async def query(self, query: str, intent: Optional[list] = None) -> tuple:
+        """
+        Runs (or joins an identical in-flight run of) the pipeline.
+        Returns: (intent, filtered_df, filter_explanation, summary, final_summary)
+        Raises OverflowError when the queue is full.
+        """
+        df, version = await asyncio.to_thread(self.register.refresh)
+        key = (normalize_query(query), tuple(intent) if intent is not None else None, version)
+        self.stats["requests"] += 1
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            if len(self._in_flight) >= self.max_concurrency + self.max_queue:
+                self.stats["rejected"] += 1
+                raise OverflowError("Too many queries in progress, try again shortly")
+            task = asyncio.ensure_future(self._run(query, df, intent))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # shield: a client that disconnects must not cancel the run for the others
+        return await asyncio.shield(task)
+
+    async def _run(self, query: str, df: pd.DataFrame, intent: Optional[list]) -> tuple:
+        async with self._running:
+            self.stats["runs"] += 1
+            try:
+                if intent is None:
+                    return await arun_query(query, df)
+                return (intent, *await aprocess_query(query, df, intent))
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+
+
+# ---- HTTP ---------------------------------------------------------------------------------------
+
+class BadRequest(ValueError):
+    """
+    Raised when a request body is malformed; answered with 422, unlike errors of the pipeline.
+    """
+
+
+async def _body(request: Request) -> dict:
+    """
+    The validated JSON body: "query", "intent" (None or a list of known labels) and
+    "max_rows" (a non-negative int, default MAX_ROWS).
+    """
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    if not isinstance(body, dict) or not isinstance(body.get("query"), str) or not body["query"].strip():
+        raise BadRequest('Expected a JSON object with a non-empty "query"')
+    intent = body.get("intent")
+    if intent is not None and (not isinstance(intent, list) or not intent
+                               or not all(isinstance(label, str) and label in LABELS for label in intent)):
+        raise BadRequest(f'"intent" must be a non-empty list of {", ".join(LABELS)}')
+    max_rows = body.get("max_rows", MAX_ROWS)
+    # bool is an int too, and never meant as a row count
+    if not isinstance(max_rows, int) or isinstance(max_rows, bool) or max_rows < 0:
+        raise BadRequest('"max_rows" must be a non-negative integer')
+    return {**body, "intent": intent, "max_rows": max_rows}
+
+
+def _error(status: int, message: str, headers: Optional[dict] = None) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status, headers=headers)
+
+
+async def query_endpoint(request: Request) -> JSONResponse:
+    service = request.app.state.service
+    try:
+        body = await _body(request)
+        intent, filtered_df, filter_explanation, summary, final_summary = await service.query(
+            body["query"], body.get("intent"))
+    except OverflowError as e:
+        return _error(503, str(e), {"Retry-After": str(_RETRY_AFTER)})
+    except TimeoutError as e:
+        return _error(504, str(e))
+    except (FilterRejected, BadRequest) as e:
+        return _error(422, str(e))
+    except Exception as e:
+        return _error(500, f"{type(e).__name__}: {e}")
+
+    result = {
+        "intent": intent,
+        "filter_explanation": filter_explanation,
+        "summary": summary,
+        "final_summary": final_summary,
+        "filtered_data": None,
+    }
+    if filtered_df is not None:
+        max_rows = min(body["max_rows"], MAX_ROWS)
+        result["filtered_data"] = await asyncio.to_thread(frame_payload, filtered_df, 0, max_rows)
+    return JSONResponse(result)
+
+
+async def intent_endpoint(request: Request) -> JSONResponse:
+    try:
+        body = await _body(request)
+        return JSONResponse({"intent": await adetect_intent(body["query"])})
+    except BadRequest as e:
+        return _error(422, str(e))
+    except Exception as e:
+        return _error(500, f"{type(e).__name__}: {e}")
+
+
+async def register_endpoint(request: Request) -> JSONResponse:
+    df, _ = await asyncio.to_thread(request.app.state.service.register.refresh)
+    try:
+        offset = max(0, int(request.query_params.get("offset", 0)))
+        limit = min(max(0, int(request.query_params.get("limit", MAX_ROWS))), MAX_ROWS)
+    except ValueError:
+        return _error(422, "offset and limit must be integers")
+    return JSONResponse(await asyncio.to_thread(frame_payload, df, offset, limit))
+
+
+async def health_endpoint(request: Request) -> JSONResponse:
+    service = request.app.state.service
+    df, version = service.register.current()
+    return JSONResponse({"status": "ok", "rows": len(df), "version": version, "in_flight": service.load()})
+
+
+async def stats_endpoint(request: Request) -> JSONResponse:
+    service = request.app.state.service
+    return JSONResponse({**service.stats, "in_flight": service.load(), "plan_cache": plan_cache_stats()})
+
+
+def create_app(register_path: str = DEFAULT_REGISTER_PATH, max_concurrency: int = MAX_CONCURRENCY,
+               max_queue: int = MAX_QUEUE) -> Starlette:
+    app = Starlette(routes=[
+        Route("/query", query_endpoint, methods=["POST"]),
+        Route("/intent", intent_endpoint, methods=["POST"]),
+        Route("/register", register_endpoint, methods=["GET"]),
+        Route("/health", health_endpoint, methods=["GET"]),
+        Route("/stats", stats_endpoint, methods=["GET"]),
+    ])
+    # Warm before the first request, not during it
+    app.state.service = QueryService(register_path, max_concurrency, max_queue)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--register", default=DEFAULT_REGISTER_PATH)
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE)
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    uvicorn.run(create_app(args.register, args.max_concurrency, args.max_queue), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
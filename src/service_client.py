@@ -0,0 +1,84 @@
+# service_client.py
+"""
+Minimal client of the ROBO HTTP service (src/service.py), standard library only.
+"""
+
+import json
+import urllib.error
+import urllib.request
+from typing import Optional
+
+import pandas as pd
+
+from src.register import apply_schema
+
+
+def frame_from_payload(payload: Optional[dict]) -> Optional[pd.DataFrame]:
+    """
+    Rebuilds the typed DataFrame from service.frame_payload output. `attrs["total_rows"]` is
+    the number of rows the page was taken from (more than it holds when the service capped it).
+    """
+    if payload is None:
+        return None
+    df = apply_schema(pd.DataFrame(payload["data"], columns=payload["columns"], index=payload["index"]))
+    df.attrs["total_rows"] = payload.get("total_rows", len(df))
+    return df
+
+
+class ServiceError(RuntimeError):
+    def __init__(self, status: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"ROBO service returned {status}: {message}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class ServiceClient:
+    def __init__(self, base_url: str, timeout: float = 300.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _call(self, method: str, path: str, body: Optional[dict] = None) -> dict:
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            retry_after = e.headers.get("Retry-After")
+            raise ServiceError(e.code, message, float(retry_after) if retry_after else None) from None
+
+    def detect_intent(self, query: str) -> list:
+        return self._call("POST", "/intent", {"query": query})["intent"]
+
+    def query(self, query: str, intent: Optional[list] = None, max_rows: Optional[int] = None) -> tuple:
+        """
+        Returns: (intent, filtered_df, filter_explanation, summary, final_summary), as main.arun_query.
+        filtered_df holds at most `max_rows` rows (the service's ROBO_SERVICE_MAX_ROWS by default),
+        and the number of rows the filter matched as `attrs["total_rows"]`.
+        """
+        body = {"query": query}
+        if intent is not None:
+            body["intent"] = list(intent)
+        if max_rows is not None:
+            body["max_rows"] = max_rows
+        result = self._call("POST", "/query", body)
+        return (result["intent"], frame_from_payload(result["filtered_data"]), result["filter_explanation"],
+                result["summary"], result["final_summary"])
+
+    def register(self, offset: int = 0, limit: int = 1000) -> pd.DataFrame:
+        return self.register_page(offset, limit)[0]
+
+    def register_page(self, offset: int = 0, limit: int = 1000) -> tuple:
+        """
+        Returns: (rows `offset` to `offset + limit` of the register, number of rows in the register)
+        """
+        payload = self._call("GET", f"/register?offset={offset}&limit={limit}")
+        return frame_from_payload(payload), payload["total_rows"]
+
+    def stats(self) -> dict:
+        return self._call("GET", "/stats")
@@ -0,0 +1,202 @@
+# session.py
+"""
+Conversational sessions: a follow-up question refines the previous answer instead of starting over.
+
+    session = Session(df)
+    for kind, value in session.stream("Show the open risks in the north region"): ...
+    for kind, value in session.stream("now only the ones owned by Alice"): ...
+
+A session keeps the latest filter result (a RowSet over the register, src/result.py), its
+explanation and the summary that was written about it. The filter assistant sees the
+earlier requests and plans; when it answers "refine": true, its code is only the extra
+condition and is applied to the previous result (filter_engine.refine_rows) rather than
+to the register. A summary of a refined result gets only the delta after the earlier
+turns it already answered: the IDs of the rows that remain and any columns not shown
+before (payload.delta_payload). Questions that point back at the result without a new
+filter ("summarise those") reuse it as is.
+
+Every prompt is [static system prompt, earlier turns..., new turn], so each request
+extends the one before it and the provider's prompt caching can reuse that prefix. The
+last ROBO_SESSION_TURNS turns are kept (plus, for the summariser, the turn that first
+listed the rows). Events are those of `main.stream_query`.
+"""
+
+import os
+import re
+import json
+from typing import Iterator, Optional
+
+import pandas as pd
+
+from src.analytics import computed_payload
+from src.filter_engine import FilterRejected, filter_rows, refine_rows
+from src.filterer import filter_assistant, forget_plan
+from src.intent_detector import detect_intent
+from src.other import other_assistant
+from src.payload import delta_payload
+from src.result import RowSet
+from src.summariser import LOCAL_ANALYTICS, prompt_data, summary_assistant, user_message
+from src.tracing import span
+
+MAX_TURNS = int(os.getenv("ROBO_SESSION_TURNS", "4"))
+_ANSWER_INTENTS = ("summarise_risks", "other")
+# A question about "those"/"them" without a filter of its own is about the previous result
+_REFERS_BACK = re.compile(r"\b(these|those|them|they|the above|that list|the same ones|of which)\b", re.IGNORECASE)
+
+
+class Session:
+    """
+    The state of one conversation over the register frame `df`.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.reset()
+
+    def reset(self):
+        self.turns = 0
+        self.rows = None                 # latest filter result (RowSet), refined by follow-ups
+        self.filter_explanation = ""     # what `rows` holds, refinements included
+        self.answer = ""                 # latest summary / final answer
+        self._filter_history = []        # earlier filter requests and plans (messages)
+        self._summary_history = []       # the summary turns about `rows` (messages)
+        self._listed = None              # payload that listed every row `rows` descends from
+        self._last_intent = []
+
+    # ---- history ------------------------------------------------------------------------------
+
+    def _add_filter_turn(self, user_query: str, plan: dict):
+        self._filter_history += [
+            {"role": "user", "content": user_query},
+            {"role": "assistant", "content": json.dumps(plan)},
+        ]
+        self._filter_history = self._filter_history[-2 * MAX_TURNS:]
+
+    def _add_summary_turn(self, message: dict, summary: str, data: dict):
+        turn = [message, {"role": "assistant", "content": summary}]
+        if data.get("format") == "delta":
+            # The turn that listed the rows stays first: the deltas refer to it
+            later = (self._summary_history[2:] + turn)[-2 * (MAX_TURNS - 1):]
+            self._summary_history = self._summary_history[:2] + later
+        elif "csv" in data and "sampled" not in data:
+            self._listed = data
+            self._summary_history = turn
+        elif "computed" not in data:
+            self._listed = None
+            self._summary_history = []
+
+    def _new_result(self, rows: Optional[RowSet], explanation: str):
+        self.rows = rows
+        self.filter_explanation = explanation
+        self._listed = None
+        self._summary_history = []
+
+    # ---- steps --------------------------------------------------------------------------------
+
+    def _filter(self, user_query: str) -> tuple:
+        """
+        Plans and applies the filter for `user_query`.
+        Returns: (rows, explanation of this step, refined previous result?)
+        """
+        plan = filter_assistant(user_query, self._filter_history, df=self.df)
+        refine = bool(plan.get("refine")) and self.rows is not None
+        with span("filter.apply", rows_in=len(self.rows if refine else self.df), refine=refine) as s:
+            try:
+                if refine:
+                    rows = refine_rows(plan["code"], self.rows)
+                else:
+                    rows = filter_rows(plan["code"], self.df)
+            except FilterRejected:
+                forget_plan(user_query)
+                raise
+            s.set(rows_out=len(rows))
+        self._add_filter_turn(user_query, plan)
+        return rows, plan["explanation"], refine
+
+    def _summary_data(self, user_query: str, rows, explanation: str, intent: list, follow_up: bool) -> dict:
+        """
+        The summary prompt data: for a follow-up, the locally computed answer or the delta
+        against the rows already listed; else the full payload.
+        """
+        if follow_up and self._listed is not None:
+            data = computed_payload(user_query, rows, filtered=True) if LOCAL_ANALYTICS else None
+            if data is None:
+                data = delta_payload(self._listed, rows, user_query)
+            if data is not None:
+                return data
+        return prompt_data(user_query, rows, explanation, intent)
+
+    # ---- turns --------------------------------------------------------------------------------
+
+    def stream(self, user_query: str, intent: Optional[list] = None) -> Iterator[tuple]:
+        """
+        Answers `user_query` in the context of the conversation so far, yielding the events
+        of `main.stream_query`.
+        """
+        intent = list(intent) if intent is not None else detect_intent(user_query)
+        with span("query", intent=",".join(intent), stream=True, session_turn=self.turns) as s:
+            follow_up = False
+            rows, explanation, step_explanation = None, "", ""
+            if "filter_data" in intent:
+                rows, step_explanation, follow_up = self._filter(user_query)
+                if follow_up:
+                    explanation = f"{self.filter_explanation} {step_explanation}".strip()
+                    self.rows, self.filter_explanation = rows, explanation
+                    # A narrowed result is still the answer to the earlier question
+                    if not any(i in intent for i in _ANSWER_INTENTS):
+                        intent += [i for i in self._last_intent if i in _ANSWER_INTENTS]
+                else:
+                    explanation = step_explanation
+                    self._new_result(rows, explanation)
+                yield "filter", (rows, explanation)
+            elif self.rows is not None and _REFERS_BACK.search(user_query):
+                follow_up = True
+                rows, explanation = self.rows, self.filter_explanation
+            s.set(follow_up=follow_up)
+
+            summary = ""
+            final_summary = ""
+            if "summarise_risks" in intent:
+                data_rows = rows if rows is not None else self.df
+                summary_intent = intent if rows is None or "filter_data" in intent else ["filter_data"] + intent
+                data = self._summary_data(user_query, data_rows, explanation, summary_intent, follow_up)
+                # A delta is explained by this step alone; the earlier turns explain the rest
+                shown_explanation = step_explanation if data.get("format") == "delta" else explanation
+                history = self._summary_history if data.get("format") == "delta" else []
+                summary_args = (user_query, data_rows, shown_explanation, summary_intent)
+                if "other" in intent:
+                    summary = summary_assistant(*summary_args, history=history, data=data)
+                else:
+                    parts = []
+                    for token in summary_assistant(*summary_args, stream=True, history=history, data=data):
+                        parts.append(token)
+                        yield "token", token
+                    summary = "".join(parts).strip()
+                self._add_summary_turn(user_message(*summary_args, data), summary, data)
+
+            if "other" in intent:
+                prior = summary or (self.answer if follow_up else "")
+                if "summarise_risks" not in intent:
+                    tokens = other_assistant(user_query, prior, explanation, rows, stream=True)
+                else:
+                    tokens = other_assistant(user_query, prior, explanation, stream=True)
+                parts = []
+                for token in tokens:
+                    parts.append(token)
+                    yield "token", token
+                final_summary = "".join(parts).strip()
+
+            self.answer = final_summary or summary or self.answer
+            self._last_intent = intent
+            self.turns += 1
+            yield "done", (rows, explanation, summary, final_summary)
+
+    def ask(self, user_query: str, intent: Optional[list] = None) -> tuple:
+        """
+        Non-streaming `stream`. Returns: (filtered_df, filter_explanation, summary, final_summary)
+        """
+        result = None
+        for kind, value in self.stream(user_query, intent):
+            if kind == "done":
+                result = value
+        return result
@@ -2,21 +2,29 @@
 
 import os
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
+import math
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-from typing import Optional
-import streamlit as st
-from src.fetch_key import get_openai_key
+from typing import Iterator, Optional, Union
+from src.analytics import computed_payload
+from src.calls import acomplete, complete, stream as stream_completion
+from src.tracing import bind, current, span
+from src.payload import DEFAULT_TOKEN_BUDGET, aggregate, build_payload, count_tokens, partition, select_columns
+from src.result import RowSet
 
-api_key = get_openai_key()
-if not api_key:
-    raise RuntimeError("OPENAI_API_KEY not found—please set it in your .env or shell or add to secrets.")
-if not api_key:
-    raise RuntimeError("OPENAI_API_KEY not found—please set it in your .env or shell.")
+_MODEL = "gpt-4o-mini"
 
-# Initialize OpenAI client
-client = OpenAI(api_key=api_key)
+# Map-reduce summarisation for row sets that do not fit one prompt
+MAP_REDUCE = os.getenv("ROBO_MAP_REDUCE", "1") != "0"
+_MAP_WORKERS = int(os.getenv("ROBO_SUMMARY_WORKERS", "4"))
+_MAX_REDUCE_LEVELS = 3
+_CHUNK_CACHE_SIZE = 4096
+# Aggregate questions (totals, averages, top-N) are computed locally (analytics.py)
+LOCAL_ANALYTICS = os.getenv("ROBO_LOCAL_ANALYTICS", "1") != "0"
 
 # System prompt for generating high quality summaries
 _SYSTEM_PROMPT = """
@@ -26,7 +34,14 @@ Your task is to read a set of risks from the company risk register and generate
 
 You will be given:
 - A user prompt (natural language query, e.g. “What are the biggest risk areas in the next month?”)
-- A table of filtered risks, as rows from a pandas DataFrame in JSON format (each row is a dictionary)
+- A table of filtered risks in a compact form:
+  • `csv`: the rows as CSV text (header line first), only the columns relevant to the question
+  • `row_count`: how many risks matched in total
+  • `constant_columns` (optional): columns that have the same value for every row, given once
+  • `aggregates` and `sampled` (optional): when there are too many rows, group counts/£ totals over ALL rows plus only the highest-risk rows in `csv` (with `retrieved`, the rows most relevant to the question instead). Use the aggregates for totals and counts.
+  • `partial_summaries` (instead of `csv`, for very large sets): findings written for each group of rows (e.g. per risk area), together covering ALL rows, plus `aggregates` over all rows. Combine them into one answer; do not list the groups one by one unless asked.
+  • `computed` (instead of `csv`, for totals, averages, counts and top-N questions): the exact answer already calculated over ALL matching rows (`description` and a small `csv` table). Report these figures as given; never recalculate or estimate them.
+- In a follow-up to an earlier question of the conversation, `refined_data` instead of the table: the earlier rows narrowed down by `filter_explanation`. `risk_ids` are the RiskIDNumbers of the earlier rows that still match (`row_count` in total) and `csv` (optional) gives only columns not shown before. Answer about these rows only, using what the earlier data told you about them.
 
 You should:
 - Understand the user's intent from the question
@@ -55,43 +70,351 @@ Make it look pretty! Use paragraphs, bullet points and other formatting tools li
 Always write in plain, business-friendly English. Focus on actionable insight.
 """
 
-def summary_assistant(
+def user_message(
     user_input: str,
-    filtered_df: Optional[pd.DataFrame] = None,
+    filtered_df: Optional[Union[pd.DataFrame, RowSet]] = None,
     filter_explanation: Optional[str] = None,
-    intent: Optional[list] = None
-) -> str:
+    intent: Optional[list] = None,
+    data: Optional[dict] = None
+) -> dict:
     """
-    Generate a summary report for `user_input` using:
-    - filtered_df: the DataFrame after filtering (or None)
-    - filter_explanation: explanation of that filter (or None)
-
-    Returns the assistant's summary as a string.
+    The user turn of the summary prompt (what a conversation keeps as history).
     """
-
     payload = {"user_prompt": user_input}
 
     if filtered_df is not None:
-        records = filtered_df.to_dict(orient="records")
-        
-        if 'filter_data' in intent:
-            payload["filtered_data"] = records
+        if data is None:
+            data = build_payload(filtered_df, user_input)
+
+        if data.get("format") == "delta":
+            payload["refined_data"] = data
+        elif 'filter_data' in (intent or []):
+            payload["filtered_data"] = data
         else:
-            payload['complete_unfiltered_data'] = records
+            payload['complete_unfiltered_data'] = data
 
     if filter_explanation is not None:
         payload["filter_explanation"] = filter_explanation
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system",  "content": _SYSTEM_PROMPT.strip()},
-            {"role": "user",    "content": json.dumps(payload)}
-        ],
-        temperature=0.2
-    )
+    return {"role": "user", "content": json.dumps(payload)}
+
+
+def _messages(
+    user_input: str,
+    filtered_df: Optional[Union[pd.DataFrame, RowSet]] = None,
+    filter_explanation: Optional[str] = None,
+    intent: Optional[list] = None,
+    data: Optional[dict] = None,
+    history: Optional[list] = None
+) -> list:
+    # The system prompt stays first and unchanged, so the provider can cache it as a prefix
+    return [
+        {"role": "system",  "content": _SYSTEM_PROMPT.strip()},
+        *(history or []),
+        user_message(user_input, filtered_df, filter_explanation, intent, data)
+    ]
+
+
+def _computed_data(user_input: str, df: pd.DataFrame, intent: Optional[list]) -> Optional[dict]:
+    """
+    Prompt data holding the locally computed answer, for aggregate questions; else None.
+    """
+    if not LOCAL_ANALYTICS:
+        return None
+    data = computed_payload(user_input, df, filtered="filter_data" in (intent or []))
+    if data is not None:
+        current().set(local_analytics=True)
+    return data
+
 
+def _text(response) -> str:
     summary = response.choices[0].message.content.strip()
     if not summary:
         raise ValueError("Empty summary returned")
-    return summary
\ No newline at end of file
+    return summary
+
+
+def prompt_data(
+    user_input: str,
+    filtered_df: Optional[Union[pd.DataFrame, RowSet]] = None,
+    filter_explanation: Optional[str] = None,
+    intent: Optional[list] = None,
+    columns: Optional[list] = None
+) -> Optional[dict]:
+    """
+    The data part of the summary prompt for `filtered_df` (None without rows): the locally
+    computed answer, the token-budgeted rows (of `columns`, default those the question
+    needs), or map-reduce partial summaries.
+    """
+    if filtered_df is None:
+        return None
+    data = _computed_data(user_input, filtered_df, intent)
+    if data is None:
+        # With map-reduce, rows over budget that retrieval cannot narrow are not sampled
+        data = build_payload(filtered_df, user_input, columns=columns, sample=not MAP_REDUCE)
+    if data is None:
+        current().set(map_reduce=True)
+        data = _map_reduce_data(user_input, filtered_df, filter_explanation)
+    return data
+
+
+def summary_assistant(
+    user_input: str,
+    filtered_df: Optional[Union[pd.DataFrame, RowSet]] = None,
+    filter_explanation: Optional[str] = None,
+    intent: Optional[list] = None,
+    stream: bool = False,
+    history: Optional[list] = None,
+    data: Optional[dict] = None
+) -> Union[str, Iterator[str]]:
+    """
+    Generate a summary report for `user_input` using:
+    - filtered_df: the rows after filtering, a DataFrame or a RowSet (or None)
+    - filter_explanation: explanation of that filter (or None)
+    - history: earlier user/assistant turns of a conversation (src/session.py), or None
+    - data: the prompt data for `filtered_df` if already built (`prompt_data`, or a
+      refinement delta from payload.delta_payload)
+
+    Aggregate questions get the locally computed answer instead of rows (analytics.py);
+    rows that do not fit the prompt budget are narrowed to those relevant to the question
+    (retrieval.py) or, when none stand out, summarised map-reduce style (see below).
+    Returns the assistant's summary as a string, or with `stream=True` an iterator
+    over the text as the model produces it.
+    """
+    with span("summary.payload", rows=None if filtered_df is None else len(filtered_df)) as s:
+        if data is None:
+            data = prompt_data(user_input, filtered_df, filter_explanation, intent)
+        messages = _messages(user_input, filtered_df, filter_explanation, intent, data, history)
+        s.set(payload_bytes=len(messages[-1]["content"]), payload_tokens=(data or {}).get("tokens"))
+
+    if stream:
+        return _stream(messages)
+
+    with span("summary", model=_MODEL) as s:
+        response = complete(
+            "summary",
+            model=_MODEL,
+            messages=messages,
+            temperature=0.2
+        )
+        s.usage(response)
+    return _text(response)
+
+
+async def asummary_assistant(
+    user_input: str,
+    filtered_df: Optional[Union[pd.DataFrame, RowSet]] = None,
+    filter_explanation: Optional[str] = None,
+    intent: Optional[list] = None,
+    history: Optional[list] = None,
+    data: Optional[dict] = None
+) -> str:
+    """
+    Async version of `summary_assistant`.
+    """
+    with span("summary.payload", rows=None if filtered_df is None else len(filtered_df)) as s:
+        if data is None and filtered_df is not None:
+            data = await asyncio.to_thread(bind(_computed_data), user_input, filtered_df, intent)
+            if data is None:
+                data = await asyncio.to_thread(bind(build_payload), filtered_df, user_input, sample=not MAP_REDUCE)
+            if data is None:
+                s.set(map_reduce=True)
+                data = await _amap_reduce_data(user_input, filtered_df, filter_explanation)
+        messages = _messages(user_input, filtered_df, filter_explanation, intent, data, history)
+        s.set(payload_bytes=len(messages[-1]["content"]), payload_tokens=(data or {}).get("tokens"))
+
+    with span("summary", model=_MODEL) as s:
+        response = await acomplete(
+            "summary",
+            model=_MODEL,
+            messages=messages,
+            temperature=0.2
+        )
+        s.usage(response)
+    return _text(response)
+
+
+def _stream(messages: list) -> Iterator[str]:
+    with span("summary", model=_MODEL, stream=True) as s:
+        response = stream_completion(
+            "summary",
+            model=_MODEL,
+            messages=messages,
+            temperature=0.2,
+            stream_options={"include_usage": True}
+        )
+        for chunk in response:
+            if chunk.usage is not None:
+                s.usage(chunk)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+# ---- map-reduce ---------------------------------------------------------------------------------
+#
+# map:    the rows are partitioned (by risk area / region, then at content-defined boundaries
+#         within the token budget) and each chunk is summarised on its own, in parallel
+# reduce: the chunk summaries (collapsed further if they are still too long) plus aggregates over
+#         all rows go to the normal summary prompt as `partial_summaries`
+#
+# Chunk summaries are cached by a hash of their exact prompt, so a re-run over a register where
+# a few rows changed only re-summarises the chunks those rows fall in.
+
+_MAP_PROMPT = """
+You are helping summarise a large risk register in parts.
+
+You will be given the user's question and ONE part of the data: either risk rows (`rows`, compact CSV as described by its keys) or findings already written for several parts (`partial_summaries`).
+
+Write the findings from this part that are relevant to the question, for a later step that combines all parts:
+- counts and £ totals that matter, the most severe or highest-impact risks (with their RiskIDNumber), notable owners, dates and statuses
+- facts only, no introduction and no recommendations
+- at most 120 words, plain bullet points
+
+If nothing in this part is relevant, reply with "No relevant risks."
+"""
+
+_chunk_cache = OrderedDict()
+_chunk_lock = threading.Lock()
+
+
+def _chunk_key(messages: list) -> str:
+    raw = json.dumps([_MODEL, messages], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _cached(key: str) -> Optional[str]:
+    with _chunk_lock:
+        summary = _chunk_cache.get(key)
+        if summary is not None:
+            _chunk_cache.move_to_end(key)
+        return summary
+
+
+def _store(key: str, summary: str):
+    with _chunk_lock:
+        _chunk_cache[key] = summary
+        _chunk_cache.move_to_end(key)
+        while len(_chunk_cache) > _CHUNK_CACHE_SIZE:
+            _chunk_cache.popitem(last=False)
+
+
+def _job(group: str, row_count: int, user_input: str, filter_explanation: Optional[str], data: dict) -> dict:
+    payload = {"user_prompt": user_input, **data}
+    if filter_explanation is not None:
+        payload["filter_explanation"] = filter_explanation
+    messages = [
+        {"role": "system", "content": _MAP_PROMPT.strip()},
+        {"role": "user", "content": json.dumps(payload)},
+    ]
+    return {"group": group, "row_count": row_count, "messages": messages, "key": _chunk_key(messages)}
+
+
+def _map_jobs(user_input: str, df: pd.DataFrame, filter_explanation: Optional[str]) -> list:
+    columns = select_columns(df, user_input)
+    return [
+        _job(label, len(chunk), user_input, filter_explanation,
+             {"group": label, "rows": build_payload(chunk, user_input, token_budget=math.inf, columns=columns)})
+        for label, chunk in partition(df, user_input, DEFAULT_TOKEN_BUDGET, columns)
+    ]
+
+
+def _collapse_jobs(user_input: str, partials: list, level: int) -> Optional[list]:
+    """
+    Next map level when the partial summaries are still over budget, else None.
+    """
+    if level >= _MAX_REDUCE_LEVELS or len(partials) < 2 or count_tokens(json.dumps(partials)) <= DEFAULT_TOKEN_BUDGET:
+        return None
+    batches, batch, used = [], [], 0
+    for partial in partials:
+        tokens = count_tokens(json.dumps(partial))
+        if batch and used + tokens > DEFAULT_TOKEN_BUDGET:
+            batches.append(batch)
+            batch, used = [], 0
+        batch.append(partial)
+        used += tokens
+    batches.append(batch)
+    if len(batches) == len(partials):
+        return None
+    return [
+        _job(f"{batch[0]['group']} … {batch[-1]['group']}", sum(p["row_count"] for p in batch),
+             user_input, None, {"partial_summaries": batch})
+        for batch in batches
+    ]
+
+
+def _complete(messages: list) -> str:
+    with span("summary.map", model=_MODEL) as s:
+        response = complete("summary.map", model=_MODEL, messages=messages, temperature=0.2)
+        s.usage(response)
+    return _text(response)
+
+
+async def _acomplete(messages: list, semaphore: asyncio.Semaphore) -> str:
+    async with semaphore:
+        with span("summary.map", model=_MODEL) as s:
+            response = await acomplete("summary.map", model=_MODEL, messages=messages, temperature=0.2)
+            s.usage(response)
+    return _text(response)
+
+
+def _run_jobs(jobs: list) -> list:
+    summaries = [_cached(job["key"]) for job in jobs]
+    pending = [i for i, summary in enumerate(summaries) if summary is None]
+    current().add("map_chunks", len(jobs)).add("map_cache_hits", len(jobs) - len(pending))
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, min(_MAP_WORKERS, len(pending)))) as pool:
+            futures = [pool.submit(bind(_complete), jobs[i]["messages"]) for i in pending]
+            for i, future in zip(pending, futures):
+                summary = future.result()
+                _store(jobs[i]["key"], summary)
+                summaries[i] = summary
+    return [{"group": job["group"], "row_count": job["row_count"], "summary": summary}
+            for job, summary in zip(jobs, summaries)]
+
+
+async def _arun_jobs(jobs: list) -> list:
+    summaries = [_cached(job["key"]) for job in jobs]
+    pending = [i for i, summary in enumerate(summaries) if summary is None]
+    current().add("map_chunks", len(jobs)).add("map_cache_hits", len(jobs) - len(pending))
+    semaphore = asyncio.Semaphore(max(1, _MAP_WORKERS))
+    results = await asyncio.gather(*(_acomplete(jobs[i]["messages"], semaphore) for i in pending))
+    for i, summary in zip(pending, results):
+        _store(jobs[i]["key"], summary)
+        summaries[i] = summary
+    return [{"group": job["group"], "row_count": job["row_count"], "summary": summary}
+            for job, summary in zip(jobs, summaries)]
+
+
+def _reduce_data(df: pd.DataFrame, partials: list) -> dict:
+    return {"format": "partial_summaries", "row_count": int(len(df)), "aggregates": aggregate(df),
+            "partial_summaries": partials}
+
+
+def _map_reduce_data(user_input: str, df: pd.DataFrame, filter_explanation: Optional[str]) -> dict:
+    """
+    Data part of the summary prompt for a row set too large to send whole.
+    """
+    partials = _run_jobs(_map_jobs(user_input, df, filter_explanation))
+    level = 1
+    while (jobs := _collapse_jobs(user_input, partials, level)) is not None:
+        partials = _run_jobs(jobs)
+        level += 1
+    return _reduce_data(df, partials)
+
+
+async def _amap_reduce_data(user_input: str, df: pd.DataFrame, filter_explanation: Optional[str]) -> dict:
+    jobs = await asyncio.to_thread(bind(_map_jobs), user_input, df, filter_explanation)
+    partials = await _arun_jobs(jobs)
+    level = 1
+    while (jobs := _collapse_jobs(user_input, partials, level)) is not None:
+        partials = await _arun_jobs(jobs)
+        level += 1
+    return _reduce_data(df, partials)
+
+
+def chunk_cache_info() -> dict:
+    """
+    Number of cached chunk summaries (for the debug view / benchmarks).
+    """
+    with _chunk_lock:
+        return {"entries": len(_chunk_cache), "max_entries": _CHUNK_CACHE_SIZE}
@@ -0,0 +1,236 @@
+# tracing.py
+"""
+Lightweight spans for the query pipeline.
+
+    with span("summary", model="gpt-4o-mini", payload_bytes=len(body)) as s:
+        response = client.chat.completions.create(...)
+        s.usage(response)
+
+Each span records wall time, its attributes (model, prompt/completion tokens and their
+cost, payload size, cache hits, row counts...) and any error. Finished spans go to a
+rotating JSONL file and to an in-memory ring buffer that the app's debug panel reads.
+
+Tracing is off unless ROBO_TRACE=1; while off, `span()` returns a shared no-op object,
+so instrumented code pays one function call and a flag check per stage.
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from typing import Optional
+
+ENABLED = os.getenv("ROBO_TRACE", "0") == "1"
+TRACE_FILE = os.getenv("ROBO_TRACE_FILE", os.path.join(os.getenv("ROBO_CACHE_DIR", ".cache"), "traces", "spans.jsonl"))
+_MAX_BYTES = int(os.getenv("ROBO_TRACE_MAX_BYTES", str(10 * 1024 * 1024)))
+_BACKUPS = int(os.getenv("ROBO_TRACE_BACKUPS", "5"))
+_BUFFER_SIZE = int(os.getenv("ROBO_TRACE_BUFFER", "2000"))
+
+# USD per 1M tokens (input, output)
+PRICES = {
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+_current = contextvars.ContextVar("robo_span", default=None)
+_buffer = deque(maxlen=_BUFFER_SIZE)
+_buffer_lock = threading.Lock()
+_logger = None
+_logger_lock = threading.Lock()
+
+
+def cost(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """
+    Estimated USD cost of a call, or None for models without a known price.
+    """
+    price = PRICES.get(model or "")
+    if price is None:
+        return None
+    return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+
+class Span:
+    """
+    One timed stage. Use through `span()`.
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "start", "_wall", "_previous")
+
+    def __init__(self, name: str, attributes: dict):
+        parent = _current.get()
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.span_id = uuid.uuid4().hex[:8]
+        self.attributes = attributes
+        self.start = None
+        self._wall = None
+        self._previous = None
+
+    def set(self, **attributes) -> "Span":
+        self.attributes.update(attributes)
+        return self
+
+    def add(self, key: str, amount=1) -> "Span":
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+        return self
+
+    def usage(self, response) -> "Span":
+        """
+        Records model and token counts (and their cost) from an OpenAI response or final stream chunk.
+        """
+        usage = getattr(response, "usage", None)
+        model = self.attributes.get("model") or getattr(response, "model", None)
+        if usage is None:
+            return self
+        prompt = getattr(usage, "prompt_tokens", 0) or 0
+        completion = getattr(usage, "completion_tokens", 0) or 0
+        self.add("prompt_tokens", prompt)
+        self.add("completion_tokens", completion)
+        price = cost(model, prompt, completion)
+        if price is not None:
+            self.add("cost_usd", price)
+        return self
+
+    def __enter__(self) -> "Span":
+        self._previous = _current.get()
+        _current.set(self)
+        self._wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        # set() rather than reset(): a span opened in a generator may be closed from another context
+        _current.set(self._previous)
+        record = {
+            "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "name": self.name, "start": self._wall, "duration_ms": round(duration * 1000, 3),
+            "status": "ok",
+        }
+        if exc_type is GeneratorExit:
+            record["status"] = "closed"  # stream abandoned by the reader
+        elif exc_type is not None:
+            record["status"] = "error"
+            record["error"] = f"{exc_type.__name__}: {exc}"
+        record.update(self.attributes)
+        _export(record)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attributes):
+        return self
+
+    def add(self, key, amount=1):
+        return self
+
+    def usage(self, response):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str, **attributes):
+    """
+    Context manager timing one stage; nested spans share the trace of the enclosing one.
+    """
+    if not ENABLED:
+        return _NOOP
+    return Span(name, attributes)
+
+
+def current():
+    """
+    The innermost open span (a no-op span when there is none or tracing is off).
+    """
+    return (_current.get() if ENABLED else None) or _NOOP
+
+
+def bind(fn):
+    """
+    `fn` wrapped to run in a copy of the current context, so spans opened on a
+    worker thread nest under the span that submitted the work.
+    """
+    if not ENABLED:
+        return fn
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+# ---- export -------------------------------------------------------------------------------------
+
+def _file_logger():
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            logger = logging.getLogger("robo.trace")
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            try:
+                os.makedirs(os.path.dirname(TRACE_FILE) or ".", exist_ok=True)
+                handler = RotatingFileHandler(TRACE_FILE, maxBytes=_MAX_BYTES, backupCount=_BACKUPS, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+            except OSError:
+                logger.addHandler(logging.NullHandler())  # read-only deployments keep the in-app buffer
+            _logger = logger
+    return _logger
+
+
+def _export(record: dict):
+    with _buffer_lock:
+        _buffer.append(record)
+    if TRACE_FILE:
+        _file_logger().info(json.dumps(record, default=str))
+
+
+def recent_spans(trace_id: Optional[str] = None) -> list:
+    """
+    Finished spans still in the ring buffer (oldest first), optionally of one trace.
+    """
+    with _buffer_lock:
+        spans = list(_buffer)
+    return spans if trace_id is None else [s for s in spans if s["trace_id"] == trace_id]
+
+
+def last_trace_id(name: Optional[str] = None) -> Optional[str]:
+    """
+    Trace of the most recently finished root span (named `name`, if given).
+    """
+    with _buffer_lock:
+        for record in reversed(_buffer):
+            if record["parent_id"] is None and (name is None or record["name"] == name):
+                return record["trace_id"]
+    return None
+
+
+def summarize(spans: list) -> dict:
+    """
+    Totals over a list of spans: model calls, tokens, cost, errors.
+    """
+    calls = [s for s in spans if "prompt_tokens" in s]
+    return {
+        "spans": len(spans),
+        "model_calls": len(calls),
+        "prompt_tokens": sum(s["prompt_tokens"] for s in calls),
+        "completion_tokens": sum(s.get("completion_tokens", 0) for s in calls),
+        "cost_usd": round(sum(s.get("cost_usd", 0.0) for s in calls), 6),
+        "errors": sum(s["status"] == "error" for s in spans),
+    }
@@ -0,0 +1,56 @@
+# test_analytics.py
+
+import pandas as pd
+import pytest
+
+from src.analytics import answer, parse_question
+
+EXPECTED = "Impact (£) - Expected"
+POST_SCORE = "Probability - Post Mitigation - Score (out of 25)"
+
+
+@pytest.mark.parametrize("question, parsed", [
+    ("Total expected impact by region", {"kind": "group", "stat": "sum", "metric": EXPECTED,
+                                         "dimension": "Contract:Region", "conditions": False}),
+    ("Top 5 risks by post-mitigation score", {"kind": "top", "n": 5, "metric": POST_SCORE, "ascending": False}),
+    ("Which owner has the lowest average expected impact?", {"kind": "group", "stat": "mean", "n": 1,
+                                                             "ascending": True, "dimension": "Risk Owner"}),
+    ("How many open SHE risks per contract?", {"kind": "group", "stat": "count", "dimension": "Contract",
+                                               "conditions": True}),
+    ("How many risks are there?", {"kind": "total", "stat": "count", "conditions": False}),
+])
+def test_parse_question(question, parsed, register):
+    result = parse_question(question, register.columns)
+    assert {key: result[key] for key in parsed} == parsed
+
+
+@pytest.mark.parametrize("question", ["Summarise the risks by region", "What does mitigation mean?"])
+def test_prose_questions_are_not_computed(question, register):
+    assert parse_question(question, register.columns) is None
+
+
+def test_grouped_totals_match_pandas(register):
+    result = answer("Total expected impact by region", register)
+    expected = register.groupby("Contract:Region", observed=True)[EXPECTED].sum().sort_values(ascending=False)
+    table = result["table"].set_index("Contract:Region")
+    assert table.index.tolist() == expected.index.tolist()
+    assert table[f"Total {EXPECTED}"].tolist() == expected.tolist()
+    assert result["row_count"] == len(register)
+
+
+def test_rollups_agree_with_direct_aggregation(register):
+    # A copy has no rollups of its own and is aggregated directly
+    question = "Average post-mitigation score per risk area"
+    pd.testing.assert_frame_equal(answer(question, register)["table"], answer(question, register.copy())["table"])
+
+
+def test_top_rows_match_nlargest(register):
+    table = answer("Top 5 risks by expected impact", register)["table"]
+    assert table[EXPECTED].tolist() == register.nlargest(5, EXPECTED)[EXPECTED].tolist()
+    assert "RiskIDNumber" in table.columns
+
+
+def test_row_conditions_need_the_filter(register):
+    assert answer("How many open SHE risks per contract?", register) is None
+    north = register[register["Contract:Region"] == "North"]
+    assert answer("How many risks in the north?", north, filtered=True)["table"]["Risks"].tolist() == [len(north)]
@@ -0,0 +1,75 @@
+# test_calls.py
+
+import time
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src import calls, filterer
+from src.plan_cache import PlanCache
+
+
+def _response(model: str, content: str = '{"code": "filtered_df = df", "explanation": "All risks."}'):
+    message = SimpleNamespace(content=content)
+    return SimpleNamespace(model=model, choices=[SimpleNamespace(message=message)], usage=None)
+
+
+@pytest.mark.parametrize("reported, expected", [
+    ("gpt-4.1", True),
+    ("gpt-4.1-2025-04-14", True),
+    ("gpt-4.1-mini", False),
+    ("gpt-4.1-mini-2025-04-14", False),
+    (None, False),
+])
+def test_answered_by(reported, expected):
+    assert calls.answered_by(SimpleNamespace(model=reported), "gpt-4.1") is expected
+
+
+def test_fallback_plans_are_not_cached(monkeypatch):
+    cache = PlanCache(namespace="test", cache_dir=None)
+    monkeypatch.setattr(filterer, "_plan_cache", cache)
+    filterer._parse("show all risks", _response("gpt-4.1-mini-2025-04-14"), latency=1.0)
+    assert cache.get("show all risks") is None
+    filterer._parse("show all risks", _response("gpt-4.1-2025-04-14"), latency=1.0)
+    assert cache.get("show all risks") is not None
+
+
+@pytest.fixture
+def hedging(monkeypatch):
+    # Every request is hedged after 50ms; the first one fails late, the duplicate hangs
+    monkeypatch.setattr(calls, "HEDGE", True)
+    monkeypatch.setattr(calls, "p95", lambda key: 0.05)
+    started = []
+    return started
+
+
+def test_hedged_call_keeps_its_deadline(hedging, monkeypatch):
+    def send(model, timeout, params):
+        hedging.append(time.monotonic())
+        if len(hedging) == 1:
+            time.sleep(0.4)
+            raise ConnectionError("first attempt failed")
+        time.sleep(min(timeout, 2.0))
+        raise TimeoutError("stalled")
+
+    monkeypatch.setattr(calls, "_send", send)
+    start = time.monotonic()
+    with pytest.raises((TimeoutError, ConnectionError)):
+        calls._send_hedged("gpt-4.1", 0.5, {})
+    assert time.monotonic() - start < 0.7
+
+
+def test_async_hedged_call_keeps_its_deadline(hedging, monkeypatch):
+    async def asend(model, timeout, params):
+        hedging.append(time.monotonic())
+        if len(hedging) == 1:
+            await asyncio.sleep(0.4)
+            raise ConnectionError("first attempt failed")
+        await asyncio.sleep(2.0)
+
+    monkeypatch.setattr(calls, "_asend", asend)
+    start = time.monotonic()
+    with pytest.raises((TimeoutError, ConnectionError)):
+        asyncio.run(calls._asend_hedged("gpt-4.1", 0.5, {}))
+    assert time.monotonic() - start < 0.7
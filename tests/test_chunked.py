@@ -0,0 +1,48 @@
+# test_chunked.py
+
+import pandas as pd
+import pytest
+
+from conftest import SAMPLE_REGISTER
+from src.chunked import aggregate_file, filter_file
+from src.filter_engine import FilterRejected, filter_rows
+from src.payload import aggregate
+
+CODES = [
+    'filtered_df = df',
+    'filtered_df = df.loc[df["Contract:Region"] == "North"]',
+    'filtered_df = df.loc[(df["Impact (£) - Expected"] > 100000) & (df["Risk Type - Financial"] == True)]',
+    'filtered_df = df.loc[df["Date Raised"] >= "2024-06-01"].sort_values("Date Raised")',
+    'filtered_df = df.loc[df["Status"] == "Open"].head(7)',
+    'filtered_df = df.loc[df["Status"] == "Open"].nlargest(5, "Impact (£) - Expected")',
+    'filtered_df = df.loc[df["Status"] == "Closed"]',
+]
+
+
+@pytest.mark.parametrize("chunk_rows", [10, 1000])
+@pytest.mark.parametrize("code", CODES)
+def test_filter_file_matches_filter_rows(code, chunk_rows, register):
+    expected = filter_rows(code, register).frame
+    result = filter_file(code, SAMPLE_REGISTER, chunk_rows=chunk_rows)
+    pd.testing.assert_frame_equal(result, expected, check_categorical=False, check_index_type=False)
+
+
+def test_filter_file_in_a_process_pool(register):
+    code = CODES[2]
+    result = filter_file(code, SAMPLE_REGISTER, chunk_rows=10, workers=2)
+    pd.testing.assert_frame_equal(result, filter_rows(code, register).frame, check_categorical=False,
+                                  check_index_type=False)
+
+
+@pytest.mark.parametrize("code", [None, CODES[1], CODES[5]])
+def test_aggregate_file_matches_aggregate(code, register):
+    rows = register if code is None else filter_rows(code, register)
+    assert aggregate_file(SAMPLE_REGISTER, code, chunk_rows=13) == aggregate(rows)
+
+
+def test_filter_file_rejects_like_filter_rows(register):
+    code = 'filtered_df = df.loc[df["Status"] > 5]'
+    with pytest.raises(FilterRejected):
+        filter_rows(code, register)
+    with pytest.raises(FilterRejected):
+        filter_file(code, SAMPLE_REGISTER, chunk_rows=13)
@@ -0,0 +1,42 @@
+# test_clients.py
+
+import threading
+
+import pytest
+
+from src import calls, clients
+from src.bench.mock_openai import MockOpenAI
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    mock = MockOpenAI(latency=0.3).start()
+    monkeypatch.setenv("OPENAI_BASE_URL", mock.url)
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(calls, "HEDGE", False)
+    clients.reset_clients()
+    yield mock
+    clients.reset_clients()
+    mock.stop()
+
+
+def test_reset_leaves_calls_in_flight_running(endpoint):
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(calls.complete("summary", model="gpt-4o-mini",
+                                          messages=[{"role": "user", "content": "Summarise the risks"}]))
+        except Exception as e:
+            errors.append(e)
+
+    clients.get_client()
+    thread = threading.Thread(target=call)
+    thread.start()
+    threading.Event().wait(0.1)
+    clients.reset_clients()
+    thread.join()
+    assert not errors and results[0].choices[0].message.content
+    # Answered by the first attempt, not by a retry after its connection was closed
+    assert len(endpoint.requests) == 1
+    assert clients.get_client() is not None
@@ -0,0 +1,108 @@
+# test_filter_engine.py
+
+import warnings
+
+import numpy as np
+import pytest
+
+from src.filter_engine import FilterRejected, apply_filter, compile_filter, filter_rows, normalized_form, refine_rows
+
+ACCEPTED = [
+    'filtered_df = df.loc[df["Status"] == "Open"]',
+    'filtered_df = df[(df["Contract:Region"] == "North") & (df["Risk Type - Reputational"] == True)]',
+    'filtered_df = df.loc[df["Contract:Region"].str.contains("north", case=False, na=False)]',
+    'filtered_df = df.loc[df["Risk Owner"].isin(["Alice", "Bob"]) | ~df["Risk Type - SHE"]]',
+    'filtered_df = df.loc[df["Impact (£) - Expected"].between(10000, 500000)]',
+    'filtered_df = df.loc[50000 <= df["Impact (£) - Expected"]]',
+    'filtered_df = df.loc[df["Date Raised"] >= "2024-01-01"]',
+    'filtered_df = df.loc[pd.to_datetime(df["By When"]) < pd.Timestamp("2025-10-01")]',
+    'filtered_df = df.loc[df["By When"] <= pd.Timestamp.today() + pd.DateOffset(months=3)]',
+    'filtered_df = df.loc[df["Date Raised"] >= pd.Timestamp.today() - pd.Timedelta(days=30)]',
+    'filtered_df = df.loc[df["Date Raised"].dt.year == 2024]',
+    'filtered_df = df.loc[df["Probability - Post Mitigation - Likelihood"] >= "Medium"]',
+    'filtered_df = df.loc[df["Control Measure / Mitigation"].isna()]',
+    'filtered_df = df.loc[df["Status"] == "Open"].sort_values("Impact (£) - Expected", ascending=False).head(5)',
+    'filtered_df = df.nlargest(3, "Impact (£) - Expected")',
+    'filtered_df = df.loc[df["Status"] == "Open"].reset_index(drop=True)',
+    'open_risks = df["Status"] == "Open"\nfiltered_df = df.loc[open_risks]',
+    'filtered_df = df.loc[df["Description of Risk/Opportunity"].str.similar_to("supplier failure")]',
+]
+
+# Unsafe code and anything outside the grammar
+UNSAFE = [
+    'import os\nfiltered_df = df',
+    'filtered_df = df.loc[eval("True")]',
+    'filtered_df = df.loc[df["Status"].apply(lambda s: s == "Open")]',
+    'filtered_df = df.query("Status == \'Open\'")',
+    'filtered_df = df.loc[df.__class__ == 1]',
+    'filtered_df = df.loc[df["Status"] == __import__("os").getcwd()]',
+    'df = df.head(0)\nfiltered_df = df',
+    'filtered_df = df.loc[df["Status"] == "Open"].to_csv("/tmp/out.csv")',
+    'for i in range(3):\n    pass\nfiltered_df = df',
+    'filtered_df = df.loc[df["Status"] == "Open", ["Status"]]',
+    'result = df',
+    'filtered_df = df.loc[',
+]
+
+# Valid Python in the grammar that the register's schema cannot answer
+INVALID_FOR_REGISTER = [
+    'filtered_df = df.loc[df["No such column"] == 1]',
+    'filtered_df = df.loc[df["Probability - Post Mitigation - Likelihood"] >= "medium"]',
+    'filtered_df = df.loc[df["Status"] > 5]',
+    'filtered_df = df.loc[df["Risk Owner"] < "M"]',
+    'filtered_df = df.loc[df["Impact (£) - Expected"] > "a lot"]',
+    'filtered_df = df.loc[df["Description of Risk/Opportunity"].str.contains("[")]',
+    'filtered_df = df.loc[df["Description of Risk/Opportunity"].str.contains("(a+)+$")]',
+    'filtered_df = df.loc[df["Description of Risk/Opportunity"].str.contains("(?<=x)y")]',
+    'filtered_df = df.loc[df["Date Raised"] >= "next week"]',
+    'filtered_df = df.loc[df["Date Raised"] > 5]',
+    'filtered_df = df.loc[df["Date Raised"] >= pd.Timestamp("someday")]',
+    'filtered_df = df.loc[df["Date Raised"] >= pd.Timestamp.today() - pd.Timedelta(months=1)]',
+    'filtered_df = df.loc[df["Date Raised"] >= pd.Timestamp.today() - pd.DateOffset(fortnights=1)]',
+    'filtered_df = df.loc[df["Status"].str.startswith("O")].nlargest(2, "No such column")',
+]
+
+
+@pytest.mark.parametrize("code", ACCEPTED)
+def test_accepted(code, register):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        rows = filter_rows(code, register)
+    assert len(rows) <= len(register)
+
+
+@pytest.mark.parametrize("code", UNSAFE)
+def test_unsafe_code_is_rejected(code):
+    with pytest.raises(FilterRejected):
+        compile_filter(code)
+
+
+@pytest.mark.parametrize("code", INVALID_FOR_REGISTER)
+def test_invalid_filters_are_rejected(code, register):
+    with pytest.raises(FilterRejected):
+        filter_rows(code, register)
+
+
+def test_matches_pandas(register):
+    code = 'filtered_df = df.loc[(df["Contract:Region"] == "North") & (df["Impact (£) - Expected"] > 100000)]'
+    expected = register.loc[(register["Contract:Region"] == "North") & (register["Impact (£) - Expected"] > 100000)]
+    assert apply_filter(code, register).index.equals(expected.index)
+
+
+def test_post_ops_match_pandas(register):
+    code = 'filtered_df = df.loc[df["Status"] == "Open"].nlargest(5, "Impact (£) - Expected")'
+    expected = register.loc[register["Status"] == "Open"].nlargest(5, "Impact (£) - Expected")
+    assert apply_filter(code, register).index.equals(expected.index)
+
+
+def test_normalized_form_ignores_formatting():
+    a = 'filtered_df = df.loc[(df["Status"] == "Open")]'
+    b = 'filtered_df = df[ df["Status"]=="Open" ]'
+    assert normalized_form(a) == normalized_form(b)
+
+
+def test_refine_intersects_previous(register):
+    previous = filter_rows('filtered_df = df.loc[df["Status"] == "Open"]', register)
+    refined = refine_rows('filtered_df = df.loc[df["Contract:Region"] == "North"]', previous)
+    both = filter_rows('filtered_df = df.loc[(df["Status"] == "Open") & (df["Contract:Region"] == "North")]', register)
+    np.testing.assert_array_equal(refined.rows, both.rows)
@@ -0,0 +1,67 @@
+# test_indexes.py
+
+import numpy as np
+import pytest
+
+from src.filter_engine import compile_filter, mask, validate
+from src.indexes import get_index
+
+# One predicate of every kind the indexes answer, on columns with and without gaps
+CONDITIONS = [
+    'df["Status"] == "Open"',
+    'df["Status"] != "Open"',
+    'df["Status"] == None',
+    'df["Status"] != None',
+    'df["Status"] == "No such status"',
+    'df["Status"] != "No such status"',
+    'df["Risk Paper"] == None',
+    'df["Risk Paper"] != None',
+    'df["Contract:Region"] == "North"',
+    'df["Contract:Region"] != "North"',
+    'df["Contract:Region"].isin(["North", "South"])',
+    'df["Contract:Region"].str.contains("th", case=False, na=False)',
+    'df["Contract:Region"].str.startswith("No")',
+    'df["Contract:Region"].str.endswith("th")',
+    'df["Risk Owner"] != "Alice"',
+    'df["Risk Type - Reputational"] == True',
+    'df["Risk Type - Reputational"] != True',
+    'df["Risk Type - Reputational"]',
+    'df["Risk Type - Financial"] != True',
+    'df["Probability - Post Mitigation - Likelihood"] >= "Medium"',
+    'df["Probability - Post Mitigation - Likelihood"] < "High"',
+    'df["Probability - Post Mitigation - Likelihood"] != "Low"',
+    'df["Date Raised"] >= "2024-01-01"',
+    'df["Date Raised"] != "2024-01-01"',
+    'df["Date Raised"] == None',
+    'df["By When"].between("2024-01-01", "2025-06-30")',
+    'df["Impact (£) - Expected"] > 100000',
+    'df["Impact (£) - Expected"] == 250000',
+    'df["Impact (£) - Expected"] != 250000',
+    'df["Impact (£) - Expected"] == None',
+    'df["Impact (£) - Expected"].between(50000, 500000)',
+    'df["Description of Risk/Opportunity"].str.contains("supply", case=False, na=False)',
+    'df["Description of Risk/Opportunity"].str.startswith("The")',
+    'df["Description of Risk/Opportunity"] != "Supplier insolvency"',
+    'df["Control Measure / Mitigation"].isna()',
+    'df["Control Measure / Mitigation"].notna()',
+    'df["Status"].isna()',
+    'df["Impact (£) - Expected"].notna()',
+]
+
+
+@pytest.mark.parametrize("frame", ["register", "register_with_gaps"])
+@pytest.mark.parametrize("condition", CONDITIONS)
+def test_index_matches_scan(condition, frame, request):
+    df = request.getfixturevalue(frame)
+    plan = compile_filter(f"filtered_df = df.loc[{condition}]")
+    validate(plan, df)
+    index = get_index(df)
+    assert index is not None
+    np.testing.assert_array_equal(mask(plan[0], df, index), mask(plan[0], df, None))
+
+
+def test_index_answers_leaves(register_with_gaps):
+    index = get_index(register_with_gaps)
+    before = index.stats["index_hits"]
+    mask(compile_filter('filtered_df = df.loc[df["Status"] != None]')[0], register_with_gaps, index)
+    assert index.stats["index_hits"] == before + 1
@@ -0,0 +1,69 @@
+# test_ingest.py
+
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import SAMPLE_REGISTER
+from src.filter_engine import compile_filter, mask
+from src.indexes import get_index
+from src.ingest import RegisterStore
+from src.register import load_register
+
+
+def _edit(path, rows: pd.DataFrame):
+    rows.to_csv(path, index=False)
+
+
+def _raw(path) -> pd.DataFrame:
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+def _changed(rows):
+    rows.loc[3, "Status"] = "Closed"
+    rows.loc[10, "Impact (£) - Expected"] = "123456"
+    return rows
+
+
+def _removed(rows):
+    return rows.drop(index=[0, 40]).reset_index(drop=True)
+
+
+def _appended(rows):
+    new = rows.iloc[[5]].assign(RiskIDNumber="R999", Status="Closed")
+    return pd.concat([rows, new], ignore_index=True)
+
+
+def _reordered(rows):
+    return rows.iloc[::-1].reset_index(drop=True)
+
+
+@pytest.mark.parametrize("edit", [_changed, _removed, _appended, _reordered])
+def test_sync_matches_a_fresh_load(edit, tmp_path):
+    path = tmp_path / "register.csv"
+    shutil.copy(SAMPLE_REGISTER, path)
+    store = RegisterStore.from_path(str(path))
+    version = store.version
+
+    _edit(path, edit(_raw(path)))
+    delta = store.sync()
+    fresh = load_register(str(path), use_cache=False)
+
+    assert delta and store.version == version + 1
+    # Categories a delta adds come after the existing ones, a parse sorts them: same dtype, other order
+    pd.testing.assert_frame_equal(store.df, fresh, check_categorical=False)
+    for code in ['filtered_df = df.loc[df["Status"] == "Closed"]',
+                 'filtered_df = df.loc[df["Impact (£) - Expected"] > 100000]']:
+        predicate = compile_filter(code)[0]
+        assert np.array_equal(mask(predicate, store.df, get_index(store.df)), mask(predicate, fresh, None))
+
+
+def test_sync_without_changes_keeps_the_version(tmp_path):
+    path = tmp_path / "register.csv"
+    shutil.copy(SAMPLE_REGISTER, path)
+    store = RegisterStore.from_path(str(path))
+    df, version = store.current()
+    assert not store.sync()
+    assert store.current() == (df, version)
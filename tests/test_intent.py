@@ -0,0 +1,79 @@
+# test_intent.py
+
+import pytest
+
+from src import intent_detector
+from src.evaluate_intent import evaluate
+from src.intent_classifier import fast_intent
+from src.intent_detector import CONFIDENCE_THRESHOLD, detect_intent
+from src.plan_cache import normalize_query
+
+# Held-out queries with the labels the LLM prompt asks for
+LABELLED = [
+    ("Show me open risks in the south", ["filter_data"]),
+    ("List all reputational risks raised in June", ["filter_data"]),
+    ("Summarise the financial risks in the north region", ["filter_data", "summarise_risks"]),
+    ("How many risks are still open?", ["filter_data", "summarise_risks"]),
+    ("What does the term provision mean?", ["other"]),
+    ("What is a control measure?", ["other"]),
+    ("Show all regulatory and law risks and explain what a regulatory risk is", ["filter_data", "other"]),
+    ("Give me an overview of the logistics risks", ["filter_data", "summarise_risks"]),
+    ("What should we focus on this quarter?", ["filter_data", "summarise_risks"]),
+    ("Which risks does Eve own?", ["filter_data", "summarise_risks"]),
+]
+
+LEFT_TO_THE_LLM = [
+    "Who is the prime minister?",
+    "How many risks are there?",
+    "What is the weather today?",
+    "Who won the world cup?",
+    "What is the capital of France?",
+    "What time is it in Tokyo?",
+]
+
+# Name a register field without filtering on it
+NOT_FILTERS = [
+    "Explain what expected impact means",
+    "What is the weather in the north?",
+    "What does FY mean in the expected impact columns?",
+]
+
+
+@pytest.mark.parametrize("query,labels", LABELLED)
+def test_confident_local_answers_are_right(query, labels):
+    local = fast_intent(normalize_query(query), CONFIDENCE_THRESHOLD)
+    assert local is None or local == labels
+
+
+@pytest.mark.parametrize("query", LEFT_TO_THE_LLM)
+def test_unsupported_guesses_go_to_the_llm(query):
+    assert fast_intent(normalize_query(query), CONFIDENCE_THRESHOLD) is None
+
+
+@pytest.mark.parametrize("query", NOT_FILTERS)
+def test_field_names_alone_are_not_filters(query):
+    local = fast_intent(normalize_query(query), CONFIDENCE_THRESHOLD)
+    assert local is None or "filter_data" not in local
+
+
+def test_llm_gets_the_query_as_typed(monkeypatch):
+    seen = []
+
+    def llm(user_input):
+        seen.append(user_input)
+        return ["other"]
+
+    monkeypatch.setattr(intent_detector, "llm_detect_intent", llm)
+    monkeypatch.setattr(intent_detector, "_memo", type(intent_detector._memo)())
+    assert detect_intent("Who is the Prime Minister?") == ["other"]
+    assert detect_intent("who is the prime minister") == ["other"]
+    assert seen == ["Who is the Prime Minister?"]
+
+
+def test_evaluation_classifies_like_detect_intent():
+    items = [{"query": q, "labels": labels, "llm_seconds": 0.0} for q, labels in LABELLED]
+    items += [{"query": q, "labels": ["other"], "llm_seconds": 0.0} for q in LEFT_TO_THE_LLM]
+    report = evaluate(items, [CONFIDENCE_THRESHOLD])["thresholds"][0]
+    answered = sum(fast_intent(normalize_query(i["query"]), CONFIDENCE_THRESHOLD) is not None for i in items)
+    assert report["llm_calls_saved"] == answered
+    assert report["local_precision"] == 1.0
@@ -0,0 +1,63 @@
+# test_main.py
+
+import asyncio
+
+from src import main
+
+
+def _scripted(monkeypatch, intent):
+    started, cancelled = asyncio.Event(), []
+
+    async def afilter_assistant(user_query, history=None, df=None):
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(user_query)
+            raise
+
+    async def adetect_intent(user_query):
+        await started.wait()
+        return intent
+
+    async def aother_assistant(user_query, summary, filter_explanation, filtered_df=None, **kwargs):
+        return "Answer."
+
+    monkeypatch.setattr(main, "PLANNER", "multi")
+    monkeypatch.setattr(main, "known_intent", lambda user_query: None)
+    monkeypatch.setattr(main, "afilter_assistant", afilter_assistant)
+    monkeypatch.setattr(main, "adetect_intent", adetect_intent)
+    monkeypatch.setattr(main, "aother_assistant", aother_assistant)
+    return cancelled
+
+
+def test_speculative_filter_is_cancelled_when_not_needed(monkeypatch, register):
+    cancelled = _scripted(monkeypatch, ["other"])
+
+    async def run():
+        result = await main.arun_query("what is a risk register?", register)
+        await asyncio.sleep(0.01)
+        return result, list(cancelled)  # before asyncio.run cancels what is left
+
+    (intent, filtered_df, explanation, summary, final_summary), cancelled = asyncio.run(run())
+    assert intent == ["other"] and filtered_df is None and final_summary == "Answer."
+    assert cancelled == ["what is a risk register?"]
+
+
+def test_speculative_filter_is_cancelled_when_the_intent_fails(monkeypatch, register):
+    cancelled = _scripted(monkeypatch, ["other"])
+
+    async def adetect_intent(user_query):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("intent service down")
+
+    monkeypatch.setattr(main, "adetect_intent", adetect_intent)
+
+    async def run():
+        try:
+            await main.arun_query("north risks", register)
+        except RuntimeError:
+            await asyncio.sleep(0.01)
+            return list(cancelled)
+
+    assert asyncio.run(run()) == ["north risks"]
@@ -0,0 +1,94 @@
+# test_payload.py
+
+import csv
+import io
+
+import pandas as pd
+import pytest
+
+from src import payload, summariser
+from src.payload import build_payload, count_tokens, frame_csv, partition, select_columns
+from src.result import RowSet
+
+RANKING = ["Probability - Post Mitigation - Score (out of 25)", "Impact (£) - Expected"]
+
+
+def _ids(text: str) -> list:
+    return [row["RiskIDNumber"] for row in csv.DictReader(io.StringIO(text))]
+
+
+@pytest.mark.parametrize("question", ["who owns the risks", "what is the expected impact of each risk"])
+def test_sampled_rows_are_the_highest_risk(question, register, monkeypatch):
+    monkeypatch.setattr(payload, "RETRIEVAL_K", 0)
+    result = build_payload(register, question, token_budget=1500)
+    assert "highest post-mitigation score" in result["sampled"]
+    shown = _ids(result["csv"])
+    expected = register.sort_values(RANKING, ascending=False, kind="stable")["RiskIDNumber"].tolist()
+    assert shown and shown == expected[:len(shown)]
+
+
+def test_rowset_and_frame_give_the_same_payload(register):
+    rows = RowSet.from_mask(register, (register["Contract:Region"] == "North").to_numpy())
+    assert build_payload(rows, "summarise these risks") == build_payload(rows.frame, "summarise these risks")
+
+
+def _bigger(register, copies=10):
+    df = pd.concat([register] * copies, ignore_index=True)
+    df["RiskIDNumber"] = [f"R{i:05d}" for i in range(len(df))]
+    return df
+
+
+def _chunks(df, question="summarise the risks", budget=1500):
+    columns = select_columns(df, question)
+    return {(label, frame_csv(frame[columns])) for label, frame in partition(df, question, budget, columns)}
+
+
+def test_partition_covers_every_row_once_within_budget(register):
+    df = _bigger(register)
+    chunks = partition(df, "summarise the risks", 1500)
+    ids = [i for _, frame in chunks for i in frame["RiskIDNumber"]]
+    assert sorted(ids) == sorted(df["RiskIDNumber"])
+    columns = select_columns(df, "summarise the risks")
+    assert all(len(frame) == 1 or count_tokens(frame_csv(frame[columns])) <= 1500 for _, frame in chunks)
+
+
+@pytest.mark.parametrize("edit", ["change", "insert", "remove"])
+def test_an_edit_only_changes_the_chunks_holding_it(edit, register):
+    df = _bigger(register)
+    before = _chunks(df)
+    if edit == "change":
+        df.loc[400, "Description of Risk/Opportunity"] = "A rewritten description of this risk"
+    elif edit == "insert":
+        df = pd.concat([df.iloc[:400], df.iloc[[7]].assign(RiskIDNumber="R99999"), df.iloc[400:]], ignore_index=True)
+    else:
+        df = df.drop(index=400).reset_index(drop=True)
+    assert len(before - _chunks(df)) <= 2 < len(before)
+
+
+def test_partition_keeps_rows_without_a_group(register):
+    df = register.copy()
+    df.loc[df.index[3], "Risk Area"] = None
+    assert "Risk Area: unknown" in [label for label, _ in partition(df, "summarise the risks")]
+
+
+def test_map_reduce_skips_the_sampled_payload(register, monkeypatch):
+    monkeypatch.setattr(payload, "RETRIEVAL_K", 0)
+    monkeypatch.setattr(payload, "DEFAULT_TOKEN_BUDGET", 400)
+    assert build_payload(register, "who owns the risks", sample=False) is None
+
+    def no_sampling(df):
+        raise AssertionError("sampled rows were built for map-reduce")
+
+    monkeypatch.setattr(payload, "_rank", no_sampling)
+    monkeypatch.setattr(summariser, "MAP_REDUCE", True)
+    monkeypatch.setattr(summariser, "_map_reduce_data", lambda question, df, explanation: {"format": "partial_summaries"})
+    assert summariser.prompt_data("who owns the risks", register)["format"] == "partial_summaries"
+
+
+@pytest.mark.parametrize("question, retrieved", [
+    ("summarise all open risks and opportunities", False),
+    ("summarise the risks caused by unpatched systems", True),
+])
+def test_retrieval_only_answers_questions_naming_a_topic(question, retrieved, register):
+    result = build_payload(_bigger(register), question, token_budget=1500, sample=False)
+    assert (result is not None and result.get("retrieved", False)) == retrieved
@@ -0,0 +1,103 @@
+# test_plan_cache.py
+
+import os
+import sys
+import json
+import hashlib
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+
+from src import filterer
+from src.filter_engine import compile_filter
+from src.plan_cache import PlanCache, parameterize
+from src.schema import REGISTER_COLUMNS, schema_hash
+
+OPEN_NORTH = 'filtered_df = df.loc[(df["Status"] == "Open") & (df["Contract:Region"] == "North")]'
+
+
+def _cache() -> PlanCache:
+    return PlanCache(namespace="test", cache_dir=None, reserved_literals=REGISTER_COLUMNS)
+
+
+def _compiles(code, values):
+    compile_filter(code)
+
+
+@pytest.fixture
+def plan_cache(monkeypatch):
+    cache = _cache()
+    monkeypatch.setattr(filterer, "_plan_cache", cache)
+    return cache
+
+
+def _response(code: str):
+    message = SimpleNamespace(content=json.dumps({"code": code, "explanation": ""}))
+    return SimpleNamespace(model="gpt-4.1", choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def test_literals_are_swapped_for_the_query_values():
+    cache = _cache()
+    cache.put("open risks in the north", {"code": OPEN_NORTH, "explanation": "Open risks in the North region."})
+    plan = cache.get("open risks in the south")
+    assert plan["code"] == OPEN_NORTH.replace('"North"', '"South"')
+    assert plan["explanation"] == "Open risks in the South region."
+
+
+def test_only_string_constants_become_slots():
+    code = 'filtered_df = df.loc[df["Status"] == "Open"]  # "north" is not a region here'
+    template = parameterize("open risks in the north", code, "", REGISTER_COLUMNS)
+    assert template["slots"] == ["title"]
+    assert '# "north"' in template["code"]
+
+    cache = _cache()
+    cache.put("open risks in the north", {"code": code, "explanation": ""})
+    assert cache.get("open risks in the south") is None
+
+
+def test_filled_code_that_does_not_compile_is_not_served():
+    cache = _cache()
+    code = 'filtered_df = df.loc[df["By When"] < pd.Timestamp("2025-07-01")]'
+    cache.put("risks due before 2025-07-01", {"code": code, "explanation": ""})
+    assert cache.get("risks due before 2026-01-31", check=_compiles)["code"] == code.replace("2025-07-01", "2026-01-31")
+    assert cache.get("risks due before tomorrow", check=_compiles) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_namespace_covers_the_system_prompt():
+    prompt_hash = hashlib.sha256(filterer._SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:16]
+    assert filterer._PLAN_NAMESPACE == f"{filterer._MODEL}:{schema_hash()}:{prompt_hash}"
+
+
+@pytest.mark.parametrize("query, code", [
+    ("all risks in the south", OPEN_NORTH),
+    ("reputational risks in the south", OPEN_NORTH),
+    ("risks raised by 2024", 'filtered_df = df.loc[df["Raised By"] == "Peggy"]'),
+])
+def test_slot_values_must_be_values_of_their_column(plan_cache, register, query, code):
+    seen = {OPEN_NORTH: "open risks in the north"}.get(code, "risks raised by Peggy")
+    plan_cache.put(seen, {"code": code, "explanation": ""})
+    assert filterer._cached(query, register) is None
+    assert filterer._cached(seen.replace("north", "south"), register) is not None
+
+
+def test_plans_that_do_not_fit_the_register_are_not_cached(plan_cache, register):
+    filterer._parse("risks in the north", _response('filtered_df = df.loc[df["Region"] == "North"]'), 1.0, df=register)
+    assert plan_cache.get("risks in the north") is None
+    filterer._parse("risks in the north", _response(OPEN_NORTH), 1.0, df=register)
+    assert plan_cache.get("risks in the north") is not None
+
+
+def test_forgotten_plans_are_not_served_again(plan_cache):
+    plan_cache.put("open risks in the north", {"code": OPEN_NORTH, "explanation": ""})
+    filterer.forget_plan("open risks in the north")
+    assert plan_cache.get("open risks in the north") is None
+    assert plan_cache.get("open risks in the south") is None
+
+
+def test_importing_the_filterer_writes_no_cache(tmp_path):
+    env = {k: v for k, v in os.environ.items() if k not in ("ROBO_PLAN_CACHE", "ROBO_CACHE_DIR")}
+    env["PYTHONPATH"] = os.getcwd()
+    subprocess.run([sys.executable, "-c", "import src.filterer"], cwd=tmp_path, env=env, check=True)
+    assert not (tmp_path / ".cache").exists()
@@ -0,0 +1,63 @@
+# test_planner.py
+
+import csv
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from src import main, other, planner
+from src.planner import answer_data
+
+NORTH = 'filtered_df = df.loc[df["Contract:Region"] == "North"]'
+
+
+def _response(plan: dict):
+    message = SimpleNamespace(content=json.dumps(plan))
+    return SimpleNamespace(model="gpt-4.1", choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def test_plans_keep_known_labels_and_columns():
+    plan = planner._parse(_response({
+        "intent": ["other", "filter_data", "sort_data"], "code": NORTH, "explanation": "North.",
+        "columns": ["Risk Owner", "Owner's shoe size"], "aggregates": ["Risk Area", "Risk Area"],
+    }))
+    assert plan == {"intent": ["filter_data", "other"], "columns": ["Risk Owner"], "aggregates": ["Risk Area"],
+                    "code": NORTH, "explanation": "North."}
+
+
+@pytest.mark.parametrize("result", [
+    {"intent": ["sort_data"]},
+    {"intent": "filter_data"},
+    {"intent": ["filter_data"], "explanation": "No code."},
+])
+def test_unusable_plans_are_rejected(result):
+    with pytest.raises(ValueError):
+        planner._parse(_response(result))
+
+
+def test_answer_data_reads_the_planned_columns(register):
+    plan = {"intent": ["filter_data", "summarise_risks"], "columns": ["Risk Owner"], "aggregates": ["Risk Area"]}
+    data = answer_data(plan, "who owns these?", register)
+    header = next(csv.reader(io.StringIO(data["csv"])))
+    assert "Risk Owner" in header and "RiskIDNumber" in header
+    assert "Impact (£) - Worst Case (Unmitigated)" not in header
+    assert "by Risk Area" in data["aggregates"]
+
+
+def test_fused_query_makes_one_plan_and_one_answer_call(monkeypatch, register):
+    plan = {"intent": ["filter_data", "other"], "columns": [], "aggregates": [], "code": NORTH, "explanation": "North."}
+    answers = []
+    monkeypatch.setattr(main, "plan_query", lambda user_query: dict(plan))
+    monkeypatch.setattr(main, "other_assistant", lambda *args, **kwargs: answers.append((args, kwargs)) or "Answer.")
+    intent, rows, explanation, summary, final_summary = main.fused_query("what do the north risks mean?", register)
+    assert intent == ["filter_data", "other"] and final_summary == "Answer." and summary == ""
+    assert rows.index.equals(register[register["Contract:Region"] == "North"].index)
+    (args, kwargs), = answers
+    assert args[3] is rows and kwargs["data"]["row_count"] == len(rows)
+
+
+@pytest.mark.parametrize("key", ["csv", "aggregates", "retrieved", "computed", "partial_summaries"])
+def test_the_final_assistant_is_told_every_data_format(key):
+    assert f"`{key}`" in other._SYSTEM_PROMPT
@@ -0,0 +1,79 @@
+# test_rate_limit.py
+
+import json
+
+import pytest
+
+from src import batch
+from src.rate_limit import ModelLimit, RateLimiter, parse_limit, parse_retry_after
+
+
+def test_buckets_wait_once_the_burst_is_spent():
+    limit = ModelLimit(rpm=60, tpm=1_000_000)  # 10 requests of burst, then one a second
+    assert all(limit.try_take(10) == 0 for _ in range(10))
+    assert limit.try_take(10) == pytest.approx(1.0, abs=0.05)
+    assert limit.stats["requests"] == 10
+
+
+def test_rate_limits_halve_the_rate_and_recover():
+    limit = ModelLimit(rpm=600, tpm=1_000_000)
+    limit.throttled(retry_after=30)
+    limit.throttled(retry_after=None)
+    assert limit.factor == 0.25 and limit.try_take(1) > 29
+    for _ in range(20):
+        limit.succeeded()
+    assert limit.factor == 1.0
+
+
+def test_dated_snapshots_share_their_models_budget():
+    limiter = RateLimiter({"gpt-4.1": (1, 1)})
+    assert limiter._limit("gpt-4.1-2025-04-14") is limiter.models["gpt-4.1"]
+    assert limiter._limit("gpt-4.1-mini-2025-04-14") is limiter.models["gpt-4.1-mini"]
+    assert limiter._limit("text-embedding-3-small") is None
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after-ms": "250"}, 0.25),
+    ({"retry-after": "2"}, 2.0),
+    ({"retry-after": "Wed, 21 Oct 2026 07:28:00 GMT"}, None),
+    ({}, None),
+])
+def test_parse_retry_after(headers, expected):
+    assert parse_retry_after(headers) == expected
+
+
+def test_parse_limit():
+    assert parse_limit("gpt-4.1 = 500:30000") == ("gpt-4.1", (500.0, 30000.0))
+    with pytest.raises(ValueError):
+        parse_limit("gpt-4.1=500")
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+def test_batches_retry_rate_limits_and_resume(monkeypatch, tmp_path):
+    attempts = {}
+
+    def run_query(item, df):
+        attempts[item["id"]] = attempts.get(item["id"], 0) + 1
+        if item["query"] == "limited" and attempts[item["id"]] == 1:
+            raise RateLimitError("slow down")
+        if item["query"] == "broken":
+            raise KeyError("Risk Area")
+        return {"id": item["id"], "query": item["query"], "status": "ok"}
+
+    monkeypatch.setattr(batch, "run_query", run_query)
+    monkeypatch.setattr(batch, "_BACKOFF_SECONDS", 0.01)
+    items = [{"id": query, "query": query} for query in ("fine", "limited", "broken")]
+    out = str(tmp_path / "results.jsonl")
+
+    counters = batch.run_batch(items, None, out, concurrency=2)
+    assert (counters["ok"], counters["errors"], counters["retries"]) == (2, 1, 1)
+    with open(out, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert sorted(r["id"] for r in records if r["status"] == "ok") == ["fine", "limited"]
+
+    counters = batch.run_batch(items, None, out)
+    assert (counters["skipped"], counters["ok"], counters["errors"]) == (2, 0, 1)
+    assert attempts == {"fine": 1, "limited": 2, "broken": 2}
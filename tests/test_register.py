@@ -0,0 +1,19 @@
+# test_register.py
+
+import shutil
+
+import pandas as pd
+
+from conftest import SAMPLE_REGISTER
+from src import register
+from src.register import load_register
+
+
+def test_cached_load_equals_a_parse(tmp_path, monkeypatch):
+    monkeypatch.setattr(register, "_CACHE_DIR", str(tmp_path / "cache"))
+    path = str(tmp_path / "register.csv")
+    shutil.copy(SAMPLE_REGISTER, path)
+    parsed = load_register(path, use_cache=False)
+    first, cached = load_register(path), load_register(path)
+    pd.testing.assert_frame_equal(first, parsed)
+    pd.testing.assert_frame_equal(cached, parsed)
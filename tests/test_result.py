@@ -0,0 +1,56 @@
+# test_result.py
+
+import numpy as np
+import pandas as pd
+
+from src.result import RowSet, as_frame
+from src.retrieval import score_rows
+
+EXPECTED = "Impact (£) - Expected"
+
+
+def _north(register) -> RowSet:
+    return RowSet.from_mask(register, (register["Contract:Region"] == "North").to_numpy())
+
+
+def test_frame_matches_boolean_indexing(register):
+    rows = _north(register)
+    pd.testing.assert_frame_equal(rows.frame, register[register["Contract:Region"] == "North"])
+    assert len(rows) == (register["Contract:Region"] == "North").sum()
+
+
+def test_the_whole_register_is_not_copied(register):
+    assert RowSet.all(register).frame is register
+
+
+def test_take_reads_only_the_asked_rows_and_columns(register):
+    rows = _north(register)
+    page = rows.take(["RiskIDNumber", EXPECTED], start=2, stop=5)
+    pd.testing.assert_frame_equal(page, rows.frame[["RiskIDNumber", EXPECTED]].iloc[2:5])
+    pd.testing.assert_frame_equal(as_frame(rows, ["RiskIDNumber"]), rows.frame[["RiskIDNumber"]])
+
+
+def test_sort_and_largest_match_pandas(register):
+    rows = _north(register)
+    expected = rows.frame.sort_values(EXPECTED, ascending=False, kind="stable")
+    assert rows.sort(EXPECTED, ascending=False).index.equals(expected.index)
+    assert rows.largest(3, EXPECTED).index.equals(rows.frame.nlargest(3, EXPECTED).index)
+    assert rows.largest(3, EXPECTED, smallest=True).index.equals(rows.frame.nsmallest(3, EXPECTED).index)
+
+
+def test_refine_keeps_result_order(register):
+    rows = _north(register).sort(EXPECTED, ascending=False)
+    refined = rows.refine((rows[EXPECTED] > rows[EXPECTED].median()).to_numpy())
+    assert refined.index.equals(rows.frame[rows.frame[EXPECTED] > rows[EXPECTED].median()].index)
+
+
+def test_reset_index_numbers_rows_from_zero(register):
+    rows = RowSet(register, _north(register).rows, reset_index=True)
+    assert rows.frame.index.equals(pd.RangeIndex(len(rows)))
+    assert rows.take(start=2, stop=4).index.tolist() == [2, 3]
+
+
+def test_rowsets_are_scored_with_the_register_vectors(register):
+    rows = _north(register)
+    np.testing.assert_allclose(score_rows(rows, ["unpatched systems"]), score_rows(rows.frame, ["unpatched systems"]),
+                               rtol=1e-5)
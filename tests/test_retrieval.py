@@ -0,0 +1,38 @@
+# test_retrieval.py
+
+import numpy as np
+
+from src.retrieval import MIN_SCORE, names_topic, search, similar_mask
+
+DESCRIPTION = "Description of Risk/Opportunity"
+
+
+def test_search_returns_the_best_rows_first(register):
+    (positions, scores), = search(register, ["unpatched systems"], k=10)
+    assert len(positions) == 10
+    assert all("unpatched systems" in text for text in register[DESCRIPTION].iloc[positions])
+    assert (np.diff(scores) <= 0).all() and (scores >= MIN_SCORE).all()
+
+
+def test_batched_search_matches_one_query_at_a_time(register):
+    queries = ["unpatched systems", "fuel shortages", "aging infrastructure"]
+    for query, (positions, scores) in zip(queries, search(register, queries, k=5)):
+        single_positions, single_scores = search(register, [query], k=5)[0]
+        np.testing.assert_array_equal(positions, single_positions)
+        np.testing.assert_allclose(scores, single_scores, rtol=1e-5)
+
+
+def test_similar_mask_matches_related_wording(register):
+    mask = similar_mask(register, DESCRIPTION, "fuel shortage")
+    assert mask[register[DESCRIPTION].str.contains("fuel shortages").to_numpy()].all()
+    assert mask.sum() < len(register)
+
+
+def test_unrelated_text_matches_nothing(register):
+    assert len(search(register, ["quaich"])[0][0]) == 0
+    assert not similar_mask(register, DESCRIPTION, "quaich").any()
+
+
+def test_questions_about_the_register_name_no_topic():
+    assert not names_topic("Summarise all open risks in the north")
+    assert names_topic("Summarise the supplier failure risks")
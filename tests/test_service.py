@@ -0,0 +1,73 @@
+# test_service.py
+
+import socket
+import threading
+import time
+
+import pytest
+import uvicorn
+
+from conftest import SAMPLE_REGISTER
+from src import service
+from src.result import RowSet
+from src.service import create_app
+from src.service_client import ServiceClient, ServiceError
+
+
+@pytest.fixture(scope="module")
+def client():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(create_app(SAMPLE_REGISTER), host="127.0.0.1", port=port, log_level="error"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    yield ServiceClient(f"http://127.0.0.1:{port}", timeout=10)
+    server.should_exit = True
+    thread.join()
+
+
+@pytest.mark.parametrize("body", [
+    {},
+    {"query": " "},
+    {"query": "open risks", "intent": "filter_data"},
+    {"query": "open risks", "intent": []},
+    {"query": "open risks", "intent": ["filter_data", "sort_data"]},
+    {"query": "open risks", "max_rows": -1},
+    {"query": "open risks", "max_rows": "10"},
+    {"query": "open risks", "max_rows": True},
+])
+def test_malformed_bodies_are_422(client, body):
+    with pytest.raises(ServiceError) as e:
+        client._call("POST", "/query", body)
+    assert e.value.status == 422
+
+
+def test_pipeline_value_errors_are_500(client, monkeypatch):
+    async def failing(query, df):
+        raise ValueError("bug in the pipeline")
+
+    monkeypatch.setattr(service, "arun_query", failing)
+    with pytest.raises(ServiceError) as e:
+        client.query("a query no other test sends")
+    assert e.value.status == 500
+
+
+def test_register_pages_cover_the_register(client, register):
+    first, total = client.register_page(0, 60)
+    second, _ = client.register_page(60, 60)
+    assert total == len(register)
+    assert list(first.index) + list(second.index) == list(register.index)
+    assert first["RiskIDNumber"].tolist() == register["RiskIDNumber"].iloc[:60].tolist()
+
+
+def test_capped_results_keep_the_number_of_matching_rows(client, monkeypatch, register):
+    async def every_row(query, df):
+        return ["filter_data"], RowSet.all(df), "All risks.", "", ""
+
+    monkeypatch.setattr(service, "arun_query", every_row)
+    _, rows, _, _, _ = client.query("every risk, capped", max_rows=5)
+    assert len(rows) == 5
+    assert rows.attrs["total_rows"] == len(register)
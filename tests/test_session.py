@@ -0,0 +1,74 @@
+# test_session.py
+
+import pytest
+
+from src import session as session_module
+from src.session import Session
+
+NORTH = {"code": 'filtered_df = df.loc[df["Contract:Region"] == "North"]', "explanation": "Risks in the North."}
+
+
+@pytest.fixture
+def calls(monkeypatch, register):
+    """
+    Scripted filter plans (by query) and a summariser that records the data it was given.
+    """
+    owner = register.loc[register["Contract:Region"] == "North", "Risk Owner"].iloc[0]
+    plans = {
+        "north risks": NORTH,
+        "only alice's": {"code": f'filtered_df = df.loc[df["Risk Owner"] == "{owner}"]',
+                         "explanation": f"Owned by {owner}.", "refine": True},
+        "south risks": {"code": 'filtered_df = df.loc[df["Contract:Region"] == "South"]',
+                        "explanation": "Risks in the South."},
+    }
+    seen = {"filter": [], "summary": [], "owner": owner}
+
+    def filter_assistant(user_query, history=None, df=None):
+        seen["filter"].append((user_query, list(history or [])))
+        return dict(plans[user_query])
+
+    def summary_assistant(user_query, rows, explanation, intent, stream=False, history=None, data=None):
+        seen["summary"].append({"data": data, "history": list(history or []), "explanation": explanation})
+        return iter(["A summary."]) if stream else "A summary."
+
+    monkeypatch.setattr(session_module, "filter_assistant", filter_assistant)
+    monkeypatch.setattr(session_module, "summary_assistant", summary_assistant)
+    return seen
+
+
+def test_a_refinement_narrows_the_previous_result(calls, register):
+    session = Session(register)
+    session.ask("north risks", ["filter_data"])
+    rows, explanation, _, _ = session.ask("only alice's", ["filter_data"])
+    expected = register[(register["Contract:Region"] == "North") & (register["Risk Owner"] == calls["owner"])]
+    assert rows.index.equals(expected.index)
+    assert explanation == f"Risks in the North. Owned by {calls['owner']}."
+    # The filter assistant saw the first request and plan
+    assert [m["content"] for m in calls["filter"][1][1]][0] == "north risks"
+
+
+def test_a_new_request_starts_over(calls, register):
+    session = Session(register)
+    session.ask("north risks", ["filter_data"])
+    rows, explanation, _, _ = session.ask("south risks", ["filter_data"])
+    assert rows.index.equals(register[register["Contract:Region"] == "South"].index)
+    assert explanation == "Risks in the South."
+
+
+def test_a_refined_summary_only_gets_the_delta(calls, register):
+    session = Session(register)
+    session.ask("north risks", ["filter_data", "summarise_risks"])
+    rows, _, summary, _ = session.ask("only alice's", ["filter_data"])
+    first, second = calls["summary"]
+    assert first["data"]["format"] == "csv" and first["history"] == []
+    assert second["data"]["format"] == "delta"
+    assert second["data"]["risk_ids"] == rows["RiskIDNumber"].tolist()
+    assert second["history"][0]["role"] == "user" and summary == "A summary."
+
+
+def test_questions_about_those_reuse_the_result(calls, register):
+    session = Session(register)
+    first, _, _, _ = session.ask("north risks", ["filter_data"])
+    rows, explanation, _, _ = session.ask("summarise those", ["summarise_risks"])
+    assert rows is first and explanation == NORTH["explanation"]
+    assert len(calls["filter"]) == 1
@@ -0,0 +1,70 @@
+# test_tracing.py
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from src import tracing
+from src.tracing import bind, recent_spans, span, summarize
+
+
+@pytest.fixture
+def traced(monkeypatch):
+    monkeypatch.setattr(tracing, "ENABLED", True)
+    monkeypatch.setattr(tracing, "TRACE_FILE", "")
+    tracing._buffer.clear()
+    yield
+    tracing._buffer.clear()
+
+
+def _usage(prompt, completion):
+    return SimpleNamespace(usage=SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion))
+
+
+def test_spans_do_nothing_while_tracing_is_off(monkeypatch):
+    monkeypatch.setattr(tracing, "ENABLED", False)
+    with span("request") as s:
+        s.set(rows=3).usage(_usage(10, 5))
+    assert s is tracing._NOOP and tracing.current() is tracing._NOOP
+
+
+def test_nested_spans_share_the_trace(traced):
+    with span("request") as root:
+        with span("summary", model="gpt-4.1-mini") as child:
+            child.usage(_usage(1000, 200))
+    summary, request = recent_spans(root.trace_id)
+    assert (summary["name"], request["name"]) == ("summary", "request")
+    assert summary["parent_id"] == root.span_id and request["parent_id"] is None
+    assert summary["cost_usd"] == pytest.approx((1000 * 0.40 + 200 * 1.60) / 1_000_000)
+    assert tracing.last_trace_id("request") == root.trace_id
+
+
+def test_errors_are_recorded_and_reraised(traced):
+    with pytest.raises(ValueError):
+        with span("filter"):
+            raise ValueError("bad plan")
+    record, = recent_spans()
+    assert record["status"] == "error" and record["error"] == "ValueError: bad plan"
+    assert summarize(recent_spans())["errors"] == 1
+
+
+def test_bound_work_nests_under_the_submitting_span(traced):
+    with span("request") as root:
+        def work():
+            with span("worker"):
+                pass
+        thread = threading.Thread(target=bind(work))
+        thread.start()
+        thread.join()
+    worker = next(s for s in recent_spans() if s["name"] == "worker")
+    assert worker["trace_id"] == root.trace_id and worker["parent_id"] == root.span_id
+
+
+def test_summaries_total_model_calls(traced):
+    for model in ("gpt-4.1", "unpriced-model"):
+        with span("call", model=model) as s:
+            s.usage(_usage(100, 10))
+    totals = summarize(recent_spans())
+    assert totals["model_calls"] == 2 and totals["prompt_tokens"] == 200 and totals["completion_tokens"] == 20
+    assert totals["cost_usd"] == round((100 * 2.00 + 10 * 8.00) / 1_000_000, 6)
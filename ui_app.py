@@ -1,8 +1,18 @@
-import time
+import os
+import itertools
 import streamlit as st
 import pandas as pd
-from src.main import process_query
 from src.intent_detector import detect_intent
+from src.filter_engine import FilterRejected
+from src.ingest import RegisterStore
+from src.register import DEFAULT_REGISTER_PATH
+from src.result import RowSet
+from src.session import Session
+from src import tracing
+from src.service_client import ServiceClient, ServiceError
+
+# With ROBO_SERVICE_URL set the app is a thin client of the HTTP service (src/service.py)
+SERVICE_URL = os.getenv("ROBO_SERVICE_URL")
 
 st.markdown("""
     <style>
@@ -47,9 +57,29 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-# load DataFrame
-df = pd.read_csv('data/Risk_Register__100_Rows.csv')
-df.index = df.index + 1
+# load DataFrame: parsed once, shared by every session; edits to the file are applied as deltas
+@st.cache_resource
+def get_register_store(path):
+    return RegisterStore.from_path(path)
+
+@st.cache_resource
+def get_service(url):
+    return ServiceClient(url)
+
+# In thin-client mode the register is fetched from the service one page at a time
+@st.cache_data(ttl=60)
+def get_register_page(url, offset, limit):
+    return get_service(url).register_page(offset, limit)
+
+if not SERVICE_URL:
+    df, _ = get_register_store(DEFAULT_REGISTER_PATH).refresh()
+    # One conversation per browser session: follow-ups refine its last result (src/session.py).
+    # A new register version starts a new conversation, as earlier results point into the old one.
+    conversation = st.session_state.get('conversation')
+    new_conversation = st.sidebar.button("New conversation")
+    if new_conversation or conversation is None or conversation.df is not df:
+        st.session_state['conversation'] = Session(df)
+        st.session_state['result'] = None
 
 # Set up app formatting
 st.set_page_config(page_title="ROBO Risk", layout="centered")
@@ -58,57 +88,151 @@ try:
 except Exception as e:
     st.warning("Logo could not be loaded.")
 
-# Utility for DataFrame display dynamic height
-def show_dataframe_with_index(df_to_show, caption=None):
-    display_df = df_to_show.copy()
-    n_rows = len(display_df)
-    ROW_HEIGHT = 38
-    HEADER_HEIGHT = 38
-    display_height = HEADER_HEIGHT + (min(n_rows, 5) * ROW_HEIGHT)
+# Paginated view of the register or a result: only the visible page is sent to the browser.
+# Sorting reorders the result's row positions (src/result.py) and is kept per view, so paging
+# and re-sorting never re-run the query; counts and £ totals are read from single columns.
+PAGE_SIZES = [25, 50, 100, 250]
+ROW_HEIGHT = 38
+HEADER_HEIGHT = 38
+TOTAL_COLUMNS = ["Impact (£) - Expected", "Impact (£) - Worst Case (Unmitigated)"]
+REGISTER_ORDER = "(register order)"
+
+
+def _view_state(source, key):
+    # Per-view cache of the sorted row sets and totals, dropped when the rows change
+    state = st.session_state.get(f"{key}_view")
+    if state is None or state["source"] is not source:
+        state = {"source": source, "sorted": {}, "totals": None}
+        st.session_state[f"{key}_view"] = state
+    return state
+
 
+def _totals(rows, state):
+    if state["totals"] is None:
+        state["totals"] = {
+            c: float(rows[c].sum()) for c in TOTAL_COLUMNS
+            if c in rows.columns and pd.api.types.is_numeric_dtype(rows.base[c])
+        }
+    return state["totals"]
+
+
+def show_dataframe_with_index(df_to_show, caption=None, key="register", total_rows=None):
+    # The register (or a result) is shared and never modified: pages are taken from it, not copies
+    rows = df_to_show if isinstance(df_to_show, RowSet) else RowSet.all(df_to_show)
+    state = _view_state(df_to_show, key)
+    n_rows = len(rows)
+
+    sort_col, order_col, size_col, page_col = st.columns([3, 2, 2, 2])
+    sort_by = sort_col.selectbox("Sort by", [REGISTER_ORDER] + list(rows.columns), key=f"{key}_sort")
+    descending = order_col.selectbox("Order", ["Ascending", "Descending"], key=f"{key}_order") == "Descending"
+    page_size = size_col.selectbox("Rows per page", PAGE_SIZES, key=f"{key}_page_size")
+    pages = max(1, -(-n_rows // page_size))
+    # A larger page size leaves fewer pages than the one shown before
+    if st.session_state.get(f"{key}_page", 1) > pages:
+        st.session_state[f"{key}_page"] = pages
+    page = page_col.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=f"{key}_page")
+
+    totals = "; ".join(f"{c}: £{v:,.0f}" for c, v in _totals(rows, state).items())
+    if sort_by != REGISTER_ORDER:
+        if (sort_by, descending) not in state["sorted"]:
+            state["sorted"][(sort_by, descending)] = rows.sort(sort_by, ascending=not descending)
+        rows = state["sorted"][(sort_by, descending)]
+
+    start = (page - 1) * page_size
+    page_df = rows.take(start=start, stop=start + page_size)
     st.dataframe(
-        display_df,
+        page_df,
         use_container_width=True,
-        height=display_height
+        height=HEADER_HEIGHT + (min(len(page_df), 10) * ROW_HEIGHT)
     )
-    st.caption(f"Rows displayed: {n_rows}")
+    shown = f"{start + 1}–{start + len(page_df)}" if len(page_df) else "0"
+    st.caption(f"Rows displayed: {shown} of {n_rows}" + (f" · {totals}" if totals else ""))
+    # `total_rows`: rows the query matched, when only the first `n_rows` were sent to the app
+    if total_rows is not None and total_rows > n_rows:
+        st.warning(f"Truncated: only the first {n_rows} of {total_rows} matching rows are shown "
+                   f"(totals cover those rows). Narrow the query to see the rest.")
     if caption:
         st.caption(caption)
 
 
-# Generator to stream out your filtered data + summaries
-def stream_results(filtered_df, filter_explanation, summary, final_summary, intent):
-    # Filtered-data section
-    if 'filter_data' in intent:
-        yield "**Filtered Data**\n\n"
-        time.sleep(0.09)
+# Thin-client view of the register: pages are requested from the service, in register order
+def show_remote_register(url, key="register"):
+    size_col, page_col = st.columns([2, 2])
+    page_size = size_col.selectbox("Rows per page", PAGE_SIZES, key=f"{key}_page_size")
+    page = st.session_state.get(f"{key}_page", 1)
+    page_df, n_rows = get_register_page(url, (page - 1) * page_size, page_size)
+    pages = max(1, -(-n_rows // page_size))
+    # A larger page size (or a shorter register) leaves fewer pages than the one asked for
+    if page > pages:
+        page = st.session_state[f"{key}_page"] = pages
+        page_df, n_rows = get_register_page(url, (page - 1) * page_size, page_size)
+    page_col.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=f"{key}_page")
 
-        if filter_explanation:
-            yield f"*Filter applied:* {filter_explanation}\n\n"
-            time.sleep(0.09)
+    start = (page - 1) * page_size
+    st.dataframe(
+        page_df,
+        use_container_width=True,
+        height=HEADER_HEIGHT + (min(len(page_df), 10) * ROW_HEIGHT)
+    )
+    shown = f"{start + 1}–{start + len(page_df)}" if len(page_df) else "0"
+    st.caption(f"Rows displayed: {shown} of {n_rows} (register order)")
 
-        if filtered_df is not None and not filtered_df.empty:
-            # Streamlit will render the DataFrame for you
-            yield filtered_df
-        else:
-            yield "There are no risks matching this criteria.\n\n"
 
-        time.sleep(0.)  # pause before next section
+# Filtered-data section: the explanation, then the paginated rows
+def show_filter_section(filtered_rows, filter_explanation, total_rows=None):
+    st.markdown("**Filtered Data**")
+    if filter_explanation:
+        st.markdown(f"*Filter applied:* {filter_explanation}")
+    if filtered_rows is not None and not filtered_rows.empty:
+        show_dataframe_with_index(filtered_rows, key="result", total_rows=total_rows)
+    else:
+        st.markdown("There are no risks matching this criteria.")
 
-    # Summary section
-    if 'other' in intent or 'summarise_risks' in intent:
-        yield "\n**Summary**\n\n"
-        time.sleep(0.05)
 
-        text = final_summary if 'other' in intent else summary
-        # Stream word-by-word
-        for w in text.split(" "):
-            yield w + " "
-            time.sleep(0.02)
+# Generator to stream out the answer as the pipeline produces it
+def stream_results(events):
+    answer_started = False
+    for kind, value in events:
+        # Summary section, token by token straight from the model
+        if kind == "token":
+            if not answer_started:
+                answer_started = True
+                yield "\n**Summary**\n\n"
+            yield value
 
+    if answer_started:
         yield "\n"
 
 
+# The filter result arrives before any answer token: render it, then stream the rest
+def render_events(events):
+    events = iter(events)
+    first = next(events, None)
+    result = {"filter": None, "answer": ""}
+    st.session_state['result'] = result
+    st.session_state['result_page'] = 1
+    if first is not None and first[0] == "filter":
+        result["filter"] = first[1]
+        show_filter_section(*first[1])
+    elif first is not None:
+        events = itertools.chain([first], events)
+    answer = st.write_stream(stream_results(events))
+    result["answer"] = answer if isinstance(answer, str) else "".join(str(part) for part in answer)
+
+
+# The service answers in one response; replay it as the events stream_query would yield
+def service_events(user_query, intent):
+    _, filtered_df, filter_explanation, summary, final_summary = get_service(SERVICE_URL).query(user_query, intent)
+    if "filter_data" in intent:
+        # The service sends at most ROBO_SERVICE_MAX_ROWS rows of the result
+        total_rows = filtered_df.attrs.get("total_rows") if filtered_df is not None else None
+        yield "filter", (filtered_df, filter_explanation, total_rows)
+    answer = final_summary if "other" in intent else summary
+    if answer:
+        yield "token", answer
+    yield "done", (filtered_df, filter_explanation, summary, final_summary)
+
+
 # Behaviour pre query submission
 if 'submitted' not in st.session_state:
     st.session_state['submitted'] = False
@@ -116,7 +240,10 @@ if 'submitted' not in st.session_state:
 # Show full risk register before first query
 if not st.session_state['submitted']:
     st.subheader("Risk Register")
-    show_dataframe_with_index(df)
+    if SERVICE_URL:
+        show_remote_register(SERVICE_URL)
+    else:
+        show_dataframe_with_index(df)
 
 # Query input
 user_query = st.text_input("Hi, I'm ROBO. \n How can help? Ask me anything about the risk register:", "")
@@ -125,34 +252,61 @@ user_query = st.text_input("Hi, I'm ROBO. \n How can help? Ask me anything about
 if st.button("Submit") and user_query.strip():
     st.session_state['submitted'] = True
 
-    # Detect intent and build action message
-    intent = detect_intent(user_query)
-    intent_map = {
-        'filter_data': 'filtering the data',
-        'summarise_risks': 'generating a data summary',
-        'other': 'generating a final answer'
-    }
-    intent_list = [desc for key, desc in intent_map.items() if key in intent]
-    action_msg = ', then '.join(intent_list) if intent_list else 'processing your request'
-    st.info(f"This query involves {action_msg}.")
-
-    # Run the query
-    with st.spinner(f"Thinking..."):
-        filtered_df, filter_explanation, summary, final_summary = process_query(
-            user_query, df, intent
-        )
+    # One trace per query (recorded only when ROBO_TRACE=1)
+    with tracing.span("request") as request_span:
+        # Detect intent and build action message
+        intent = get_service(SERVICE_URL).detect_intent(user_query) if SERVICE_URL else detect_intent(user_query)
+        intent_map = {
+            'filter_data': 'filtering the data',
+            'summarise_risks': 'generating a data summary',
+            'other': 'generating a final answer'
+        }
+        intent_list = [desc for key, desc in intent_map.items() if key in intent]
+        action_msg = ', then '.join(intent_list) if intent_list else 'processing your request'
+        st.info(f"This query involves {action_msg}.")
+
         st.markdown("---")
 
-    # Stream out the results
-    gen = stream_results(
-        filtered_df,
-        filter_explanation,
-        summary,
-        final_summary,
-        intent
-    )
-    st.write_stream(gen)
+        # Run the query, streaming out results as they arrive
+        with st.spinner(f"Thinking..."):
+            if SERVICE_URL:
+                events = service_events(user_query, intent)
+            else:
+                events = st.session_state['conversation'].stream(user_query, intent)
+            try:
+                render_events(events)
+            except TimeoutError as e:
+                # A model call ran past its deadline (src/calls.py), retries and fallback included
+                st.error(f"ROBO is taking too long to answer right now, please try again. ({e})")
+            except FilterRejected as e:
+                # The generated filter does not fit the register: nothing further to show
+                st.session_state['result'] = None
+                st.error(f"ROBO could not turn this request into a filter on the register. ({e})")
+            except ServiceError as e:
+                st.session_state['result'] = None
+                st.error(f"The ROBO service could not answer this request. ({e})")
+    st.session_state['trace_id'] = getattr(request_span, "trace_id", None)
+
+elif st.session_state.get('result') is not None:
+    # Paging or sorting reruns the script: show the last result again without re-running the query
+    result = st.session_state['result']
+    st.markdown("---")
+    if result["filter"] is not None:
+        show_filter_section(*result["filter"])
+    if result["answer"]:
+        st.markdown(result["answer"])
 
 else:
     if not st.session_state['submitted']:
         st.info("Enter your query and press Submit to see results.")
+
+
+# Debug panel: timings, tokens and cost of this session's last query
+if tracing.ENABLED and st.session_state.get('trace_id') and st.sidebar.checkbox("Show query trace"):
+    spans = tracing.recent_spans(st.session_state['trace_id'])
+    st.sidebar.json(tracing.summarize(spans))
+    if spans:
+        columns = ["name", "duration_ms", "status", "model", "prompt_tokens", "completion_tokens", "cost_usd",
+                   "payload_bytes", "plan_cache", "intent_source", "rows_in", "rows_out", "error"]
+        trace_df = pd.DataFrame(spans)
+        st.sidebar.dataframe(trace_df[[c for c in columns if c in trace_df.columns]], hide_index=True)